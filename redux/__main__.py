@@ -1,23 +1,222 @@
-from redux.codegenerator import compile_script
+from redux.codegenerator import annotate_script, generate_code, OPTIMIZATIONS
+from redux.callgraph import (format_report as format_call_graph_report,
+                             EXPANSION_BUDGET, ExpansionBudgetError,
+                             RecursiveCallError)
+from redux.costmodel import CostModel, estimate_cost
+from redux.achronalfields import format_report as format_af_report
+from redux.calleval import format_report as format_eval_report
+from redux.conditionorder import format_report as format_where_report
+from redux.constprop import format_report as format_constant_report
+from redux.copyprop import format_report as format_copy_report
+from redux.decisiontree import format_report as format_tree_report
+from redux.localpacking import format_report as format_packing_report
+from redux.passstats import PassStats
+from redux.profile import (format_report as format_profile_report,
+                           DEFAULT_COUNTER_BASE, Profile)
+from redux.requireinliner import (LibraryCache, RequireCycleError,
+                                  RequireSyntaxError, TopLevelCodeError)
+from redux.unrolling import format_report as format_unroll_report, UNROLL_LIMIT
 from argparse import ArgumentParser
 from os.path import splitext
+import json
+import sys
 
-parser = ArgumentParser(description='Compile a Redux script to Rescript.')
-parser.add_argument('input_filename', metavar='FILE',
-                    help='script to be compiled to Rescript')
-parser.add_argument('output_filename', metavar='FILE',
-                    help='script to be compiled to Rescript')
 
-args = parser.parse_args()
+def compile_main(argv):
+    parser = ArgumentParser(description='Compile a Redux script to Rescript. '
+                                        'Use "build" as the first argument '
+                                        'to compile a whole directory tree, '
+                                        'or "serve" to start a compile '
+                                        'server.')
+    parser.add_argument('input_filename', metavar='FILE',
+                        help='script to be compiled to Rescript')
+    parser.add_argument('output_filename', metavar='FILE',
+                        help='script to be compiled to Rescript')
+    parser.add_argument('--cost-report', nargs='?', const='text',
+                        choices=['text', 'json'],
+                        help='print an estimate of the execution cost of the '
+                             'generated code')
+    parser.add_argument('--cost-config', metavar='FILE',
+                        help='JSON file overriding operation and intrinsic '
+                             'costs')
+    parser.add_argument('--max-cost', metavar='N', type=int,
+                        help='fail if the estimated total cost exceeds N')
+    parser.add_argument('--precompile', action='store_true',
+                        help='keep parsed required files in .reduxc files '
+                             'next to their sources')
+    parser.add_argument('--precompile-dir', metavar='DIR',
+                        help='keep .reduxc files in DIR instead')
+    parser.add_argument('-O', '--optimize', action='append', default=[],
+                        choices=OPTIMIZATIONS, metavar='NAME',
+                        help='enable an optional optimization: %s' %
+                             ', '.join(OPTIMIZATIONS))
+    parser.add_argument('--unroll-limit', type=int, default=UNROLL_LIMIT,
+                        metavar='NODES',
+                        help='largest size in AST nodes a loop may grow to '
+                             'when unrolled by -O unroll-loops (default %d)' %
+                             UNROLL_LIMIT)
+    parser.add_argument('--instrument', metavar='MAP',
+                        help='count how often each if/elif arm is taken and '
+                             'each query condition holds in achronal '
+                             'fields, and describe the counters in MAP')
+    parser.add_argument('--counter-base', type=int,
+                        default=DEFAULT_COUNTER_BASE, metavar='FIELD',
+                        help='first achronal field used by --instrument '
+                             '(default %d)' % DEFAULT_COUNTER_BASE)
+    parser.add_argument('--profile-use', metavar='FILE',
+                        help='order if/elif chains and query conditions by '
+                             'the counts in FILE, the MAP of an instrumented '
+                             'build with a "counts" object added')
+    parser.add_argument('--expansion-budget', type=int,
+                        default=EXPANSION_BUDGET, metavar='NODES',
+                        help='fail if inlining calls would grow the script '
+                             'past NODES AST nodes, 0 for no limit '
+                             '(default %d)' % EXPANSION_BUDGET)
+    parser.add_argument('--expansion-report', nargs='?', const='text',
+                        choices=['text', 'json'],
+                        help='print the size of the script and of every '
+                             'function once calls are inlined')
+    parser.add_argument('--opt-report', nargs='?', const='text',
+                        choices=['text', 'json'],
+                        help='print what the enabled optimizations did')
+    parser.add_argument('--time-passes', nargs='?', const='text',
+                        choices=['text', 'json'],
+                        help='print the wall and CPU time and AST node counts '
+                             'of each compilation stage')
+    parser.add_argument('--mem-stats', action='store_true',
+                        help='also measure the peak memory of each stage '
+                             '(slows compilation down)')
+    parser.add_argument('--profile-dir', metavar='DIR',
+                        help='dump cProfile statistics of each stage into DIR')
 
-filename = args.input_filename
-assert filename, "no input file given"
+    args = parser.parse_args(argv)
 
-with open(filename, "rt") as file_:
-    input_code = file_.read()
+    filename = args.input_filename
+    assert filename, "no input file given"
 
-output_code = compile_script(filename, input_code)
+    with open(filename, "rt") as file_:
+        input_code = file_.read()
 
-base_filename, extension = splitext(filename)
-with open(args.output_filename, "wt") as file_:
-    file_.write(output_code)
+    library_cache = LibraryCache(
+        args.precompile or args.precompile_dir is not None,
+        args.precompile_dir)
+    stats = None
+    if args.time_passes or args.mem_stats or args.profile_dir:
+        stats = PassStats(args.mem_stats, args.profile_dir, filename)
+    profile = None
+    if args.profile_use:
+        try:
+            with open(args.profile_use, "rt") as file_:
+                profile = Profile.from_json(json.load(file_))
+        except (IOError, ValueError) as e:
+            sys.stderr.write("%s: %s\n" % (args.profile_use, e))
+            return 1
+    counter_base = args.counter_base if args.instrument else None
+
+    call_graph_reports = {}
+    try:
+        ast_ = annotate_script(filename, input_code, library_cache,
+                               stats=stats, reports=call_graph_reports,
+                               expansion_budget=args.expansion_budget or None,
+                               counter_base=counter_base, profile=profile)
+    except (RecursiveCallError, ExpansionBudgetError, RequireCycleError,
+            RequireSyntaxError, TopLevelCodeError) as e:
+        sys.stderr.write("%s: %s\n" % (filename, e))
+        return 1
+
+    if args.instrument:
+        with open(args.instrument, "wt") as file_:
+            json.dump(call_graph_reports["instrument"], file_, indent=2,
+                      sort_keys=True)
+            file_.write("\n")
+
+    if args.expansion_report == 'json':
+        json.dump(call_graph_reports["call-graph"], sys.stdout, indent=2,
+                  sort_keys=True)
+        sys.stdout.write("\n")
+    elif args.expansion_report == 'text':
+        sys.stdout.write(format_call_graph_report(
+            call_graph_reports["call-graph"]))
+
+    cost_report = None
+    if args.cost_report or args.max_cost is not None:
+        cost_model = CostModel()
+        if args.cost_config:
+            with open(args.cost_config, "rt") as file_:
+                cost_model = CostModel.from_json(json.load(file_))
+        cost_report = estimate_cost(filename, ast_, cost_model)
+
+        if args.cost_report == 'json':
+            json.dump(cost_report.to_json(), sys.stdout, indent=2,
+                      sort_keys=True)
+            sys.stdout.write("\n")
+        elif args.cost_report == 'text':
+            sys.stdout.write(cost_report.format())
+
+    # Checked before writing, so that the last good output is kept.
+    if args.max_cost is not None:
+        total_cost = cost_report.total.total(cost_report.model)
+        if total_cost > args.max_cost:
+            sys.stderr.write("%s: estimated cost %d exceeds limit %d\n" %
+                             (filename, total_cost, args.max_cost))
+            return 1
+
+    reports = {}
+    if "profile-use" in call_graph_reports:
+        reports["profile-use"] = call_graph_reports["profile-use"]
+    output_code = generate_code(ast_, stats, args.optimize, reports,
+                                args.unroll_limit, profile)
+
+    base_filename, extension = splitext(filename)
+    with open(args.output_filename, "wt") as file_:
+        file_.write(output_code)
+
+    if args.opt_report == 'json':
+        json.dump(reports, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    elif args.opt_report == 'text':
+        if "profile-use" in reports:
+            sys.stdout.write("profile-use: " +
+                             format_profile_report(reports["profile-use"]))
+        if "eval-calls" in reports:
+            sys.stdout.write("eval-calls: " +
+                             format_eval_report(reports["eval-calls"]))
+        if "const-prop" in reports:
+            sys.stdout.write("const-prop: " +
+                             format_constant_report(reports["const-prop"]))
+        if "unroll-loops" in reports:
+            sys.stdout.write("unroll-loops: " +
+                             format_unroll_report(reports["unroll-loops"]))
+        if "decision-trees" in reports:
+            sys.stdout.write("decision-trees: " +
+                             format_tree_report(reports["decision-trees"]))
+        if "reorder-where" in reports:
+            sys.stdout.write("reorder-where: " +
+                             format_where_report(reports["reorder-where"]))
+        if "af-cache" in reports:
+            sys.stdout.write("af-cache: " +
+                             format_af_report(reports["af-cache"]))
+        if "copy-prop" in reports:
+            sys.stdout.write("copy-prop: " +
+                             format_copy_report(reports["copy-prop"]))
+        if "pack-locals" in reports:
+            sys.stdout.write("pack-locals: " +
+                             format_packing_report(reports["pack-locals"]))
+
+    if stats is not None and args.time_passes == 'json':
+        json.dump(stats.to_json(), sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    elif stats is not None and (args.time_passes or args.mem_stats):
+        sys.stdout.write(stats.format())
+
+    return 0
+
+
+if sys.argv[1:2] == ["build"]:
+    from redux.build import main
+    sys.exit(main(sys.argv[2:]))
+elif sys.argv[1:2] == ["serve"]:
+    from redux.server import main
+    sys.exit(main(sys.argv[2:]))
+else:
+    sys.exit(compile_main(sys.argv[1:]))
@@ -0,0 +1,261 @@
+"""Achronal field read caching and dead achronal field write elimination.
+
+Runs on the lowered AST, where every AF[n] read has become a block
+performing GET_ACHRONAL_FIELD into a __retval temporary and every AF[n] = v
+a block performing SET_ACHRONAL_FIELD. Both PERFORMs are expensive, so with
+constant slot numbers:
+
+- a read of a slot that was already read, with no write to it, code
+  literal or control flow merge in between, copies the temporary of the
+  earlier read instead of performing again;
+- a write to a slot that is written again before any read of it, code
+  literal, break or use of target (which writes set) is dropped.
+
+Reads are only cached if the script never looks at perf_ret itself, as it
+would see the result of a different PERFORM once reads are skipped.
+"""
+from collections import OrderedDict
+from redux.ast import (Assignment, Block, CodeLiteral, IfStmt, WhileStmt,
+                       ForStmt, VarRef)
+from redux.intrinsics import GET_ACHRONAL_FIELD_CODE, SET_ACHRONAL_FIELD_CODE
+from redux.loops import int_constant_value
+from redux.visitor import ASTTransformer, ASTVisitor
+
+
+# Stands for every slot where a slot number is not constant.
+ALL_SLOTS = None
+
+
+def field_access(stmt):
+    """Recognizes an inlined achronal field access.
+
+    Returns ("read", slot, temporary name) or ("write", slot, value
+    expression), with slot None if it is not constant, or None if stmt is
+    something else.
+    """
+    if type(stmt) is not Block:
+        return None
+    statements = stmt.statements
+    if (len(statements) == 3 and isinstance(statements[1], CodeLiteral) and
+        type(statements[0]) is Assignment and statements[0].declare is True and
+        statements[0].variable.name == "num"):
+        slot = int_constant_value(statements[0].expression)
+        code = statements[1].code
+        result = statements[2]
+        if (code == GET_ACHRONAL_FIELD_CODE and type(result) is Assignment and
+            isinstance(result.expression, VarRef) and
+            result.expression.name == "perf_ret"):
+            return ("read", slot, result.variable.name)
+    if (len(statements) == 3 and isinstance(statements[2], CodeLiteral) and
+        statements[2].code == SET_ACHRONAL_FIELD_CODE and
+        type(statements[0]) is Assignment and
+        statements[0].variable.name == "num" and
+        type(statements[1]) is Assignment and
+        statements[1].variable.name == "value"):
+        slot = int_constant_value(statements[0].expression)
+        return ("write", slot, statements[1].expression)
+    return None
+
+
+class FieldUses(ASTVisitor):
+    """Summarizes what a statement does to achronal fields.
+
+    reads and writes are the sets of slots accessed, or ALL_SLOTS. opaque is
+    set by code literals other than field accesses, breaks by break
+    statements leaving the statement (not those of loops inside it). names
+    are all variables used, assigned those assigned to.
+    """
+    def __init__(self):
+        super(FieldUses, self).__init__()
+        self.reads = set()
+        self.writes = set()
+        self.opaque = False
+        self.breaks = False
+        self.names = set()
+        self.assigned = set()
+        self.loop_depth = 0
+
+    def add(self, slots, slot):
+        if slots is ALL_SLOTS or slot is None:
+            return ALL_SLOTS
+        slots.add(slot)
+        return slots
+
+    def visit_Block(self, block):
+        access = field_access(block)
+        if access is None:
+            self.generic_visit(block)
+        elif access[0] == "read":
+            self.reads = self.add(self.reads, access[1])
+        else:
+            self.writes = self.add(self.writes, access[1])
+            self.visit(access[2])
+
+    def visit_CodeLiteral(self, code_literal):
+        self.opaque = True
+        if "perf_ret" in code_literal.code:
+            self.names.add("perf_ret")
+
+    def visit_BreakStmt(self, break_stmt):
+        if self.loop_depth == 0:
+            self.breaks = True
+
+    def visit_VarRef(self, var_ref):
+        self.names.add(var_ref.name)
+
+    def visit_Assignment(self, assignment):
+        self.names.add(assignment.variable.name)
+        self.assigned.add(assignment.variable.name)
+        self.visit(assignment.expression)
+
+    def visit_BitfieldAssignment(self, assignment):
+        self.generic_visit(assignment)
+
+    def visit_WhileStmt(self, while_stmt):
+        self.loop_depth += 1
+        self.generic_visit(while_stmt)
+        self.loop_depth -= 1
+
+    def visit_ForStmt(self, for_stmt):
+        self.loop_depth += 1
+        self.generic_visit(for_stmt)
+        self.loop_depth -= 1
+
+
+def field_uses(node):
+    uses = FieldUses()
+    uses.visit(node)
+    return uses
+
+
+class State(object):
+    """What is known at a point of the script.
+
+    cache maps slots to the temporary holding their value and the block
+    depth it was declared at; pending maps slots to the last write to them
+    and the statement list it is in. That write is dead if the slot is
+    written again before anything reads it.
+    """
+    def __init__(self, cache=None):
+        super(State, self).__init__()
+        self.cache = dict(cache or {})
+        self.pending = {}
+
+    def forget(self, slots):
+        if slots is ALL_SLOTS:
+            self.cache.clear()
+        else:
+            for slot in slots:
+                self.cache.pop(slot, None)
+
+    def keep_pending(self, slots):
+        if slots is ALL_SLOTS:
+            self.pending.clear()
+        else:
+            for slot in slots:
+                self.pending.pop(slot, None)
+
+    def merge(self, *states):
+        """Keeps the cached reads still valid in all of states."""
+        for slot, entry in list(self.cache.items()):
+            if any(state.cache.get(slot) != entry for state in states):
+                del self.cache[slot]
+
+
+class AchronalFieldOptimizer(ASTTransformer):
+    """Caches achronal field reads and drops dead writes of a lowered script."""
+    def __init__(self):
+        super(AchronalFieldOptimizer, self).__init__()
+        self.cache_reads = True
+        # (statement list, statement) of every dead write.
+        self.dead = []
+        self.cached_reads = 0
+
+    def visit_Block(self, block):
+        uses = field_uses(block)
+        self.cache_reads = "perf_ret" not in uses.names
+        self.optimize(block.statements, State(), 0)
+
+        for statements, dead_stmt in self.dead:
+            statements[:] = [stmt for stmt in statements
+                             if stmt is not dead_stmt]
+        return block
+
+    @property
+    def removed_writes(self):
+        return len(self.dead)
+
+    def optimize(self, statements, state, depth):
+        statements[:] = [self.optimize_statement(stmt, statements, state,
+                                                 depth)
+                         for stmt in statements]
+
+        for slot, (name, declared_depth) in list(state.cache.items()):
+            if declared_depth >= depth:
+                del state.cache[slot]
+
+    def optimize_statement(self, stmt, statements, state, depth):
+        access = field_access(stmt)
+        if access is not None and access[0] == "read":
+            _, slot, name = access
+            state.keep_pending([slot] if slot is not None else ALL_SLOTS)
+            if slot is None:
+                return stmt
+            if self.cache_reads and slot in state.cache:
+                self.cached_reads += 1
+                source = VarRef(state.cache[slot][0])
+                source.type = stmt.statements[2].variable.type
+                return Assignment(stmt.statements[2].variable, source)
+            state.cache[slot] = (name, depth)
+            return stmt
+
+        uses = field_uses(stmt)
+        if uses.opaque and access is None:
+            state.cache.clear()
+            state.pending.clear()
+        if uses.breaks or "target" in uses.names:
+            state.pending.clear()
+        state.keep_pending(uses.reads)
+        for slot, (name, _) in list(state.cache.items()):
+            if name in uses.assigned and access is None:
+                del state.cache[slot]
+
+        if access is not None:
+            _, slot, _ = access
+            if slot is None:
+                state.cache.clear()
+                return stmt
+            state.cache.pop(slot, None)
+            if slot in state.pending:
+                self.dead.append(state.pending[slot])
+            state.pending[slot] = (statements, stmt)
+        elif type(stmt) is Block:
+            self.optimize(stmt.statements, state, depth + 1)
+        elif isinstance(stmt, IfStmt):
+            branches = [stmt.then_block]
+            if stmt.else_part is not None:
+                branches.append(stmt.else_part)
+            # Writes in a branch are not known to happen, so they neither
+            # kill earlier writes nor get killed by later ones.
+            states = []
+            for branch in branches:
+                branch_state = State(state.cache)
+                self.optimize(branch.statements, branch_state, depth + 1)
+                states.append(branch_state)
+            state.merge(*states)
+        elif isinstance(stmt, (WhileStmt, ForStmt)):
+            # Anything written in the loop may have been written by an earlier
+            # iteration, and writes in it are not known to happen.
+            state.forget(uses.writes)
+            body_state = State(state.cache)
+            self.optimize(stmt.block.statements, body_state, depth + 1)
+        return stmt
+
+    def report(self):
+        return OrderedDict([("cached_reads", self.cached_reads),
+                            ("removed_writes", self.removed_writes)])
+
+
+def format_report(report):
+    return "%d read(s) cached, %d dead write(s) removed\n" % (
+        report["cached_reads"], report["removed_writes"])
@@ -1,42 +1,41 @@
 from redux.visitor import ASTTransformer
 from redux.names import get_initial_names
+from redux.symtab import Scope
 
 class AssignmentScopeAnalyzer(ASTTransformer):
-    def __init__(self):
+    def __init__(self, initial_names=None):
         super(AssignmentScopeAnalyzer, self).__init__()
-        self.names = [set(get_initial_names())]
+        if initial_names is None:
+            initial_names = get_initial_names()
+        self.scope = Scope(bindings=dict.fromkeys(initial_names, True))
 
     def push_scope(self):
-        self.names.append(set())
+        self.scope = self.scope.child()
 
     def pop_scope(self):
-        self.names.pop()
+        self.scope = self.scope.parent
 
     def is_name_used(self, name):
-        for scope in self.names:
-            if name in scope:
-                return True
-
-        return False
+        return name in self.scope
 
     def visit_BitfieldAssignment(self, bitfield_assignment):
         return bitfield_assignment
 
     def visit_EnumDefinition(self, enum_definition):
-        self.names[-1].add(enum_definition.name)
+        self.scope.define(enum_definition.name, True)
 
         for name, value in enum_definition.members:
-            self.names[-1].add(name)
+            self.scope.define(name, True)
 
         return enum_definition
 
     def visit_BitfieldDefinition(self, bitfield_definition):
-        self.names[-1].add(bitfield_definition.name)
+        self.scope.define(bitfield_definition.name, True)
 
         return bitfield_definition
 
     def visit_FunctionDefinition(self, function_def):
-        self.names[-1].add(function_def.name)
+        self.scope.define(function_def.name, True)
 
         return self.generic_visit(function_def)
 
@@ -45,6 +44,6 @@ class AssignmentScopeAnalyzer(ASTTransformer):
             assignment.declare = not self.is_name_used(assignment.variable.name)
 
         if assignment.declare is True:
-            self.names[-1].add(assignment.variable.name)
+            self.scope.define(assignment.variable.name, True)
 
         return assignment
@@ -51,6 +51,18 @@ class Block(Stmt):
     _fields = ["statements"]
 
 
+class LazyBlock(Block):
+    """Body of a function of a required file that is not parsed yet.
+
+    Holds the source of the whole definition and the line it starts at;
+    statements stays empty until the body is parsed and replaces it.
+    """
+    _fields = ["statements", "code", "lineno", "path"]
+
+    def __init__(self, code, lineno, path):
+        super(LazyBlock, self).__init__([], code, lineno, path)
+
+
 class Require(Stmt):
     _fields = ["path"]
 
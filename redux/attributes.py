@@ -0,0 +1,155 @@
+"""Synthesized attributes of type-annotated AST nodes.
+
+Several passes need to know something about a whole subtree: whether it
+calls a function that gets inlined, whether it contains a query, whether
+evaluating it may have an effect or fail, and what it costs. Rather than
+each starting its own traversal, AttributeSynthesizer computes all of them
+in one bottom-up pass and caches them on the nodes as `node.attributes`.
+
+The pass runs right after type annotation. Passes that rewrite the tree
+leave the attributes of the nodes they keep as they were, so a pass relying
+on exact values, such as the cost of an expression, synthesizes them again
+with refresh set first; nodes created since are synthesized on first use by
+attributes().
+"""
+from redux.ast import (Assignment, BitfieldAssignment, BitfieldDefinition,
+                       BreakStmt, CodeLiteral, DivOp, FunctionCall,
+                       FunctionDefinition, ModuloOp, Query)
+from redux.costmodel import Cost, CostEstimator, CostModel
+from redux.intrinsics import IntrinsicFunction
+
+
+class Attributes(object):
+    """What a subtree does, as far as later passes are concerned."""
+    def __init__(self, nontrivial_call=False, query=False,
+                 bestmove_query=False, pure=True, total=True, cost=None):
+        super(Attributes, self).__init__()
+        # Calls a function that CallInliner inlines.
+        self.nontrivial_call = nontrivial_call
+        # Contains a query, or a QUERY BESTMOVE.
+        self.query = query
+        self.bestmove_query = bestmove_query
+        # Has no effect besides computing its value...
+        self.pure = pure
+        # ...and always computes it, e.g. does not divide.
+        self.total = total
+        self.cost = cost if cost is not None else Cost()
+
+    @property
+    def movable(self):
+        """Whether the subtree may be evaluated in a different place or
+        order, or not at all."""
+        return self.pure and self.total
+
+    def key(self):
+        return (self.nontrivial_call, self.query, self.bestmove_query,
+                self.pure, self.total, dict(self.cost.counts),
+                self.cost.unbounded, self.cost.loop_depth)
+
+    def __eq__(self, other):
+        # Keeps ASTNode.__eq__, which compares __dict__, meaningful.
+        return isinstance(other, Attributes) and self.key() == other.key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Attributes(%s)" % ", ".join(
+            name for name in ["nontrivial_call", "query", "bestmove_query",
+                              "pure", "total"] if getattr(self, name))
+
+
+class AttributeSynthesizer(CostEstimator):
+    """Computes the attributes of every node of a type-annotated AST.
+
+    Nodes that already have attributes are not visited again unless refresh
+    is set. Calls of user functions take the attributes of the typed copy of
+    the function body they are annotated with.
+    """
+    def __init__(self, model=None, refresh=False):
+        if model is None:
+            model = CostModel()
+        super(AttributeSynthesizer, self).__init__(model)
+        self.refresh = refresh
+        self.synthesized = set()
+
+    def visit(self, node):
+        cached = getattr(node, "attributes", None)
+        if cached is not None and (not self.refresh or
+                                   id(node) in self.synthesized):
+            return cached.cost
+        # Dispatches like Visitor.visit, without adding a stack frame per
+        # level of the tree.
+        for cls in type(node).__mro__:
+            visitor = getattr(self, "visit_" + cls.__name__, None)
+            if visitor is not None:
+                break
+        else:
+            visitor = self.generic_visit
+        cost = visitor(node)
+        node.attributes = self.synthesize(node, cost)
+        self.synthesized.add(id(node))
+        return cost
+
+    def attributes(self, node):
+        self.visit(node)
+        return node.attributes
+
+    def synthesize(self, node, cost):
+        if isinstance(node, FunctionDefinition):
+            # Only the typed copies made for each call site are evaluated.
+            return Attributes(cost=cost)
+
+        children = [self.attributes(child) for child in node.children()]
+        result = Attributes(
+            nontrivial_call=any(child.nontrivial_call for child in children),
+            query=any(child.query for child in children),
+            bestmove_query=any(child.bestmove_query for child in children),
+            pure=all(child.pure for child in children),
+            total=all(child.total for child in children),
+            cost=cost)
+
+        if isinstance(node, Query):
+            result.query = True
+            if node.query_type == "BESTMOVE":
+                result.bestmove_query = True
+        elif isinstance(node, FunctionCall):
+            self.synthesize_call(node, result)
+        elif isinstance(node, (Assignment, BitfieldAssignment, BreakStmt)):
+            result.pure = False
+        elif isinstance(node, CodeLiteral):
+            result.pure = result.total = False
+        elif isinstance(node, (DivOp, ModuloOp)):
+            result.total = False
+        return result
+
+    def synthesize_call(self, func_call, result):
+        func_def = func_call.func_def
+        if isinstance(func_def, IntrinsicFunction):
+            result.pure = result.pure and func_def.pure
+            result.total = result.total and func_def.total
+        elif isinstance(func_def, BitfieldDefinition):
+            pass
+        else:
+            body = self.attributes(func_def.block)
+            result.nontrivial_call = (result.nontrivial_call or
+                                      func_def.nontrivial is True)
+            result.query = result.query or body.query
+            result.bestmove_query = result.bestmove_query or body.bestmove_query
+            # The body runs with its own statements and returns early, which
+            # later passes do not look into.
+            result.pure = result.total = False
+
+
+def synthesize_attributes(node, model=None, refresh=False):
+    """Synthesizes the attributes of node and its whole subtree."""
+    AttributeSynthesizer(model, refresh).visit(node)
+    return node
+
+
+def attributes(node):
+    """Returns the attributes of node, synthesizing them if needed."""
+    cached = getattr(node, "attributes", None)
+    if cached is None:
+        cached = AttributeSynthesizer().attributes(node)
+    return cached
@@ -0,0 +1,4 @@
+"""Benchmarks of the compiler on generated programs.
+
+Run "python -m redux.bench --help" for usage.
+"""
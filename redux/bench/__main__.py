@@ -0,0 +1,63 @@
+from argparse import ArgumentParser
+from redux.bench.generator import WORKLOADS
+from redux.bench.runner import (run, compare, format_results, load_results,
+                                save_results)
+import json
+import sys
+
+
+def main(argv):
+    parser = ArgumentParser(prog='python -m redux.bench',
+                            description='Time the phases of the compiler on '
+                                        'generated programs.')
+    parser.add_argument('-w', '--workload', action='append',
+                        choices=[name for name, _ in WORKLOADS],
+                        help='workload to run (default: all of them)')
+    parser.add_argument('--scale', type=int, default=1,
+                        help='size of the generated programs '
+                             '(default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed of the generator '
+                             '(default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='compile each program this many times and keep '
+                             'the best times (default: %(default)s)')
+    parser.add_argument('--baseline', metavar='FILE',
+                        help='results of an earlier run to compare against; '
+                             'fail if a stage got slower')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative slowdown tolerated before reporting '
+                             'a regression (default: %(default)s)')
+    parser.add_argument('--save', metavar='FILE',
+                        help='write the results to FILE as JSON')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results as JSON')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        baseline = load_results(args.baseline)
+
+    results = run(args.workload, args.scale, args.seed, args.repeat)
+
+    if args.save:
+        save_results(results, args.save)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        sys.stdout.write(format_results(results, baseline))
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, stage, old_seconds, seconds in regressions:
+            sys.stderr.write("%s: %s regressed from %.2f ms to %.2f ms\n" % (
+                name, stage, old_seconds * 1000, seconds * 1000))
+        if regressions:
+            return 1
+
+    return 0
+
+
+sys.exit(main(sys.argv[1:]))
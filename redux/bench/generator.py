@@ -0,0 +1,211 @@
+"""Seeded generator of synthetic Redux programs for benchmarking the compiler.
+
+Every workload takes a scale factor and produces a Program: the main script
+plus the libraries it requires. The same seed always yields the same
+programs, so timings can be compared between runs.
+"""
+from collections import namedtuple
+from os import makedirs
+from os.path import join, dirname
+import random
+
+
+Program = namedtuple("Program", ("name", "code", "libraries"))
+
+UNIT_FIELDS = ["HP", "Timestamp", "Energy", "Speed", "Experience"]
+VALUE_OPS = ["MIN", "MAX", "SUM", "AVE"]
+
+
+class ProgramGenerator(object):
+    """Generates Redux source code from a seeded random number generator.
+
+    Libraries are required by absolute path, so directory must be where the
+    programs will be written to before compiling them.
+    """
+    def __init__(self, seed=0, directory="."):
+        super(ProgramGenerator, self).__init__()
+        self.random = random.Random(seed)
+        self.directory = directory
+
+    def constant(self):
+        return str(self.random.randint(0, 1000))
+
+    def comparison(self, variable):
+        return "%s %s %s" % (variable, self.random.choice(["<", ">", "==",
+                                                           "!=", "<=", ">="]),
+                             self.constant())
+
+    def if_chain(self, name, length):
+        """A function made of an if/elif chain with length branches."""
+        lines = ["def %s(x)" % name, "    r = 0"]
+        for index in range(length):
+            keyword = "if" if index == 0 else "elif"
+            lines.append("    %s x == %d" % (keyword, index))
+            lines.append("        r = x * %s + %s" % (self.constant(),
+                                                      self.constant()))
+        lines.append("    else")
+        lines.append("        r = -1")
+        lines.append("    end")
+        lines.append("    return r")
+        lines.append("end")
+        return "\n".join(lines) + "\n"
+
+    def call_tree(self, prefix, count, depth):
+        """count small functions, each calling up to two of the next level."""
+        lines = []
+        levels = [["%s_%d_%d" % (prefix, level, index) for index in range(count)]
+                  for level in range(depth)]
+        for level, names in reversed(list(enumerate(levels))):
+            for name in names:
+                lines.append("def %s(a, b)" % name)
+                lines.append("    c = a * %s + b" % self.constant())
+                if level + 1 < depth:
+                    callees = self.random.sample(levels[level + 1],
+                                                 min(2, count))
+                    for callee in callees:
+                        lines.append("    c = c + %s(c, a)" % callee)
+                lines.append("    if %s" % self.comparison("c"))
+                lines.append("        c = c - b")
+                lines.append("    end")
+                lines.append("    return c")
+                lines.append("end")
+        return "\n".join(lines) + "\n", levels[0]
+
+    def enum(self, name, members):
+        parts = ["enum %s" % name]
+        value = 0
+        for index in range(members):
+            if self.random.random() < 0.1:
+                value += self.random.randint(1, 5)
+                parts.append("%s_%d = %d" % (name.lower(), index, value))
+            else:
+                parts.append("%s_%d" % (name.lower(), index))
+            value += 1
+        parts.append("end")
+        return " ".join(parts) + "\n"
+
+    def bitfield(self, name, fields):
+        parts = ["bitfield %s" % name]
+        for index in range(fields):
+            parts.append("%s_%d : %d" % (name.lower(), index,
+                                         self.random.randint(1, 4)))
+        parts.append("end")
+        return " ".join(parts) + "\n"
+
+    def query(self):
+        field = self.random.choice(UNIT_FIELDS)
+        condition = " and ".join(
+            "query->%s %s %s" % (self.random.choice(UNIT_FIELDS),
+                                 self.random.choice(["<", ">", "!="]),
+                                 self.constant())
+            for _ in range(self.random.randint(1, 3)))
+        if self.random.random() < 0.5:
+            return "(QUERY VALUE %s query->%s WHERE %s)" % (
+                self.random.choice(VALUE_OPS), field, condition)
+        else:
+            return "(QUERY UNIT %s query->%s WHERE %s)" % (
+                self.random.choice(["MIN", "MAX"]), field, condition)
+
+    def library_path(self, name):
+        return join(self.directory, name)
+
+
+def if_chains(generator, scale):
+    functions = [generator.if_chain("chain%d" % index, 20 * scale)
+                 for index in range(4)]
+    calls = ["say(chain%d(%d))" % (index, index) for index in range(4)]
+    return Program("if_chains", "".join(functions) + "\n".join(calls) + "\n",
+                   {})
+
+
+def nested_calls(generator, scale):
+    code, roots = generator.call_tree("f", 2 + scale, 3)
+    calls = ["say(%s(%d, %d))" % (root, index, index + 1)
+             for index, root in enumerate(roots)]
+    return Program("nested_calls", code + "\n".join(calls) + "\n", {})
+
+
+def enums_and_bitfields(generator, scale):
+    parts = []
+    uses = []
+    for index in range(4):
+        name = "Enum%d" % index
+        parts.append(generator.enum(name, 100 * scale))
+        uses.append("say(%s_%d)" % (name.lower(), 50 * scale))
+    for index in range(4):
+        name = "Bits%d" % index
+        parts.append(generator.bitfield(name, 8))
+        uses.append("b%d = %s(0)" % (index, name))
+        for field in range(8):
+            uses.append("b%d.%s_%d = %d" % (index, name.lower(), field,
+                                            field % 2))
+        uses.append("say(b%d.%s_3)" % (index, name.lower()))
+    return Program("enums_and_bitfields", "".join(parts) + "\n".join(uses) + "\n",
+                   {})
+
+
+def queries(generator, scale):
+    lines = ["total = 0"]
+    for index in range(25 * scale):
+        query = generator.query()
+        if query.startswith("(QUERY VALUE"):
+            lines.append("total = total + %s" % query)
+        else:
+            lines.append("target = %s" % query)
+    lines.append("say(total)")
+    return Program("queries", "\n".join(lines) + "\n", {})
+
+
+def diamond_requires(generator, scale):
+    """Libraries required along many paths: every library of one layer
+    requires all libraries of the next one."""
+    width = 2 + scale
+    depth = 4
+    libraries = {}
+    for layer in reversed(range(depth)):
+        for index in range(width):
+            name = "lib_%d_%d" % (layer, index)
+            lines = []
+            if layer + 1 < depth:
+                for other in range(width):
+                    lines.append('require "%s"' % generator.library_path(
+                        "lib_%d_%d" % (layer + 1, other)))
+            lines.append(generator.enum("E%d_%d" % (layer, index), 20))
+            code, _ = generator.call_tree(name, 3, 2)
+            lines.append(code)
+            libraries[name + ".redux"] = "\n".join(lines)
+
+    lines = ['require "%s"' % generator.library_path("lib_0_%d" % index)
+             for index in range(width)]
+    for layer in range(depth):
+        for index in range(width):
+            lines.append("say(lib_%d_%d_0_0(%d, 1))" % (layer, index, layer))
+    return Program("diamond_requires", "\n".join(lines) + "\n", libraries)
+
+
+WORKLOADS = [
+    ("if_chains", if_chains),
+    ("nested_calls", nested_calls),
+    ("enums_and_bitfields", enums_and_bitfields),
+    ("queries", queries),
+    ("diamond_requires", diamond_requires),
+]
+
+
+def generate(name, scale=1, seed=0, directory="."):
+    """Generates the program of the named workload."""
+    return dict(WORKLOADS)[name](ProgramGenerator(seed, directory), scale)
+
+
+def write_program(program, directory):
+    """Writes the libraries of a program, returning the path of its script."""
+    for filename, code in program.libraries.items():
+        path = join(directory, filename)
+        makedirs(dirname(path), exist_ok=True)
+        with open(path, "wt") as file_:
+            file_.write(code)
+
+    path = join(directory, program.name + ".redux")
+    with open(path, "wt") as file_:
+        file_.write(program.code)
+    return path
@@ -0,0 +1,169 @@
+"""Times every phase of the compiler on generated workloads."""
+from tempfile import mkdtemp
+from shutil import rmtree
+import json
+
+from redux.bench.generator import WORKLOADS, generate, write_program
+from redux.codegenerator import OPTIMIZATIONS, compile_script
+from redux.costmodel import CostModel
+from redux.interpreter import Interpreter, Unit, World
+from redux.lexer import Lexer
+from redux.passstats import PassStats
+
+
+STAGES = ["lex", "parse", "RequireInliner", "BodyParser",
+          "AssignmentScopeAnalyzer", "CallGraph", "TypeAnnotator",
+          "AttributeSynthesizer", "CallInliner", "EnumInliner",
+          "StringInliner", "CodeGenerator"]
+
+
+def lex(code):
+    lexer = Lexer()
+    lexer.input(code)
+    while lexer.token() is not None:
+        pass
+
+
+def run_stages(filename, code):
+    """Compiles a script once, returning (seconds per stage, node count).
+
+    Required files are parsed from scratch, as part of the RequireInliner
+    stage, and the bodies of the functions the script calls in BodyParser.
+    The node count is that of the script once they are.
+    """
+    stats = PassStats()
+    stats.run("lex", lex, code)
+    compile_script(filename, code, stats=stats)
+
+    seconds = dict((stage.name, stage.wall_time) for stage in stats.stages)
+    nodes = [stage.nodes_after for stage in stats.stages
+             if stage.name == "BodyParser"][0]
+    return seconds, nodes
+
+
+def bench_world():
+    """Returns the units workloads are run against."""
+    return World([Unit(id_, HP=10 * id_, Energy=3 * id_, XPosition=id_,
+                       YPosition=2 * id_) for id_ in range(1, 9)])
+
+
+def executed_cost(filename, code, optimizations=()):
+    """Compiles a script and returns the cost of running it once."""
+    interpreter = Interpreter(bench_world())
+    interpreter.run(compile_script(filename, code,
+                                   optimizations=optimizations), unit=1)
+    return interpreter.cost.total(CostModel())
+
+
+def run_workload(name, scale=1, seed=0, repeat=3):
+    """Benchmarks one workload, keeping the best time of each stage."""
+    directory = mkdtemp(prefix="redux-bench-")
+    try:
+        program = generate(name, scale, seed, directory)
+        path = write_program(program, directory)
+        lines = sum(code.count("\n") for code in
+                    [program.code] + list(program.libraries.values()))
+
+        best = {}
+        for _ in range(repeat):
+            seconds, nodes = run_stages(path, program.code)
+            for stage, value in seconds.items():
+                best[stage] = min(best.get(stage, value), value)
+        executed = {"none": executed_cost(path, program.code),
+                    "all": executed_cost(path, program.code, OPTIMIZATIONS)}
+    finally:
+        rmtree(directory)
+
+    total = sum(best.values())
+    return {"lines": lines, "nodes": nodes, "stages": best, "total": total,
+            "lines_per_second": lines / total,
+            "nodes_per_second": nodes / total, "executed_cost": executed}
+
+
+def run(names=None, scale=1, seed=0, repeat=3):
+    """Benchmarks the named workloads, or all of them."""
+    if names is None:
+        names = [name for name, _ in WORKLOADS]
+    return {"scale": scale, "seed": seed,
+            "workloads": dict((name, run_workload(name, scale, seed, repeat))
+                              for name in names)}
+
+
+def stage_order(stage):
+    """Sort key putting stages in pipeline order, then the total, then
+    stages of other versions of the compiler by name."""
+    order = STAGES + ["total"]
+    if stage in order:
+        return order.index(stage), ""
+    return len(order), stage
+
+
+def compare(results, baseline, tolerance=0.1):
+    """Lists the stages that got more than tolerance slower than baseline.
+
+    Returns a list of (workload, stage, baseline seconds, seconds) tuples;
+    workloads run with another scale or seed are not compared.
+    """
+    regressions = []
+    if (baseline.get("scale"), baseline.get("seed")) != (results["scale"],
+                                                         results["seed"]):
+        return regressions
+
+    for name, result in sorted(results["workloads"].items()):
+        old_result = baseline["workloads"].get(name)
+        if old_result is None:
+            continue
+        pairs = [(stage, old_result["stages"].get(stage), seconds)
+                 for stage, seconds in result["stages"].items()]
+        pairs.append(("total", old_result["total"], result["total"]))
+        for stage, old_seconds, seconds in pairs:
+            if old_seconds is not None and seconds > old_seconds * (1 + tolerance):
+                regressions.append((name, stage, old_seconds, seconds))
+
+    return sorted(regressions, key=lambda regression: (
+        regression[0], stage_order(regression[1])))
+
+
+def format_results(results, baseline=None):
+    lines = []
+    for name, result in sorted(results["workloads"].items()):
+        old_result = None
+        if baseline is not None:
+            old_result = baseline["workloads"].get(name)
+        lines.append("%s: %d lines, %d nodes, %.0f lines/s, %.0f nodes/s" % (
+            name, result["lines"], result["nodes"],
+            result["lines_per_second"], result["nodes_per_second"]))
+        if "executed_cost" in result:
+            lines.append("  executed cost %d, %d with all optimizations" % (
+                result["executed_cost"]["none"],
+                result["executed_cost"]["all"]))
+        stages = set(STAGES + ["total"]).union(result["stages"])
+        for stage in sorted(stages, key=stage_order):
+            if stage == "total":
+                seconds = result["total"]
+            else:
+                seconds = result["stages"].get(stage)
+            if seconds is None:
+                # Not run by the compiler the results are from.
+                lines.append("  %-24s %9s" % (stage, "-"))
+                continue
+            line = "  %-24s %9.2f ms" % (stage, seconds * 1000)
+            if old_result is not None:
+                if stage == "total":
+                    old_seconds = old_result["total"]
+                else:
+                    old_seconds = old_result["stages"].get(stage)
+                if old_seconds:
+                    line += "  %+6.1f%%" % ((seconds / old_seconds - 1) * 100)
+            lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def load_results(path):
+    with open(path, "rt") as file_:
+        return json.load(file_)
+
+
+def save_results(results, path):
+    with open(path, "wt") as file_:
+        json.dump(results, file_, indent=1, sort_keys=True)
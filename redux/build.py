@@ -0,0 +1,276 @@
+"""Batch compilation of many scripts across a pool of worker processes."""
+from argparse import ArgumentParser
+from collections import namedtuple
+from multiprocessing import Pool, cpu_count
+from os import makedirs, walk
+from os.path import join, relpath, splitext, exists, realpath
+from redux import __version__
+from redux.files import write_atomically
+from redux.serialize import source_hash
+import json
+import sys
+import time
+import traceback
+
+
+BUILD_CACHE_FILENAME = ".redux-build-cache.json"
+
+# hashes maps the input and every dependency to the hash of the source the
+# compile read, or None if it is not known.
+BuildResult = namedtuple("BuildResult", ("input_path", "output_path", "seconds",
+                                         "error", "dependencies", "skipped",
+                                         "hashes"))
+
+
+# Per-process state, set up once by init_worker and reused for every script
+# the worker compiles.
+_compiler = None
+
+
+def init_worker(precompiled=False, precompiled_dir=None):
+    global _compiler
+    # Importing the code generator builds the PLY parser, so that it is warm
+    # before the first task arrives.
+    from redux.codegenerator import Compiler
+    from redux.requireinliner import LibraryCache
+    _compiler = Compiler(LibraryCache(precompiled, precompiled_dir))
+
+
+def find_scripts(source_dir):
+    """Yields the paths of all Redux scripts below source_dir."""
+    for dirpath, dirnames, filenames in walk(source_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if splitext(filename)[1] == ".redux":
+                yield join(dirpath, filename)
+
+
+def output_path(source_dir, output_dir, path, extension):
+    return join(output_dir, splitext(relpath(path, source_dir))[0] + extension)
+
+
+def hash_file(path):
+    with open(path, "rt") as file_:
+        return source_hash(file_.read())
+
+
+def format_depfile(output_path_, input_path, dependencies):
+    """Formats a make-style dependency rule for a compiled script."""
+    def escape(path):
+        return path.replace(" ", "\\ ")
+
+    prerequisites = [input_path] + sorted(set(dependencies))
+    return "%s: %s\n" % (escape(output_path_),
+                         " \\\n  ".join(escape(path) for path in prerequisites))
+
+
+class BuildCache(object):
+    """Records what each output was compiled from, to skip unchanged scripts.
+
+    An output is up to date if it exists and was compiled by the same
+    compiler version with the same options from a source and required files
+    whose contents have not changed since.
+    """
+    def __init__(self, path, options):
+        super(BuildCache, self).__init__()
+        self.path = path
+        self.options = options
+        self.entries = {}
+        self.hashes = {}
+
+        try:
+            with open(path, "rt") as file_:
+                data = json.load(file_)
+        except (IOError, ValueError):
+            return
+
+        if data.get("compiler") == __version__ and data.get("options") == options:
+            self.entries = data.get("entries", {})
+
+    def hash(self, path):
+        """Hashes a file, at most once per build."""
+        if path not in self.hashes:
+            try:
+                self.hashes[path] = hash_file(path)
+            except IOError:
+                self.hashes[path] = None
+        return self.hashes[path]
+
+    def is_up_to_date(self, input_path, output_path_):
+        entry = self.entries.get(input_path)
+        if (entry is None or entry["output"] != output_path_ or
+            not exists(output_path_) or
+            entry["source"] != self.hash(input_path)):
+            return False
+
+        return all(self.hash(path) == digest
+                   for path, digest in entry["dependencies"].items())
+
+    def dependencies(self, input_path):
+        return list(self.entries[input_path]["dependencies"])
+
+    def record(self, result):
+        if result.error:
+            self.entries.pop(result.input_path, None)
+            return
+
+        # The hashes of what the compile read, so that files edited while
+        # the build is running are rebuilt next time.
+        self.entries[result.input_path] = {
+            "output": result.output_path,
+            "source": result.hashes[result.input_path],
+            "dependencies": dict((path, result.hashes[path])
+                                 for path in result.dependencies),
+        }
+
+    def prune(self, input_paths):
+        """Forgets the scripts that are not in input_paths any more."""
+        input_paths = set(input_paths)
+        for input_path in list(self.entries):
+            if input_path not in input_paths:
+                del self.entries[input_path]
+
+    def save(self):
+        write_atomically(self.path, json.dumps({
+            "compiler": __version__,
+            "options": self.options,
+            "entries": self.entries,
+        }, indent=1, sort_keys=True))
+
+
+def compile_file(task):
+    """Compiles one script into a BuildResult."""
+    input_path, output_path_, depfile = task
+    dependencies = []
+    hashes = {}
+    start = time.perf_counter()
+    try:
+        with open(input_path, "rt") as file_:
+            code = file_.read()
+        hashes[input_path] = source_hash(code)
+        output_code = _compiler.compile(input_path, code, dependencies)
+        for path in dependencies:
+            hashes[path] = _compiler.library_cache.source_hash(realpath(path))
+        # The output goes last, so that it is only fresh if everything else
+        # succeeded.
+        if depfile:
+            write_atomically(output_path_ + ".d",
+                             format_depfile(output_path_, input_path,
+                                            dependencies))
+        write_atomically(output_path_, output_code)
+    except Exception:
+        error = traceback.format_exc()
+    else:
+        error = None
+    return BuildResult(input_path, output_path_, time.perf_counter() - start,
+                       error, dependencies, False, hashes)
+
+
+def format_summary(results, wall_time, jobs):
+    lines = []
+    compiled = [result for result in results if not result.skipped]
+    for result in sorted(compiled, key=lambda r: -r.seconds):
+        lines.append("%9.1f ms  %s%s" % (result.seconds * 1000,
+                                         result.input_path,
+                                         "  FAILED" if result.error else ""))
+    failed = sum(1 for result in results if result.error)
+    lines.append("%d script(s), %d up to date, %d failed, %.1f ms compiling, "
+                 "%.1f ms wall, %d job(s)" % (
+                     len(results), len(results) - len(compiled), failed,
+                     sum(result.seconds for result in compiled) * 1000,
+                     wall_time * 1000, jobs))
+    return "\n".join(lines) + "\n"
+
+
+def build(source_dir, output_dir, jobs=None, extension=".rescript",
+          incremental=True, depfiles=False, precompiled=False,
+          precompiled_dir=None):
+    """Compiles all scripts below source_dir into output_dir.
+
+    With incremental set, scripts whose outputs are up to date according to
+    the build cache in output_dir are skipped. With precompiled set, required
+    files are stored and loaded as .reduxc files. Returns a list of
+    BuildResults.
+    """
+    cache = BuildCache(join(output_dir, BUILD_CACHE_FILENAME),
+                       {"extension": extension, "depfiles": depfiles})
+
+    results = []
+    tasks = []
+    for path in find_scripts(source_dir):
+        task = (path, output_path(source_dir, output_dir, path, extension),
+                depfiles)
+        if incremental and cache.is_up_to_date(task[0], task[1]):
+            results.append(BuildResult(task[0], task[1], 0.0, None,
+                                       cache.dependencies(task[0]), True,
+                                       None))
+        else:
+            tasks.append(task)
+
+    if not tasks:
+        pass
+    elif jobs == 1:
+        init_worker(precompiled, precompiled_dir)
+        results.extend(compile_file(task) for task in tasks)
+    else:
+        pool = Pool(min(jobs or cpu_count(), len(tasks)),
+                    initializer=init_worker,
+                    initargs=(precompiled, precompiled_dir))
+        try:
+            results.extend(pool.map(compile_file, tasks, chunksize=1))
+        finally:
+            pool.close()
+            pool.join()
+
+    for result in results:
+        if not result.skipped:
+            cache.record(result)
+    cache.prune(result.input_path for result in results)
+    makedirs(output_dir, exist_ok=True)
+    cache.save()
+
+    return results
+
+
+def main(argv):
+    parser = ArgumentParser(prog='python -m redux build',
+                            description='Compile all Redux scripts in a '
+                                        'directory tree to Rescript.')
+    parser.add_argument('source_dir', metavar='SRC',
+                        help='directory containing the scripts to compile')
+    parser.add_argument('output_dir', metavar='OUT',
+                        help='directory to write the compiled scripts to')
+    parser.add_argument('-j', '--jobs', type=int, default=cpu_count(),
+                        help='number of worker processes (default: %(default)s)')
+    parser.add_argument('--extension', default='.rescript',
+                        help='extension of the compiled scripts '
+                             '(default: %(default)s)')
+    parser.add_argument('--force', action='store_true',
+                        help='recompile all scripts, even if up to date')
+    parser.add_argument('--depfiles', action='store_true',
+                        help='write a make-style .d file next to each output')
+    parser.add_argument('--precompile', action='store_true',
+                        help='keep parsed required files in .reduxc files '
+                             'next to their sources')
+    parser.add_argument('--precompile-dir', metavar='DIR',
+                        help='keep .reduxc files in DIR instead')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='do not print the timing summary')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = build(args.source_dir, args.output_dir, args.jobs,
+                    args.extension, not args.force, args.depfiles,
+                    args.precompile or args.precompile_dir is not None,
+                    args.precompile_dir)
+    wall_time = time.perf_counter() - start
+
+    for result in results:
+        if result.error:
+            sys.stderr.write("%s: compilation failed\n%s" % (result.input_path,
+                                                             result.error))
+
+    if not args.quiet:
+        sys.stdout.write(format_summary(results, wall_time, args.jobs))
+
+    return 1 if any(result.error for result in results) else 0
@@ -0,0 +1,352 @@
+"""Compile-time evaluation of user function calls with constant arguments.
+
+Helpers such as lookups over enums and bit mask builders are often called
+with literal arguments, and inlining them makes the script compute the same
+value every tick. CallEvaluator runs before CallInliner and executes the
+typed body of every call of a user function whose arguments are all
+constants, replacing the call by the constant it returns.
+
+A call is only replaced if its evaluation completes within a budget of
+steps and touches nothing but its arguments, its own variables and enum
+constants: reading a variable of the script or of the engine, assigning
+one, a code literal, a query, an access to a unit or a class, and calling
+an intrinsic that is impure or has no evaluator all give up on the call,
+which is then inlined as usual. Like ConstantPropagator, only int values
+are computed, with the same C semantics and 32-bit range.
+"""
+from redux.ast import (BitfieldDefinition, Constant, DottedAccess,
+                       FunctionCall, FunctionDefinition, LogicalAndOp,
+                       LogicalOrOp, VarRef)
+from redux.constprop import (INT_MAX, INT_MIN, constant_value, fold,
+                             make_constant)
+from redux.intrinsics import IntrinsicFunction
+from redux.symtab import Scope
+from redux.types import int_
+from redux.visitor import ASTTransformer, ASTVisitor
+
+
+# Most AST nodes the evaluation of a single call may visit.
+EVALUATION_BUDGET = 10000
+
+
+class NotConstant(Exception):
+    pass
+
+
+class BudgetExhausted(NotConstant):
+    pass
+
+
+class Return(Exception):
+    def __init__(self, value):
+        super(Return, self).__init__()
+        self.value = value
+
+
+class Break(Exception):
+    pass
+
+
+def enum_constant(visible_scope, name):
+    """Returns the value of name if it is an enum constant in the scope of
+    TypeAnnotator a function was defined in, or None."""
+    if visible_scope is None:
+        return None
+    try:
+        entry = visible_scope.lookup(name)
+    except KeyError:
+        return None
+    if (entry.type is int_ and entry.immutable and
+        isinstance(entry.value, Constant)):
+        return entry.value.value
+    return None
+
+
+class FunctionEvaluator(ASTVisitor):
+    """Evaluates the typed body of a call, raising NotConstant if its result
+    is not known at compile time."""
+    def __init__(self, budget=EVALUATION_BUDGET):
+        super(FunctionEvaluator, self).__init__()
+        self.steps = budget
+        self.scope = None
+        self.func_def = None
+
+    def visit(self, node):
+        self.steps -= 1
+        if self.steps < 0:
+            raise BudgetExhausted
+        return super(FunctionEvaluator, self).visit(node)
+
+    def generic_visit(self, node):
+        raise NotConstant
+
+    def call(self, func_def, values):
+        outer = self.scope, self.func_def
+        self.scope = Scope(bindings=dict(zip(func_def.arguments, values)))
+        self.func_def = func_def
+        try:
+            self.visit(func_def.block)
+        except Return as e:
+            return e.value
+        finally:
+            self.scope, self.func_def = outer
+        return None
+
+    def lookup(self, name):
+        scope = self.scope
+        while scope is not None:
+            if name in scope.bindings:
+                return scope
+            scope = scope.parent
+        return None
+
+    # Statements
+
+    def visit_Block(self, block):
+        self.scope = self.scope.child()
+        try:
+            for stmt in block.statements:
+                self.visit(stmt)
+        finally:
+            self.scope = self.scope.parent
+
+    def visit_ExprStmt(self, stmt):
+        expr = stmt.expression
+        if (isinstance(expr, FunctionCall) and expr.type is None and
+            isinstance(expr.func_def, FunctionDefinition)):
+            # Helpers returning nothing can still only change their own
+            # variables.
+            self.call(expr.func_def, [self.visit(argument)
+                                      for argument in expr.arguments])
+        else:
+            self.visit(expr)
+
+    def visit_FunctionDefinition(self, func_def):
+        pass
+
+    def visit_BitfieldDefinition(self, bitfield_def):
+        pass
+
+    def visit_EnumDefinition(self, enum_def):
+        for name, value in enum_def.members:
+            self.scope.define(name, value.value)
+
+    def visit_Assignment(self, assignment):
+        value = self.visit(assignment.expression)
+        name = assignment.variable.name
+        if assignment.declare is True:
+            self.scope.define(name, value)
+            return
+        scope = self.lookup(name)
+        if scope is None:
+            # Assigns a variable of the script.
+            raise NotConstant
+        scope.bindings[name] = value
+
+    def visit_BitfieldAssignment(self, assignment):
+        access = assignment.variable
+        name = access.expression.name
+        scope = self.lookup(name)
+        if scope is None:
+            raise NotConstant
+        offset, width = access.expression.type.get_member_limits(
+            access.member)
+        mask = ((1 << width) - 1) << offset
+        value = (self.visit(assignment.expression) << offset) & mask
+        result = (scope.bindings[name] & ~mask) | value
+        if not INT_MIN <= result <= INT_MAX:
+            raise NotConstant
+        scope.bindings[name] = result
+
+    def visit_IfStmt(self, if_stmt):
+        if self.visit(if_stmt.condition):
+            self.visit(if_stmt.then_block)
+        elif if_stmt.else_part is not None:
+            self.visit(if_stmt.else_part)
+
+    def run_loop(self, condition, step, block):
+        while condition is None or self.visit(condition):
+            try:
+                self.visit(block)
+            except Break:
+                return
+            if step is not None:
+                self.visit(step)
+
+    def visit_WhileStmt(self, while_stmt):
+        self.run_loop(while_stmt.condition, None, while_stmt.block)
+
+    def visit_ForStmt(self, for_stmt):
+        self.scope = self.scope.child()
+        try:
+            self.visit(for_stmt.assignment)
+            self.run_loop(for_stmt.condition, for_stmt.step_expr,
+                          for_stmt.block)
+        finally:
+            self.scope = self.scope.parent
+
+    def visit_BreakStmt(self, break_stmt):
+        raise Break
+
+    def visit_ReturnStmt(self, return_stmt):
+        raise Return(self.visit(return_stmt.expression))
+
+    # Expressions, all of type int
+
+    def visit_Expr(self, expr):
+        if expr.type is not int_ and not isinstance(expr.type,
+                                                    BitfieldDefinition):
+            raise NotConstant
+        return self.value(expr)
+
+    def value(self, expr):
+        if isinstance(expr, Constant):
+            return expr.value
+        if isinstance(expr, VarRef):
+            return self.variable(expr.name)
+        if isinstance(expr, DottedAccess):
+            if not isinstance(expr.expression.type, BitfieldDefinition):
+                raise NotConstant
+            offset, width = expr.expression.type.get_member_limits(
+                expr.member)
+            return (self.visit(expr.expression) >> offset) & (
+                (1 << width) - 1)
+        if isinstance(expr, (LogicalAndOp, LogicalOrOp)):
+            # Short-circuits like the generated code.
+            lhs = bool(self.visit(expr.lhs))
+            if lhs == isinstance(expr, LogicalOrOp):
+                return int(lhs)
+            return int(bool(self.visit(expr.rhs)))
+        if isinstance(expr, FunctionCall):
+            return self.function_call(expr)
+
+        result = fold(expr, [(int_, self.visit(child))
+                             for child in expr.children()])
+        if result is None:
+            raise NotConstant
+        return result[1]
+
+    def variable(self, name):
+        scope = self.lookup(name)
+        if scope is not None:
+            return scope.bindings[name]
+        # Enum constants are the only names of the script that are known.
+        value = enum_constant(getattr(self.func_def, "visible_scope", None),
+                              name)
+        if value is None:
+            raise NotConstant
+        return value
+
+    def function_call(self, func_call):
+        func_def = func_call.func_def
+        values = [self.visit(argument) for argument in func_call.arguments]
+        if isinstance(func_def, BitfieldDefinition):
+            return values[0]
+        if isinstance(func_def, IntrinsicFunction):
+            result = fold(func_call, [(int_, value) for value in values])
+            if result is None:
+                raise NotConstant
+            return result[1]
+        result = self.call(func_def, values)
+        if result is None:
+            raise NotConstant
+        return result
+
+
+class CallEvaluator(ASTTransformer):
+    """Replaces calls of user functions with constant arguments by their
+    result.
+
+    Arguments are constant if they are literals or enum constants, which
+    are found like EnumInliner does: scope maps the names defined in the
+    blocks entered so far to the value of enum constants, or to None for
+    variables shadowing them, and visible_scope is the scope of
+    TypeAnnotator the function whose body is being visited was defined in.
+    """
+    def __init__(self, budget=EVALUATION_BUDGET):
+        super(CallEvaluator, self).__init__()
+        self.budget = budget
+        self.scope = Scope()
+        self.visible_scope = None
+        self.calls = 0
+        self.evaluated = 0
+        self.over_budget = 0
+
+    def push_scope(self):
+        self.scope = self.scope.child()
+
+    def pop_scope(self):
+        self.scope = self.scope.parent
+
+    def visit_FunctionDefinition(self, func_def):
+        # Only the typed copies made for each call site are lowered.
+        return func_def
+
+    def visit_EnumDefinition(self, enum_def):
+        for name, value in enum_def.members:
+            self.scope.define(name, value.value)
+        return enum_def
+
+    def visit_Assignment(self, assignment):
+        assignment = self.generic_visit(assignment)
+        if getattr(assignment, "declare", False) is True:
+            self.scope.define(assignment.variable.name, None)
+        return assignment
+
+    def argument_value(self, argument):
+        if isinstance(argument, VarRef):
+            scope = self.scope
+            while scope is not None:
+                if argument.name in scope.bindings:
+                    value = scope.bindings[argument.name]
+                    break
+                scope = scope.parent
+            else:
+                value = enum_constant(self.visible_scope, argument.name)
+            return None if value is None else (int_, value)
+        return constant_value(argument)
+
+    def visit_FunctionCall(self, func_call):
+        func_call = self.generic_visit(func_call)
+        func_def = func_call.func_def
+        if isinstance(func_def, (IntrinsicFunction, BitfieldDefinition)):
+            return func_call
+
+        values = [self.argument_value(argument)
+                  for argument in func_call.arguments]
+        if func_call.type is int_ and all(value is not None and
+                                          value[0] is int_
+                                          for value in values):
+            self.calls += 1
+            evaluator = FunctionEvaluator(self.budget)
+            try:
+                result = evaluator.call(func_def,
+                                        [value for _, value in values])
+            except BudgetExhausted:
+                self.over_budget += 1
+            except NotConstant:
+                pass
+            else:
+                if result is not None:
+                    self.evaluated += 1
+                    constant = make_constant((int_, result))
+                    constant.type = int_
+                    return constant
+
+        # Calls in the body are inlined along with it.
+        outer = self.scope, self.visible_scope
+        self.scope = Scope(bindings=dict.fromkeys(func_def.arguments))
+        self.visible_scope = getattr(func_def, "visible_scope", None)
+        func_def.block = self.visit(func_def.block)
+        self.scope, self.visible_scope = outer
+        return func_call
+
+    def report(self):
+        return {"calls": self.calls, "evaluated": self.evaluated,
+                "over_budget": self.over_budget}
+
+
+def format_report(report):
+    return ("%d of %d call(s) with constant arguments evaluated, %d over "
+            "budget\n" % (report["evaluated"], report["calls"],
+                          report["over_budget"]))
@@ -0,0 +1,190 @@
+"""Call graph of a script and the size it grows to once calls are inlined.
+
+Every call of a user function is inlined: TypeAnnotator annotates a copy of
+the function body per call site and CallInliner later splices the copies into
+the script. A recursive function would be copied forever, and a helper called
+from many places, or from other helpers called from many places, multiplies
+the size of the output.
+
+CallGraph finds the function every call resolves to, the same way
+TypeAnnotator does, before any of that happens. It raises
+RecursiveCallError for recursion among the functions the script calls, and
+ExpansionBudgetError when the script would grow past a budget of AST nodes
+once inlined. Functions the script never calls are not expanded, so they
+may be recursive without harm.
+"""
+from redux.passstats import count_nodes
+from redux.symtab import Scope
+from redux.visitor import ASTVisitor
+
+
+# Largest number of AST nodes a script may have once all calls are inlined.
+EXPANSION_BUDGET = 200000
+
+
+class RecursiveCallError(RuntimeError):
+    pass
+
+
+class ExpansionBudgetError(RuntimeError):
+    pass
+
+
+class FunctionNode(object):
+    """A function of the call graph, or the top level of the script."""
+    def __init__(self, name):
+        super(FunctionNode, self).__init__()
+        self.name = name
+        # AST nodes of the body itself, outside nested function definitions.
+        self.nodes = 0
+        # Calls by name with the scope they are resolved in.
+        self.calls = []
+        # The function every call site resolves to, in order.
+        self.callees = []
+        # Nodes one inlined call of the function adds up to, None if the
+        # script never calls it.
+        self.inlined_nodes = None
+        # Copies of the body the inlined script contains.
+        self.copies = 0
+
+
+class CallGraph(ASTVisitor):
+    """Builds the call graph of a script and checks its expansion.
+
+    Calls made by the top level of the script are resolved right away, as
+    they are annotated in order; calls in function bodies are resolved once
+    the whole script has been seen, since function definitions see names
+    defined after them.
+    """
+    def __init__(self, budget=EXPANSION_BUDGET):
+        super(CallGraph, self).__init__()
+        self.budget = budget
+        self.scope = Scope()
+        self.script = FunctionNode(None)
+        self.functions = []
+        self.current = self.script
+        self.total = 0
+
+    def push_scope(self):
+        self.scope = self.scope.child()
+
+    def pop_scope(self):
+        self.scope = self.scope.parent
+
+    def visit_BitfieldDefinition(self, bitfield_def):
+        self.scope.define(bitfield_def.name, None)
+
+    def visit_FunctionDefinition(self, function_def):
+        function = FunctionNode(function_def.name)
+        function.nodes = count_nodes(function_def.block)
+        self.current.nodes -= count_nodes(function_def)
+        self.functions.append(function)
+        self.scope.define(function_def.name, function)
+
+        outer_function, outer_scope = self.current, self.scope
+        self.current = function
+        self.scope = self.scope.child(dict.fromkeys(function_def.arguments))
+        self.visit(function_def.block)
+        self.current, self.scope = outer_function, outer_scope
+
+    def visit_FunctionCall(self, func_call):
+        self.generic_visit(func_call)
+        if self.current is self.script:
+            self.resolve(self.script, func_call.function, self.scope)
+        else:
+            self.current.calls.append((func_call.function, self.scope))
+
+    def resolve(self, function, name, scope):
+        try:
+            callee = scope.lookup(name)
+        except KeyError:
+            # Intrinsics, or undefined names TypeAnnotator reports.
+            return
+        if callee is not None:
+            function.callees.append(callee)
+
+    def visit_Block(self, block):
+        root = self.current is self.script and self.scope.parent is None
+        if root:
+            self.script.nodes = count_nodes(block)
+        super(CallGraph, self).visit_Block(block)
+        if root:
+            self.analyze()
+
+    def analyze(self):
+        for function in self.functions:
+            for name, scope in function.calls:
+                self.resolve(function, name, scope)
+
+        order = []
+        self.sort(self.script, [], set(), order)
+
+        # Callers come before their callees in reverse postorder.
+        self.script.copies = 1
+        for function in reversed(order):
+            for callee in function.callees:
+                callee.copies += function.copies
+        for function in order:
+            function.inlined_nodes = function.nodes + sum(
+                callee.inlined_nodes for callee in function.callees)
+        self.total = self.script.inlined_nodes
+
+        if self.budget is not None and self.total > self.budget:
+            largest = sorted(self.functions, key=contribution, reverse=True)
+            raise ExpansionBudgetError(
+                "inlining calls expands the script to %d nodes, over the "
+                "budget of %d; largest expansions: %s" % (
+                    self.total, self.budget,
+                    ", ".join("%s (%s of %d nodes)" % (
+                        function.name, copies(function.copies),
+                        function.nodes)
+                        for function in largest[:3] if function.copies)))
+
+    def sort(self, function, path, done, order):
+        """Appends the functions reachable from function to order in
+        postorder, raising RecursiveCallError on a cycle."""
+        if function in path:
+            cycle = path[path.index(function):] + [function]
+            raise RecursiveCallError("recursive call: " + " -> ".join(
+                callee.name for callee in cycle))
+        if function in done:
+            return
+        path.append(function)
+        for callee in function.callees:
+            self.sort(callee, path, done, order)
+        path.pop()
+        done.add(function)
+        order.append(function)
+
+    def report(self):
+        functions = sorted(self.functions, key=contribution, reverse=True)
+        return {"total": self.total, "budget": self.budget,
+                "functions": [{"name": function.name,
+                               "nodes": function.nodes,
+                               "inlined_nodes": function.inlined_nodes,
+                               "copies": function.copies}
+                              for function in functions]}
+
+
+def contribution(function):
+    return function.copies * function.nodes
+
+
+def copies(count):
+    return "%d cop%s" % (count, "y" if count == 1 else "ies")
+
+
+def format_report(report):
+    lines = ["script expands to %d nodes once calls are inlined" %
+             report["total"]]
+    if report["budget"] is not None:
+        lines[0] += " (budget %d)" % report["budget"]
+    for function in report["functions"]:
+        if function["copies"]:
+            lines.append("  %s: %d nodes, %d when inlined, %s" % (
+                function["name"], function["nodes"],
+                function["inlined_nodes"], copies(function["copies"])))
+        else:
+            lines.append("  %s: %d nodes, never called" % (
+                function["name"], function["nodes"]))
+    return "\n".join(lines) + "\n"
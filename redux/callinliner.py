@@ -1,15 +1,38 @@
 from redux.ast import (Block, Assignment, WhileStmt, IfStmt, BreakStmt,
                        ReturnStmt, Constant, VarRef, Stmt, NoOp, FunctionCall)
+from copy import deepcopy
+from redux.attributes import attributes
 from redux.types import int_, object_
 from redux.visitor import ASTTransformer, ASTVisitor
 
 
+class VariableCollector(ASTVisitor):
+    def __init__(self):
+        super(VariableCollector, self).__init__()
+        self.names = set()
+
+    def visit_VarRef(self, var_ref):
+        self.names.add(var_ref.name)
+
+
+def captures(parameters, arguments):
+    """Whether an argument reads a parameter declared before it, which the
+    declaration would shadow."""
+    for index, argument in enumerate(arguments):
+        collector = VariableCollector()
+        collector.visit(argument)
+        if collector.names.intersection(parameters[:index]):
+            return True
+    return False
+
+
 class CallInliner(ASTTransformer):
     """Inlines all calls to nontrivial functions."""
     def __init__(self):
         super(CallInliner, self).__init__()
         self.prepend_stack = []
         self.return_value_counter = 0
+        self.argument_counter = 0
 
     def allocate_temporary(self, type_):
         temporary = VarRef("__retval%d" % self.return_value_counter)
@@ -45,30 +68,19 @@ class CallInliner(ASTTransformer):
         return new_statements
 
     def visit_ForStmt(self, for_stmt):
-        class NontrivialFunctionCheck(ASTVisitor):
-            def visit_FunctionCall(self, func_call):
-                if func_call.func_def.nontrivial is True:
-                    raise RuntimeError
-
         self.push_prepend_ctx()
 
         for_stmt.block = self.visit(for_stmt.block)
 
-        try:
-            NontrivialFunctionCheck().visit(for_stmt.step_expr)
-        except RuntimeError:
+        if attributes(for_stmt.step_expr).nontrivial_call:
             for_stmt.block = self.visit(Block([for_stmt.block, for_stmt.step_expr]))
             for_stmt.step_expr = None
 
-        try:
-            NontrivialFunctionCheck().visit(for_stmt.condition)
-        except RuntimeError:
+        if attributes(for_stmt.condition).nontrivial_call:
             for_stmt.block = self.visit(Block([IfStmt(for_stmt.condition, for_stmt.block, Block([BreakStmt()]))]))
             for_stmt.condition = None
 
-        try:
-            NontrivialFunctionCheck().visit(for_stmt.assignment)
-        except RuntimeError:
+        if attributes(for_stmt.assignment).nontrivial_call:
             self.log("Non-trivial assignment in for loop")
             for_stmt.assignment.expression = self.visit(for_stmt.assignment.expression)
 
@@ -92,8 +104,19 @@ class CallInliner(ASTTransformer):
             return func_call
 
         new_block = func_def.block
-        argument_assignments = [Assignment(VarRef(name), value, True)
-            for name, value in zip(func_def.arguments, func_call.arguments)]
+        arguments = func_call.arguments
+        argument_assignments = []
+        if captures(func_def.arguments, arguments):
+            # Evaluate every argument before declaring the parameters.
+            arguments = []
+            for value in func_call.arguments:
+                temporary = VarRef("__arg%d" % self.argument_counter)
+                temporary.type = value.type
+                self.argument_counter += 1
+                argument_assignments.append(Assignment(temporary, value, True))
+                arguments.append(deepcopy(temporary))
+        argument_assignments += [Assignment(VarRef(name), value, True)
+            for name, value in zip(func_def.arguments, arguments)]
         new_statements = argument_assignments + new_block.statements
         new_block.statements = new_statements
         self.visit(new_block)
@@ -1,21 +1,43 @@
 import sys
+from types import MappingProxyType
+from redux.achronalfields import AchronalFieldOptimizer
 from redux.assignmentdeclare import AssignmentScopeAnalyzer
 from redux.ast import BitfieldDefinition
+from redux.attributes import synthesize_attributes
+from redux.calleval import CallEvaluator
+from redux.callgraph import CallGraph, EXPANSION_BUDGET
 from redux.callinliner import CallInliner
+from redux.conditionorder import ConditionReorderer
+from redux.constprop import ConstantPropagator
+from redux.copyprop import CopyPropagator
+from redux.decisiontree import DecisionTreeLowerer
 from redux.enuminliner import EnumInliner
 from redux.intrinsics import get_intrinsic_functions
+from redux.localpacking import LocalPacker
+from redux.names import get_initial_names
 from redux.parser import parse
+from redux.passstats import NullPassStats
+from redux.profile import BranchReorderer, SiteLabeler
 from redux.stringinliner import StringInliner
-from redux.typeannotate import TypeAnnotator
+from redux.typeannotate import TypeAnnotator, get_initial_bindings
+from redux.unrolling import LoopUnroller, UNROLL_LIMIT
 from redux.types import str_, float_, int_, object_, is_numeric
 from redux.visitor import ASTVisitor
-from redux.requireinliner import RequireInliner
+from redux.requireinliner import BodyParser, LibraryCache, RequireInliner
+
+
+# Optimizations that are only run when asked for.
+OPTIMIZATIONS = ["eval-calls", "const-prop", "unroll-loops", "decision-trees",
+                 "reorder-where", "af-cache", "copy-prop", "pack-locals"]
+
 
 class CodeGenerator(ASTVisitor):
     """Generates code from AST."""
-    def __init__(self):
+    def __init__(self, intrinsics=None):
         super(CodeGenerator, self).__init__()
-        self.intrinsics = dict(get_intrinsic_functions())
+        if intrinsics is None:
+            intrinsics = dict(get_intrinsic_functions())
+        self.intrinsics = intrinsics
 
         self.code = ""
 
@@ -217,19 +239,200 @@ class CodeGenerator(ASTVisitor):
         self.emit("])")
 
 
-def compile_script(filename, code):
-    code_generator = CodeGenerator()
-    ast_, errors = parse(code)
-    for lineno, message in errors:
-        sys.stderr.write("%s:%d: %s\n" % (filename, lineno, message))
-
-    ast_ = RequireInliner().visit(ast_)
-    ast_ = AssignmentScopeAnalyzer().visit(ast_)
-    ast_ = TypeAnnotator().visit(ast_)
-    ast_ = CallInliner().visit(ast_)
-    ast_ = EnumInliner().visit(ast_)
-    ast_ = StringInliner().visit(ast_)
-
-    code_generator.visit(ast_)
-
-    return code_generator.code
+class Compiler(object):
+    """Compiles scripts, building what every compilation shares only once.
+
+    The intrinsic table and the initial names and scope of the annotation
+    passes are built when the Compiler is and never modified afterwards, and
+    every pass keeps its state in objects of its own, so a single Compiler
+    can compile scripts in any number of threads at once. Parsed required
+    files are kept in library_cache, a new LibraryCache by default.
+
+    optimizations names the opt-in optimizations (see OPTIMIZATIONS) to
+    run, and unroll_limit the size in AST nodes loops may grow to when
+    unrolled. Scripts that inlining would grow past expansion_budget AST
+    nodes are rejected; None disables the check.
+
+    With counter_base set, scripts are instrumented with counters in
+    achronal fields from counter_base up, and given a profile (see
+    redux.profile), if/elif chains and query conditions are ordered by the
+    counts it holds.
+    """
+    def __init__(self, library_cache=None, optimizations=(),
+                 unroll_limit=UNROLL_LIMIT, expansion_budget=EXPANSION_BUDGET,
+                 counter_base=None, profile=None):
+        super(Compiler, self).__init__()
+        if library_cache is None:
+            library_cache = LibraryCache()
+        self.library_cache = library_cache
+        self.optimizations = tuple(optimizations)
+        self.unroll_limit = unroll_limit
+        self.expansion_budget = expansion_budget
+        self.counter_base = counter_base
+        self.profile = profile
+
+        intrinsics = dict(get_intrinsic_functions())
+        self.intrinsics = MappingProxyType(intrinsics)
+        self.initial_names = tuple(get_initial_names())
+        self.initial_bindings = MappingProxyType(
+            get_initial_bindings(intrinsics))
+
+    def annotate(self, filename, code, dependencies=None, parser=None,
+                 stats=None, reports=None):
+        """Parses a script and runs all passes up to type annotation.
+
+        If a dependencies list is given, the paths of all required files
+        are appended to it. A parser such as an IncrementalParser can be
+        passed to be used instead of parsing the whole script from scratch.
+        Every stage is run through stats, e.g. a PassStats measuring them.
+        If a reports dict is given, the call graph report is stored in it
+        under "call-graph", the map of the counters of an instrumented
+        build under "instrument" and how many sites a profile covered under
+        "profile-use".
+        """
+        if stats is None:
+            stats = NullPassStats()
+
+        if parser is None:
+            ast_, errors = stats.run("parse", parse, code)
+        else:
+            ast_, errors = stats.run("parse", parser.parse, code)
+        for lineno, message in errors:
+            sys.stderr.write("%s:%d: %s\n" % (filename, lineno, message))
+
+        require_inliner = RequireInliner(self.library_cache, filename)
+        ast_ = stats.run("RequireInliner", require_inliner.visit, ast_)
+        if dependencies is not None:
+            dependencies.extend(require_inliner.dependencies)
+        ast_ = stats.run("BodyParser", BodyParser(self.library_cache).visit,
+                         ast_)
+        if self.counter_base is not None or self.profile is not None:
+            labeler = SiteLabeler(self.counter_base, self.profile)
+            ast_ = stats.run("SiteLabeler", labeler.visit, ast_)
+            if reports is not None and self.counter_base is not None:
+                reports["instrument"] = labeler.counter_map()
+            if reports is not None and self.profile is not None:
+                reports["profile-use"] = labeler.report()
+        ast_ = stats.run("AssignmentScopeAnalyzer", AssignmentScopeAnalyzer(
+            self.initial_names).visit, ast_)
+        # Recursion and runaway expansion are caught before TypeAnnotator
+        # expands every call.
+        call_graph = CallGraph(self.expansion_budget)
+        stats.run("CallGraph", call_graph.visit, ast_)
+        if reports is not None:
+            reports["call-graph"] = call_graph.report()
+        ast_ = stats.run("TypeAnnotator", TypeAnnotator(
+            self.initial_bindings).visit, ast_)
+        ast_ = stats.run("AttributeSynthesizer", synthesize_attributes, ast_)
+
+        return ast_
+
+    def generate(self, ast_, stats=None, reports=None):
+        """Lowers a type-annotated AST and generates Rescript from it.
+
+        If a reports dict is given, the optimizations that report what they
+        did store their report in it under their name.
+        """
+        if stats is None:
+            stats = NullPassStats()
+        if reports is None:
+            reports = {}
+        optimizations = self.optimizations
+
+        code_generator = CodeGenerator(self.intrinsics)
+
+        if "eval-calls" in optimizations:
+            evaluator = CallEvaluator()
+            ast_ = stats.run("CallEvaluator", evaluator.visit, ast_)
+            reports["eval-calls"] = evaluator.report()
+            if evaluator.evaluated:
+                # Calls replaced by constants no longer need inlining.
+                ast_ = stats.run("AttributeSynthesizer", synthesize_attributes,
+                                 ast_, None, True)
+
+        ast_ = stats.run("CallInliner", CallInliner().visit, ast_)
+        ast_ = stats.run("EnumInliner", EnumInliner().visit, ast_)
+        ast_ = stats.run("StringInliner", StringInliner().visit, ast_)
+
+        if self.profile is not None:
+            branch_reorderer = BranchReorderer()
+            ast_ = stats.run("BranchReorderer", branch_reorderer.visit, ast_)
+            reports.setdefault("profile-use", {}).update(
+                branch_reorderer.report())
+
+        if "const-prop" in optimizations:
+            propagator = ConstantPropagator()
+            ast_ = stats.run("ConstantPropagator", propagator.visit, ast_)
+            reports["const-prop"] = propagator.report()
+
+        if "unroll-loops" in optimizations:
+            unroller = LoopUnroller(self.unroll_limit)
+            ast_ = stats.run("LoopUnroller", unroller.visit, ast_)
+            reports["unroll-loops"] = unroller.report()
+            if unroller.unrolled:
+                # Fold what substituting induction variables made constant.
+                ast_ = stats.run("ConstantPropagator",
+                                 ConstantPropagator().visit, ast_)
+
+        if "decision-trees" in optimizations:
+            lowerer = DecisionTreeLowerer()
+            ast_ = stats.run("DecisionTreeLowerer", lowerer.visit, ast_)
+            reports["decision-trees"] = lowerer.report()
+
+        # Measured probabilities are only of use once conditions are sorted.
+        if "reorder-where" in optimizations or self.profile is not None:
+            reorderer = ConditionReorderer()
+            ast_ = stats.run("ConditionReorderer", reorderer.visit, ast_)
+            reports["reorder-where"] = reorderer.report()
+
+        if "af-cache" in optimizations:
+            field_optimizer = AchronalFieldOptimizer()
+            ast_ = stats.run("AchronalFieldOptimizer", field_optimizer.visit,
+                             ast_)
+            reports["af-cache"] = field_optimizer.report()
+
+        if "copy-prop" in optimizations:
+            copy_propagator = CopyPropagator()
+            ast_ = stats.run("CopyPropagator", copy_propagator.visit, ast_)
+            reports["copy-prop"] = copy_propagator.report()
+
+        if "pack-locals" in optimizations:
+            local_packer = LocalPacker()
+            ast_ = stats.run("LocalPacker", local_packer.visit, ast_)
+            reports["pack-locals"] = local_packer.report()
+
+        stats.run("CodeGenerator", code_generator.visit, ast_)
+
+        return code_generator.code
+
+    def compile(self, filename, code, dependencies=None, parser=None,
+                stats=None, reports=None):
+        return self.generate(self.annotate(filename, code, dependencies,
+                                           parser, stats, reports),
+                             stats, reports)
+
+
+def annotate_script(filename, code, library_cache=None, dependencies=None,
+                    parser=None, stats=None, reports=None,
+                    expansion_budget=EXPANSION_BUDGET, counter_base=None,
+                    profile=None):
+    """Runs Compiler.annotate with a Compiler made for one script."""
+    compiler = Compiler(library_cache, expansion_budget=expansion_budget,
+                        counter_base=counter_base, profile=profile)
+    return compiler.annotate(filename, code, dependencies, parser, stats,
+                             reports)
+
+
+def generate_code(ast_, stats=None, optimizations=(), reports=None,
+                  unroll_limit=UNROLL_LIMIT, profile=None):
+    """Runs Compiler.generate with a Compiler made for one script."""
+    compiler = Compiler(optimizations=optimizations,
+                        unroll_limit=unroll_limit, profile=profile)
+    return compiler.generate(ast_, stats, reports)
+
+
+def compile_script(filename, code, library_cache=None, dependencies=None,
+                   parser=None, stats=None, optimizations=(), reports=None):
+    compiler = Compiler(library_cache, optimizations)
+    return compiler.compile(filename, code, dependencies, parser, stats,
+                            reports)
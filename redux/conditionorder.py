@@ -0,0 +1,142 @@
+"""Reordering of the conjuncts and disjuncts of query conditions.
+
+The WHERE clause and operation expression of a QUERY are evaluated for every
+candidate unit, so the order of the operands of their `and` and `or` chains
+matters: an `and` should test cheap conditions that are likely to be false
+first, an `or` cheap conditions that are likely to be true. Operands are
+sorted by estimated cost divided by the probability that they decide the
+chain, using the cost model for costs and a fixed guess of how often each
+kind of comparison holds.
+
+Only operands that are free of side effects and cannot fail are moved.
+Calls to intrinsics with side effects or a restricted domain, divisions and
+remainders stay where they are and split the chain into runs that are
+sorted separately, so conditions guarding them keep doing so.
+"""
+from redux.ast import (Constant, EqualToOp, NotEqualToOp, LogicalAndOp,
+                       LogicalOrOp, LogicalNotOp)
+from redux.attributes import AttributeSynthesizer, attributes
+from redux.costmodel import CostModel
+from redux.visitor import ASTTransformer
+
+
+# Estimated probability that a condition holds, by operator.
+EQUAL_SELECTIVITY = 0.1
+DEFAULT_SELECTIVITY = 0.5
+
+# Keeps operands that (almost) never decide a chain from dividing by zero.
+MIN_DECISION_PROBABILITY = 1e-3
+
+
+def is_movable(expr):
+    """Whether expr may be evaluated in a different place or order, or not
+    at all: it has no effect and cannot fail."""
+    return attributes(expr).movable
+
+
+def selectivity(expr):
+    """Estimates the probability that a condition holds, unless a profile
+    measured it (see redux.profile)."""
+    probability = getattr(expr, "probability", None)
+    if probability is not None:
+        return probability
+    if isinstance(expr, Constant):
+        return 1.0 if expr.value else 0.0
+    elif isinstance(expr, EqualToOp):
+        return EQUAL_SELECTIVITY
+    elif isinstance(expr, NotEqualToOp):
+        return 1.0 - EQUAL_SELECTIVITY
+    elif isinstance(expr, LogicalNotOp):
+        return 1.0 - selectivity(expr.expression)
+    elif isinstance(expr, LogicalAndOp):
+        return selectivity(expr.lhs) * selectivity(expr.rhs)
+    elif isinstance(expr, LogicalOrOp):
+        return 1.0 - ((1.0 - selectivity(expr.lhs)) *
+                      (1.0 - selectivity(expr.rhs)))
+    return DEFAULT_SELECTIVITY
+
+
+def chain_operands(expr, op_type):
+    """Returns the operands of a chain of op_type operations, left to right."""
+    if type(expr) is not op_type:
+        return [expr]
+    return chain_operands(expr.lhs, op_type) + chain_operands(expr.rhs, op_type)
+
+
+class ConditionReorderer(ASTTransformer):
+    """Sorts the `and`/`or` chains of query conditions by cost."""
+    def __init__(self, model=None):
+        super(ConditionReorderer, self).__init__()
+        if model is None:
+            model = CostModel()
+        self.model = model
+        # Rewrites since type annotation change costs, so the attributes of
+        # the operands are synthesized again, once.
+        self.synthesizer = AttributeSynthesizer(model, refresh=True)
+        self.query_depth = 0
+        self.chains = 0
+        self.reordered = 0
+
+    def rank(self, expr, op_type):
+        cost = self.synthesizer.attributes(expr).cost.total(self.model)
+        decides = selectivity(expr)
+        if op_type is LogicalAndOp:
+            decides = 1.0 - decides
+        return cost / max(decides, MIN_DECISION_PROBABILITY)
+
+    def visit_FunctionDefinition(self, func_def):
+        return func_def
+
+    def visit_Query(self, query):
+        self.query_depth += 1
+        self.generic_visit(query)
+        self.query_depth -= 1
+        return query
+
+    def visit_LogicalAndOp(self, op):
+        return self.reorder(op)
+
+    def visit_LogicalOrOp(self, op):
+        return self.reorder(op)
+
+    def reorder(self, op):
+        if self.query_depth == 0:
+            return self.generic_visit(op)
+
+        op_type = type(op)
+        original = chain_operands(op, op_type)
+        operands = [self.visit(operand) for operand in original]
+
+        ordered = []
+        run = []
+        for operand in operands + [None]:
+            if (operand is not None and
+                self.synthesizer.attributes(operand).movable):
+                run.append(operand)
+                continue
+            # sorted() is stable, so operands of equal rank keep their order.
+            ordered.extend(sorted(run, key=lambda expr: self.rank(expr,
+                                                                 op_type)))
+            run = []
+            if operand is not None:
+                ordered.append(operand)
+
+        self.chains += 1
+        if any(a is not b for a, b in zip(operands, ordered)):
+            self.reordered += 1
+        elif all(a is b for a, b in zip(original, operands)):
+            return op
+
+        result = ordered[0]
+        for operand in ordered[1:]:
+            result = op_type(result, operand)
+            result.type = op.type
+        return result
+
+    def report(self):
+        return {"chains": self.chains, "reordered": self.reordered}
+
+
+def format_report(report):
+    return "%d of %d query condition chain(s) reordered\n" % (
+        report["reordered"], report["chains"])
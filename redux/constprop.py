@@ -0,0 +1,404 @@
+"""Constant propagation and folding on the lowered AST.
+
+After calls are inlined, arguments become declarations like `int x = 3;` at
+the start of the inlined body, and enum values have become constants, so
+many variables hold values known at compile time. This pass finds them and
+substitutes them into the expressions using them, folds operations on
+constants, and resolves if statements and loops whose conditions become
+constant.
+
+The analysis is conditional: branches that cannot be taken given the values
+known so far are not analysed, so assignments in them do not spoil those
+values, and loops are analysed until the values at their start stop
+changing. A value is only substituted where it is the same every time the
+expression is reached. Variables of the engine, such as unit, are never
+known, and neither are script variables a code literal mentions after it.
+
+Integer operations follow the C semantics of Rescript (division rounds
+towards zero) and are only folded while the result fits in 32 bits. Calls of
+pure intrinsics with a constant evaluator, such as max, are folded too.
+"""
+from redux.ast import (Constant, VarRef, NegateOp, BitwiseNotOp, LogicalNotOp,
+                       AddOp, SubOp, MulOp, DivOp, ModuloOp, BitwiseOrOp,
+                       BitwiseXorOp, BitwiseAndOp, BitwiseLeftShiftOp,
+                       BitwiseRightShiftOp, LessThanOp, GreaterThanOp,
+                       LessThanOrEqualToOp, GreaterThanOrEqualToOp, EqualToOp,
+                       NotEqualToOp, LogicalAndOp, LogicalOrOp, BinaryOp,
+                       UnaryOp, FunctionCall)
+from redux.intrinsics import IntrinsicFunction
+from redux.symtab import Scope
+from redux.types import int_, float_
+from redux.visitor import ASTTransformer, ASTVisitor
+import re
+
+
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
+
+# Recorded for expressions and conditions that do not always have the same
+# constant value.
+VARYING = "varying"
+
+
+def c_div(a, b):
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+
+def c_mod(a, b):
+    return a - b * c_div(a, b)
+
+
+def shift_left(a, b):
+    if a < 0 or not 0 <= b < 32:
+        return None
+    return a << b
+
+
+def shift_right(a, b):
+    if a < 0 or not 0 <= b < 32:
+        return None
+    return a >> b
+
+
+INT_OPERATIONS = {
+    AddOp: lambda a, b: a + b,
+    SubOp: lambda a, b: a - b,
+    MulOp: lambda a, b: a * b,
+    DivOp: lambda a, b: c_div(a, b) if b else None,
+    ModuloOp: lambda a, b: c_mod(a, b) if b else None,
+    BitwiseOrOp: lambda a, b: a | b,
+    BitwiseXorOp: lambda a, b: a ^ b,
+    BitwiseAndOp: lambda a, b: a & b,
+    BitwiseLeftShiftOp: shift_left,
+    BitwiseRightShiftOp: shift_right,
+}
+
+# Comparisons and connectives, which yield 0 or 1 for ints and floats.
+CONDITIONS = {
+    LessThanOp: lambda a, b: a < b,
+    GreaterThanOp: lambda a, b: a > b,
+    LessThanOrEqualToOp: lambda a, b: a <= b,
+    GreaterThanOrEqualToOp: lambda a, b: a >= b,
+    EqualToOp: lambda a, b: a == b,
+    NotEqualToOp: lambda a, b: a != b,
+    LogicalAndOp: lambda a, b: bool(a) and bool(b),
+    LogicalOrOp: lambda a, b: bool(a) or bool(b),
+}
+
+
+def fold(expr, operands):
+    """Computes the value of an operation from the values of its operands.
+
+    Values are (type, value) pairs, as 1 and 1.0 are different constants.
+    Returns None if the result is not known or not representable.
+    """
+    if any(operand is None for operand in operands):
+        return None
+    types = [type_ for type_, _ in operands]
+    values = [value for _, value in operands]
+
+    result = None
+    if type(expr) in CONDITIONS:
+        result = int(CONDITIONS[type(expr)](*values))
+    elif type(expr) in INT_OPERATIONS and types == [int_, int_]:
+        result = INT_OPERATIONS[type(expr)](*values)
+    elif isinstance(expr, LogicalNotOp):
+        result = int(not values[0])
+    elif isinstance(expr, NegateOp) and types == [int_]:
+        result = -values[0]
+    elif isinstance(expr, BitwiseNotOp) and types == [int_]:
+        result = ~values[0]
+    elif isinstance(expr, FunctionCall) and expr.type is int_:
+        intrinsic = getattr(expr, "func_def", None)
+        if (isinstance(intrinsic, IntrinsicFunction) and intrinsic.pure and
+            intrinsic.evaluate is not None):
+            result = intrinsic.evaluate(*values)
+
+    if result is None or not INT_MIN <= result <= INT_MAX:
+        return None
+    return (int_, result)
+
+
+def constant_value(expr):
+    """Returns the (type, value) of a literal, possibly negated, or None."""
+    if isinstance(expr, Constant) and expr.type in (int_, float_):
+        return (expr.type, expr.value)
+    if isinstance(expr, NegateOp) and isinstance(expr.expression, Constant):
+        return fold(expr, [constant_value(expr.expression)])
+    return None
+
+
+def make_constant(value):
+    type_, value = value
+    if value < 0:
+        # Emitted as (-n) instead of a literal the lexer would split.
+        negation = NegateOp(Constant(-value, type_))
+        negation.type = type_
+        return negation
+    return Constant(value, type_)
+
+
+def join(*envs):
+    """Keeps the values all reachable environments agree on."""
+    envs = [env for env in envs if env is not None]
+    if not envs:
+        return None
+    result = dict(envs[0])
+    for env in envs[1:]:
+        for key, value in list(result.items()):
+            if env.get(key) != value:
+                del result[key]
+    return result
+
+
+class ConstantAnalysis(ASTVisitor):
+    """Finds the values of variables and conditions of a lowered script.
+
+    Environments map declarations, by id(), to the (type, value) of the
+    variable they declare; None stands for code that cannot be reached. Every visit of a
+    statement takes the environment before it and returns the one after it.
+    The value of every variable reference and the outcome of every condition
+    reached is recorded in facts, by id() of the node.
+    """
+    def __init__(self):
+        super(ConstantAnalysis, self).__init__()
+        self.scope = Scope()
+        self.facts = {}
+        self.break_envs = []
+
+    def push_scope(self):
+        self.scope = self.scope.child()
+
+    def pop_scope(self):
+        self.scope = self.scope.parent
+
+    def record(self, node, value):
+        if value is None or self.facts.get(id(node), value) != value:
+            value = VARYING
+        self.facts[id(node)] = value
+
+    def declaration(self, name):
+        try:
+            return self.scope.lookup(name)
+        except KeyError:
+            return None
+
+    def value(self, expr, env):
+        """Returns the value of an expression, or None if not known."""
+        if isinstance(expr, VarRef):
+            value = env.get(self.declaration(expr.name))
+            self.record(expr, value)
+            return value
+        elif isinstance(expr, Constant):
+            return constant_value(expr)
+
+        operands = [self.value(child, env) for child in expr.children()
+                    if child is not None]
+        if isinstance(expr, (BinaryOp, UnaryOp, FunctionCall)):
+            return fold(expr, operands)
+        return None
+
+    def visit_Block(self, block, env):
+        self.push_scope()
+        for stmt in block.statements:
+            if env is None:
+                break
+            env = self.visit(stmt, env)
+        self.pop_scope()
+        return env
+
+    def visit_Stmt(self, stmt, env):
+        for child in stmt.children():
+            if child is not None:
+                self.value(child, env)
+        return env
+
+    def visit_FunctionDefinition(self, func_def, env):
+        return env
+
+    def assign(self, env, key, value):
+        env = dict(env)
+        if value is None:
+            env.pop(key, None)
+        else:
+            env[key] = value
+        return env
+
+    def visit_Assignment(self, assignment, env):
+        value = self.value(assignment.expression, env)
+        if assignment.declare is True:
+            key = id(assignment)
+            self.scope.define(assignment.variable.name, key)
+        else:
+            key = self.declaration(assignment.variable.name)
+            if key is None:
+                return env
+        return self.assign(env, key, value)
+
+    def visit_BitfieldAssignment(self, assignment, env):
+        self.value(assignment.expression, env)
+        key = self.declaration(assignment.variable.expression.name)
+        return self.assign(env, key, None)
+
+    def visit_CodeLiteral(self, code_literal, env):
+        for name in set(re.findall(r"\w+", code_literal.code)):
+            key = self.declaration(name)
+            if key is not None:
+                env = self.assign(env, key, None)
+        return env
+
+    def visit_BreakStmt(self, break_stmt, env):
+        self.break_envs[-1].append(env)
+        return None
+
+    def condition(self, node, condition, env):
+        """Returns whether a condition holds, or None if not known."""
+        value = self.value(condition, env)
+        outcome = None if value is None else bool(value[1])
+        self.record(node, outcome)
+        return outcome
+
+    def visit_IfStmt(self, if_stmt, env):
+        outcome = self.condition(if_stmt, if_stmt.condition, env)
+        then_env = else_env = None
+        if outcome is not False:
+            then_env = self.visit(if_stmt.then_block, env)
+        if outcome is not True:
+            if if_stmt.else_part is not None:
+                else_env = self.visit(if_stmt.else_part, env)
+            else:
+                else_env = env
+        return join(then_env, else_env)
+
+    def loop(self, loop, env, body):
+        """Analyses a loop until the values at its start are stable.
+
+        body analyses one iteration, from checking the condition on, and
+        returns whether the condition may be false and the environment at
+        the end of the iteration.
+        """
+        while True:
+            self.break_envs.append([])
+            may_exit, end_env = body(env)
+            break_envs = self.break_envs.pop()
+            next_env = join(env, end_env)
+            if next_env == env:
+                break
+            env = next_env
+        return join(*(break_envs + [env if may_exit else None]))
+
+    def visit_WhileStmt(self, while_stmt, env):
+        def body(env):
+            outcome = self.condition(while_stmt, while_stmt.condition, env)
+            if outcome is False:
+                return True, None
+            return outcome is None, self.visit(while_stmt.block, env)
+
+        return self.loop(while_stmt, env, body)
+
+    def visit_ForStmt(self, for_stmt, env):
+        def body(env):
+            outcome = True
+            if for_stmt.condition is not None:
+                outcome = self.condition(for_stmt, for_stmt.condition, env)
+            if outcome is False:
+                return True, None
+            env = self.visit(for_stmt.block, env)
+            if env is not None and for_stmt.step_expr is not None:
+                env = self.visit(for_stmt.step_expr, env)
+            return outcome is None, env
+
+        self.push_scope()
+        env = self.visit(for_stmt.assignment, env)
+        env = self.loop(for_stmt, env, body)
+        self.pop_scope()
+        return env
+
+
+class ConstantPropagator(ASTTransformer):
+    """Substitutes and folds the constants of a lowered script."""
+    def __init__(self):
+        super(ConstantPropagator, self).__init__()
+        self.analysis = ConstantAnalysis()
+        self.substituted = 0
+        self.folded = 0
+        self.resolved = 0
+
+    def visit_Block(self, block):
+        if self.depth == 1:
+            self.analysis.visit(block, {})
+        return super(ConstantPropagator, self).visit_Block(block)
+
+    def visit_FunctionDefinition(self, func_def):
+        return func_def
+
+    def visit_VarRef(self, var_ref):
+        value = self.analysis.facts.get(id(var_ref))
+        if value is None or value is VARYING:
+            return var_ref
+        self.substituted += 1
+        return make_constant(value)
+
+    def visit_Assignment(self, assignment):
+        assignment.expression = self.visit(assignment.expression)
+        return assignment
+
+    def visit_BitfieldAssignment(self, assignment):
+        return self.visit_Assignment(assignment)
+
+    def visit_operation(self, expr):
+        expr = self.generic_visit(expr)
+        operands = [constant_value(child) for child in expr.children()]
+        value = fold(expr, operands)
+        if value is None or constant_value(expr) is not None:
+            return expr
+        self.folded += 1
+        return make_constant(value)
+
+    def visit_BinaryOp(self, binop):
+        return self.visit_operation(binop)
+
+    def visit_UnaryOp(self, unop):
+        return self.visit_operation(unop)
+
+    def visit_FunctionCall(self, func_call):
+        return self.visit_operation(func_call)
+
+    def outcome(self, node):
+        outcome = self.analysis.facts.get(id(node))
+        return None if outcome is VARYING else outcome
+
+    def visit_IfStmt(self, if_stmt):
+        outcome = self.outcome(if_stmt)
+        if_stmt = self.generic_visit(if_stmt)
+        if outcome is None:
+            return if_stmt
+        self.resolved += 1
+        if outcome:
+            return if_stmt.then_block
+        return if_stmt.else_part
+
+    def visit_WhileStmt(self, while_stmt):
+        if self.outcome(while_stmt) is False:
+            self.resolved += 1
+            return None
+        return self.generic_visit(while_stmt)
+
+    def visit_ForStmt(self, for_stmt):
+        if self.outcome(for_stmt) is False:
+            self.resolved += 1
+            # Only the initialization runs. A variable it declares belongs to
+            # the enclosing block, like that of the loop did.
+            return self.visit(for_stmt.assignment)
+        return self.generic_visit(for_stmt)
+
+    def report(self):
+        return {"substituted": self.substituted, "folded": self.folded,
+                "resolved": self.resolved}
+
+
+def format_report(report):
+    return ("%d use(s) of constant variables substituted, %d operation(s) "
+            "folded, %d condition(s) resolved\n" % (
+                report["substituted"], report["folded"], report["resolved"]))
@@ -0,0 +1,342 @@
+"""Copy propagation and coalescing of the copies made by call inlining.
+
+Inlining `y = f(a)` produces
+
+    int __retval0 = 0;
+    {
+    int x = a;
+    __retval0 = (x*x);
+    }
+    int y = __retval0;
+
+This pass removes the copies and temporaries involved, repeatedly applying
+these rewrites to every statement list until none applies:
+
+- a declaration copying a script variable, `int x = a;`, is dropped and x
+  replaced by a, if neither is assigned in the rest of the block;
+- a temporary assigned once at the end of the block after its declaration
+  and copied once right after that block is replaced by the variable it is
+  copied to;
+- blocks declaring nothing are spliced into the enclosing block;
+- declarations of variables nothing uses are dropped if evaluating their
+  value has no effect;
+- a declaration immediately overwritten, `int y = 0; y = E;`, becomes
+  `int y = E;`.
+
+Uses are counted by name, which is conservative where names are shadowed.
+Variables whose name appears in a code literal are never touched.
+"""
+from collections import Counter
+from redux.ast import Assignment, Block, IfStmt, VarRef
+from redux.attributes import synthesize_attributes
+from redux.conditionorder import is_movable
+from redux.visitor import ASTTransformer, ASTVisitor
+import re
+
+
+TEMPORARY_PREFIX = "__retval"
+
+
+class NameCounter(ASTVisitor):
+    """Counts the uses and non-declaring assignments of every name."""
+    def __init__(self):
+        super(NameCounter, self).__init__()
+        self.uses = Counter()
+        self.assignments = Counter()
+        self.declared = set()
+        self.literal_names = set()
+
+    def visit_VarRef(self, var_ref):
+        self.uses[var_ref.name] += 1
+
+    def visit_Assignment(self, assignment):
+        if assignment.declare is True:
+            self.declared.add(assignment.variable.name)
+        else:
+            self.assignments[assignment.variable.name] += 1
+        self.visit(assignment.expression)
+
+    def visit_BitfieldAssignment(self, assignment):
+        self.assignments[assignment.variable.expression.name] += 1
+        self.generic_visit(assignment)
+
+    def visit_CodeLiteral(self, code_literal):
+        self.literal_names.update(re.findall(r"\w+", code_literal.code))
+
+
+def count_names(node):
+    counter = NameCounter()
+    counter.visit(node)
+    return counter
+
+
+class NameFinder(ASTVisitor):
+    """Finds whether a name is assigned, declared or read in a subtree."""
+    def __init__(self, name):
+        super(NameFinder, self).__init__()
+        self.name = name
+        self.assigned = False
+        self.declared = False
+        self.read = False
+
+    def visit_VarRef(self, var_ref):
+        if var_ref.name == self.name:
+            self.read = True
+
+    def visit_Assignment(self, assignment):
+        if assignment.variable.name == self.name:
+            if assignment.declare is True:
+                self.declared = True
+            else:
+                self.assigned = True
+        self.visit(assignment.expression)
+
+    def visit_BitfieldAssignment(self, assignment):
+        if assignment.variable.expression.name == self.name:
+            self.assigned = True
+        self.generic_visit(assignment)
+
+    def visit_CodeLiteral(self, code_literal):
+        # Code literals are opaque, so assume they may read and write it.
+        if self.name in re.findall(r"\w+", code_literal.code):
+            self.read = self.assigned = True
+
+
+def find_name(name, nodes):
+    finder = NameFinder(name)
+    for node in nodes:
+        finder.visit(node)
+    return finder
+
+
+class CopySubstituter(ASTTransformer):
+    """Replaces the uses of a variable with another one, up to where a
+    nested block declares a variable of the same name."""
+    def __init__(self, name, source):
+        super(CopySubstituter, self).__init__()
+        self.name = name
+        self.source = source
+        self.shadowed = False
+        self.substituted = 0
+
+    def visit_Block(self, block):
+        shadowed = self.shadowed
+        self.generic_visit(block)
+        self.shadowed = shadowed
+        return block
+
+    def visit_ForStmt(self, for_stmt):
+        shadowed = self.shadowed
+        self.generic_visit(for_stmt)
+        self.shadowed = shadowed
+        return for_stmt
+
+    def visit_Assignment(self, assignment):
+        assignment.expression = self.visit(assignment.expression)
+        if assignment.declare is True and assignment.variable.name == self.name:
+            self.shadowed = True
+        return assignment
+
+    def visit_BitfieldAssignment(self, assignment):
+        return self.generic_visit(assignment)
+
+    def visit_VarRef(self, var_ref):
+        if var_ref.name != self.name or self.shadowed:
+            return var_ref
+        self.substituted += 1
+        copy = VarRef(self.source.name)
+        copy.type = self.source.type
+        return copy
+
+
+def is_declaration(stmt):
+    return type(stmt) is Assignment and stmt.declare is True
+
+
+def declares(stmt):
+    """Whether a statement declares a variable in the enclosing block."""
+    if is_declaration(stmt):
+        return True
+    # For loop declarations belong to the enclosing block.
+    return is_declaration(getattr(stmt, "assignment", None))
+
+
+class CopyPropagator(ASTTransformer):
+    """Removes parameter copies and return temporaries of a lowered script."""
+    def __init__(self):
+        super(CopyPropagator, self).__init__()
+        self.names = None
+        self.changed = False
+        self.propagated = 0
+        self.coalesced = 0
+        self.spliced = 0
+        self.removed = 0
+
+    def visit_Block(self, block):
+        self.names = count_names(block)
+        # Inlining left the attributes of expressions holding calls stale.
+        synthesize_attributes(block, refresh=True)
+        self.changed = True
+        while self.changed:
+            self.changed = False
+            self.optimize(block.statements)
+        return block
+
+    def untouchable(self, name):
+        return name in self.names.literal_names
+
+    def forget_uses(self, expr):
+        self.names.uses.subtract(count_names(expr).uses)
+
+    def optimize(self, statements):
+        for stmt in statements:
+            if type(stmt) is Block:
+                self.optimize(stmt.statements)
+            elif isinstance(stmt, IfStmt):
+                self.optimize(stmt.then_block.statements)
+                if stmt.else_part is not None:
+                    self.optimize(stmt.else_part.statements)
+            elif hasattr(stmt, "block"):
+                self.optimize(stmt.block.statements)
+
+        rewrites = [self.propagate_copy, self.coalesce_temporary,
+                    self.splice_block, self.remove_declaration,
+                    self.merge_declaration]
+        index = 0
+        while index < len(statements):
+            for rewrite in rewrites:
+                if rewrite(statements, index):
+                    self.changed = True
+                    # Earlier statements may now match as well.
+                    index = max(0, index - 2)
+                    break
+            else:
+                index += 1
+
+    def propagate_copy(self, statements, index):
+        """int x = a; ... x ... -> ... a ..."""
+        stmt = statements[index]
+        if not is_declaration(stmt) or type(stmt.expression) is not VarRef:
+            return False
+        name = stmt.variable.name
+        source = stmt.expression
+        if (source.name == name or source.name not in self.names.declared or
+            self.untouchable(name) or self.untouchable(source.name)):
+            return False
+
+        rest = statements[index + 1:]
+        if find_name(name, rest).assigned:
+            return False
+        source_uses = find_name(source.name, rest)
+        if source_uses.assigned or source_uses.declared:
+            return False
+
+        substituter = CopySubstituter(name, source)
+        for stmt in rest:
+            substituter.visit(stmt)
+        self.names.uses[name] -= substituter.substituted
+        self.names.uses[source.name] += substituter.substituted - 1
+        del statements[index]
+        self.propagated += 1
+        return True
+
+    def coalesce_temporary(self, statements, index):
+        """int t = 0; { ... t = E; } y = t; -> { ... y = E; }"""
+        if index + 2 >= len(statements):
+            return False
+        declaration, block, copy = statements[index:index + 3]
+        if (not is_declaration(declaration) or type(block) is not Block or
+            not block.statements or type(copy) is not Assignment or
+            type(copy.expression) is not VarRef):
+            return False
+        name = declaration.variable.name
+        target = copy.variable.name
+        last = block.statements[-1]
+        if (not name.startswith(TEMPORARY_PREFIX) or
+            copy.expression.name != name or target == name or
+            type(last) is not Assignment or last.declare is True or
+            last.variable.name != name or self.names.uses[name] != 1 or
+            self.names.assignments[name] != 1 or self.untouchable(target)):
+            return False
+        target_uses = find_name(target, [block])
+        if target_uses.assigned or target_uses.declared:
+            return False
+        if copy.declare is True and target_uses.read:
+            return False
+
+        block.statements[-1] = Assignment(copy.variable, last.expression)
+        if copy.declare is True:
+            statements[index] = Assignment(copy.variable,
+                                           declaration.expression, True)
+            self.names.assignments[target] += 1
+            del statements[index + 2]
+        else:
+            del statements[index + 2]
+            del statements[index]
+            self.forget_uses(declaration.expression)
+        self.names.uses[name] -= 1
+        self.names.assignments[name] -= 1
+        self.coalesced += 1
+        return True
+
+    def splice_block(self, statements, index):
+        """{ no declarations } -> no declarations"""
+        block = statements[index]
+        if type(block) is not Block:
+            return False
+        if any(declares(stmt) for stmt in block.statements):
+            return False
+        statements[index:index + 1] = block.statements
+        self.spliced += 1
+        return True
+
+    def remove_declaration(self, statements, index):
+        """int x = E; with x unused -> nothing"""
+        stmt = statements[index]
+        if not is_declaration(stmt):
+            return False
+        name = stmt.variable.name
+        if (self.names.uses[name] or self.names.assignments[name] or
+            self.untouchable(name) or not is_movable(stmt.expression)):
+            return False
+        del statements[index]
+        self.forget_uses(stmt.expression)
+        self.removed += 1
+        return True
+
+    def merge_declaration(self, statements, index):
+        """int y = C; y = E; -> int y = E;"""
+        if index + 1 >= len(statements):
+            return False
+        declaration, assignment = statements[index:index + 2]
+        if (not is_declaration(declaration) or
+            type(assignment) is not Assignment or
+            assignment.declare is True or
+            assignment.variable.name != declaration.variable.name or
+            assignment.expression.type is not declaration.expression.type or
+            not is_movable(declaration.expression)):
+            return False
+        if find_name(declaration.variable.name, [assignment.expression]).read:
+            return False
+
+        statements[index] = Assignment(declaration.variable,
+                                       assignment.expression, True)
+        del statements[index + 1]
+        self.forget_uses(declaration.expression)
+        self.names.assignments[declaration.variable.name] -= 1
+        self.removed += 1
+        return True
+
+    def report(self):
+        return {"propagated": self.propagated, "coalesced": self.coalesced,
+                "spliced": self.spliced, "removed": self.removed}
+
+
+def format_report(report):
+    return ("%d cop%s propagated, %d temporar%s coalesced, %d block(s) "
+            "spliced, %d declaration(s) removed\n" % (
+                report["propagated"],
+                "y" if report["propagated"] == 1 else "ies",
+                report["coalesced"],
+                "y" if report["coalesced"] == 1 else "ies",
+                report["spliced"], report["removed"]))
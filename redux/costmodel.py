@@ -0,0 +1,327 @@
+from collections import Counter
+from redux.ast import BitfieldDefinition
+from redux.intrinsics import IntrinsicFunction, get_intrinsic_functions
+from redux.loops import induction_values
+from redux.types import float_
+from redux.visitor import ASTVisitor
+
+
+DEFAULT_WEIGHTS = {
+    "statement": 1,
+    "assignment": 1,
+    "branch": 1,
+    "loop_iteration": 1,
+    "int_op": 1,
+    "float_op": 2,
+    "dotted_access": 1,
+    "class_access": 2,
+    "chronal_access": 4,
+    "intrinsic_call": 0,
+    "af_get": 40,
+    "af_set": 40,
+    "perform": 40,
+    "query": 20,
+}
+
+# Estimated number of units a QUERY inspects, i.e. how many times its WHERE
+# clause and operation expression get evaluated.
+DEFAULT_QUERY_CANDIDATES = 16
+
+# Loops with more iterations than this are treated as unbounded.
+MAX_TRIP_COUNT = 1000000
+
+
+class CostModel(object):
+    """Relative costs of the operations performed by generated code."""
+    def __init__(self, weights=None, intrinsics=None, query_candidates=None):
+        super(CostModel, self).__init__()
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self.weights.update(weights or {})
+        # Intrinsics declare their own cost; see redux.intrinsics.
+        self.intrinsics = dict((name, intrinsic.cost) for name, intrinsic
+                               in get_intrinsic_functions())
+        self.intrinsics.update(intrinsics or {})
+        if query_candidates is None:
+            query_candidates = DEFAULT_QUERY_CANDIDATES
+        self.query_candidates = query_candidates
+
+    @classmethod
+    def from_json(cls, config):
+        """Creates a cost model from a dict loaded from a JSON config."""
+        return cls(config.get("weights"), config.get("intrinsics"),
+                   config.get("query_candidates"))
+
+    def intrinsic_cost(self, name):
+        return self.intrinsics.get(name, 1)
+
+
+class Cost(object):
+    """Operation counts for a piece of code, plus loop nesting information."""
+    def __init__(self, counts=None, unbounded=False, loop_depth=0):
+        super(Cost, self).__init__()
+        self.counts = Counter(counts or {})
+        self.unbounded = unbounded
+        self.loop_depth = loop_depth
+
+    def __add__(self, other):
+        return Cost(self.counts + other.counts,
+                    self.unbounded or other.unbounded,
+                    max(self.loop_depth, other.loop_depth))
+
+    def __mul__(self, factor):
+        return Cost(dict((key, count * factor)
+                         for key, count in self.counts.items()),
+                    self.unbounded, self.loop_depth)
+
+    def total(self, model):
+        total = 0
+        for key, count in self.counts.items():
+            if key.startswith("intrinsic:"):
+                total += count * model.intrinsic_cost(key[len("intrinsic:"):])
+            else:
+                total += count * model.weights.get(key, 1)
+        return total
+
+
+def worst(model, a, b):
+    """Returns the more expensive of two alternative costs."""
+    if (a.unbounded, a.total(model)) >= (b.unbounded, b.total(model)):
+        chosen = a
+    else:
+        chosen = b
+    return Cost(chosen.counts, a.unbounded or b.unbounded,
+                max(a.loop_depth, b.loop_depth))
+
+
+class CostEstimator(ASTVisitor):
+    """Estimates worst-case execution cost of a type-annotated AST."""
+    def __init__(self, model):
+        super(CostEstimator, self).__init__()
+        self.model = model
+        self.function_costs = {}
+
+    def visit_all(self, nodes):
+        cost = Cost()
+        for node in nodes:
+            if node is not None:
+                cost += self.visit(node)
+        return cost
+
+    def generic_visit(self, node):
+        return self.visit_all(node.children())
+
+    def visit_Block(self, block):
+        return self.visit_all(block.statements)
+
+    def visit_Stmt(self, stmt):
+        return Cost({"statement": 1}) + self.generic_visit(stmt)
+
+    def visit_FunctionDefinition(self, func_def):
+        # Definitions cost nothing until called; the typed body is estimated
+        # at every call site.
+        return Cost()
+
+    def visit_EnumDefinition(self, enum_def):
+        return Cost()
+
+    def visit_BitfieldDefinition(self, bitfield_def):
+        return Cost()
+
+    def visit_Assignment(self, assignment):
+        return (Cost({"assignment": 1}) +
+                self.visit(assignment.expression))
+
+    def visit_BitfieldAssignment(self, assignment):
+        return (Cost({"assignment": 1, "dotted_access": 1}) +
+                self.visit(assignment.expression))
+
+    def visit_CodeLiteral(self, code_literal):
+        performs = code_literal.code.count("PERFORM")
+        return Cost({"statement": 1, "perform": performs})
+
+    def visit_IfStmt(self, if_stmt):
+        cost = Cost({"branch": 1}) + self.visit(if_stmt.condition)
+        then_cost = self.visit(if_stmt.then_block)
+        if if_stmt.else_part is not None:
+            else_cost = self.visit(if_stmt.else_part)
+        else:
+            else_cost = Cost()
+        return cost + worst(self.model, then_cost, else_cost)
+
+    def loop_body(self, cost):
+        return Cost(cost.counts + Counter({"loop_iteration": 1}),
+                    cost.unbounded, cost.loop_depth + 1)
+
+    def visit_WhileStmt(self, while_stmt):
+        iteration = self.loop_body(self.visit(while_stmt.condition) +
+                                   self.visit(while_stmt.block))
+        iteration.unbounded = True
+        return iteration
+
+    def visit_ForStmt(self, for_stmt):
+        init = self.visit(for_stmt.assignment)
+        condition = self.visit_all([for_stmt.condition])
+        iteration = self.loop_body(self.visit(for_stmt.block) +
+                                   self.visit_all([for_stmt.step_expr]) +
+                                   condition)
+
+        values = induction_values(for_stmt, MAX_TRIP_COUNT)
+        if values is None:
+            iteration.unbounded = True
+            return init + condition + iteration
+
+        trips = len(values) - 1
+        if trips == 0:
+            # The body never runs, but nesting still shows in the report.
+            return init + condition + Cost(loop_depth=iteration.loop_depth)
+        return init + condition + iteration * trips
+
+    def visit_FunctionCall(self, func_call):
+        cost = self.visit_all(func_call.arguments)
+        func_def = func_call.func_def
+
+        if isinstance(func_def, IntrinsicFunction):
+            return cost + Cost({"intrinsic:" + func_def.name: 1})
+        elif isinstance(func_def, BitfieldDefinition):
+            return cost
+        elif func_def.name == "__get_achronal_field":
+            return cost + Cost({"af_get": 1})
+        elif func_def.name == "__set_achronal_field":
+            return cost + Cost({"af_set": 1})
+
+        body = (Cost({"assignment": len(func_call.arguments)}) +
+                self.visit(func_def.block))
+        previous = self.function_costs.get(func_def.name)
+        if previous is None:
+            self.function_costs[func_def.name] = (body, 1)
+        else:
+            self.function_costs[func_def.name] = (
+                worst(self.model, previous[0], body), previous[1] + 1)
+        return cost + body
+
+    def visit_VarRef(self, var_ref):
+        return Cost()
+
+    def visit_Constant(self, constant):
+        return Cost()
+
+    def visit_NoOp(self, noop):
+        return Cost()
+
+    def operation(self, node, operands):
+        if any(operand.type is float_ for operand in operands):
+            kind = "float_op"
+        else:
+            kind = "int_op"
+        return Cost({kind: 1}) + self.visit_all(operands)
+
+    def visit_BinaryOp(self, binop):
+        return self.operation(binop, [binop.lhs, binop.rhs])
+
+    def visit_UnaryOp(self, unop):
+        return self.operation(unop, [unop.expression])
+
+    def visit_DottedAccess(self, dotted_access):
+        return (Cost({"dotted_access": 1}) +
+                self.visit(dotted_access.expression))
+
+    def visit_ChronalAccess(self, chronal_access):
+        return (Cost({"chronal_access": 1}) +
+                self.visit(chronal_access.object))
+
+    def visit_ClassAccess(self, class_access):
+        return Cost({"class_access": 1}) + self.visit(class_access.class_)
+
+    def visit_Query(self, query):
+        per_candidate = (self.visit(query.op_expr) +
+                         self.visit(query.where_cond))
+        return (Cost({"query": 1}) + self.visit(query.unit) +
+                per_candidate * self.model.query_candidates)
+
+
+class CostReport(object):
+    """Per-statement and per-function cost estimates for a script."""
+    def __init__(self, filename, model, statements, functions):
+        super(CostReport, self).__init__()
+        self.filename = filename
+        self.model = model
+        self.statements = statements
+        self.functions = functions
+
+    @property
+    def total(self):
+        cost = Cost()
+        for _, _, statement_cost in self.statements:
+            cost += statement_cost
+        return cost
+
+    def to_json(self):
+        def cost_json(cost):
+            return {"cost": cost.total(self.model),
+                    "unbounded": cost.unbounded,
+                    "loop_depth": cost.loop_depth,
+                    "counts": dict(cost.counts)}
+
+        statements = []
+        for index, description, cost in self.statements:
+            entry = cost_json(cost)
+            entry.update(index=index, statement=description)
+            statements.append(entry)
+
+        functions = {}
+        for name, (cost, calls) in sorted(self.functions.items()):
+            entry = cost_json(cost)
+            entry.update(calls=calls)
+            functions[name] = entry
+
+        total = cost_json(self.total)
+        return {"filename": self.filename, "statements": statements,
+                "functions": functions, "total": total}
+
+    def format(self):
+        def bound(cost):
+            total = cost.total(self.model)
+            return ">= %d" % total if cost.unbounded else "%d" % total
+
+        lines = ["cost report for %s" % self.filename,
+                 "%5s  %-36s %12s %5s" % ("#", "statement", "cost", "loops")]
+        for index, description, cost in self.statements:
+            lines.append("%5d  %-36s %12s %5d" % (index, description,
+                                                bound(cost), cost.loop_depth))
+
+        if self.functions:
+            lines.append("functions (cost per call):")
+            for name, (cost, calls) in sorted(self.functions.items()):
+                lines.append("       %-36s %12s %5d  (%d call site%s)" % (
+                    name, bound(cost), cost.loop_depth, calls,
+                    "" if calls == 1 else "s"))
+
+        total = self.total
+        lines.append("total: %s%s" % (bound(total),
+                                      " (unbounded loops)" if total.unbounded else ""))
+        return "\n".join(lines) + "\n"
+
+
+def describe_statement(stmt):
+    name = type(stmt).__name__
+    if hasattr(stmt, "variable") and hasattr(stmt.variable, "name"):
+        return "%s %s" % (name, stmt.variable.name)
+    if hasattr(stmt, "expression") and hasattr(stmt.expression, "function"):
+        return "%s %s()" % (name, stmt.expression.function)
+    if hasattr(stmt, "name"):
+        return "%s %s" % (name, stmt.name)
+    return name
+
+
+def estimate_cost(filename, ast_, model=None):
+    """Builds a cost report for a type-annotated AST."""
+    if model is None:
+        model = CostModel()
+
+    estimator = CostEstimator(model)
+    statements = []
+    for index, stmt in enumerate(ast_.statements, 1):
+        cost = estimator.visit(stmt)
+        statements.append((index, describe_statement(stmt), cost))
+
+    return CostReport(filename, model, statements, estimator.function_costs)
@@ -0,0 +1,296 @@
+"""Lowering of if/elif chains over constants into decision trees.
+
+State machines test one value against one enum constant after another:
+
+    if state == idle ... elif state == moving ... elif state == fleeing ...
+
+so the last arms and the else block only run after a comparison per arm.
+When every condition of a chain compares the same movable int expression
+with distinct constants, possibly several or-ed together, the arm to run
+only depends on which range of values the expression falls in, and
+DecisionTreeLowerer finds it with a binary search over those ranges instead:
+
+    if state < moving
+        ...arm of idle...
+    else
+        if state < fleeing ...
+
+Bounds known from the tests above a leaf are not tested again, so where
+the values of consecutive arms leave no gap between them, as enum constants
+do, a leaf runs its arm without any further comparison.
+
+A chain is only lowered if the tree takes fewer comparisons on average
+than the chain, weighting each arm by how often a profile saw it taken
+(see redux.profile) or all alike. An expression other than a variable is
+evaluated once into a temporary. An arm whose values are not contiguous,
+and the else block, may be needed in several leaves. Small ones are copied;
+a larger else block runs once after the tree when a flag says no arm did,
+and a chain with a larger such arm is left alone.
+"""
+from copy import deepcopy
+from redux.ast import (Assignment, BitfieldDefinition, Block, EqualToOp,
+                       GreaterThanOrEqualToOp, IfStmt, LessThanOp,
+                       LessThanOrEqualToOp, LogicalAndOp, LogicalOrOp, VarRef)
+from redux.attributes import attributes
+from redux.constprop import make_constant
+from redux.loops import int_constant_value
+from redux.passstats import count_nodes
+from redux.types import int_
+from redux.visitor import ASTTransformer
+
+
+# Largest AST node count of an arm or else block copied into several leaves.
+DUPLICATION_LIMIT = 12
+
+
+def if_chain(if_stmt):
+    """Returns the arms of the if/elif chain starting at if_stmt, the
+    IfStmts whose condition is tested in turn, and its final else block or
+    None."""
+    arms = [if_stmt]
+    else_part = if_stmt.else_part
+    while (else_part is not None and len(else_part.statements) == 1 and
+           isinstance(else_part.statements[0], IfStmt)):
+        arms.append(else_part.statements[0])
+        else_part = arms[-1].else_part
+    return arms, else_part
+
+
+def equality_tests(condition):
+    """Returns (subject, values) if condition holds exactly when an
+    expression equals one of a list of int constants, else None."""
+    if isinstance(condition, LogicalOrOp):
+        lhs = equality_tests(condition.lhs)
+        rhs = equality_tests(condition.rhs)
+        if lhs is None or rhs is None or lhs[0] != rhs[0]:
+            return None
+        return lhs[0], lhs[1] + rhs[1]
+    if isinstance(condition, EqualToOp):
+        for subject, other in [(condition.lhs, condition.rhs),
+                               (condition.rhs, condition.lhs)]:
+            value = int_constant_value(other)
+            if value is not None and int_constant_value(subject) is None:
+                return subject, [value]
+    return None
+
+
+def chain_cases(arms):
+    """Returns (subject, values of each arm) if at most one condition of an
+    if/elif chain can hold, as they compare the same movable expression
+    with distinct constants, else None."""
+    tests = [equality_tests(arm.condition) for arm in arms]
+    if any(test is None for test in tests):
+        return None
+    subject = tests[0][0]
+    values = [value for _, arm_values in tests for value in arm_values]
+    if (any(arm_subject != subject for arm_subject, _ in tests) or
+        len(set(values)) != len(values) or
+        not attributes(subject).movable):
+        return None
+    return subject, [arm_values for _, arm_values in tests]
+
+
+def value_ranges(cases):
+    """Merges the values of the arms into [low, high, arm index] ranges of
+    consecutive values of one arm, in increasing order."""
+    ranges = []
+    for value, index in sorted((value, index)
+                               for index, values in enumerate(cases)
+                               for value in values):
+        if ranges and ranges[-1][2] == index and ranges[-1][1] == value - 1:
+            ranges[-1][1] = value
+        else:
+            ranges.append([value, value, index])
+    return ranges
+
+
+def split_point(weights):
+    """Index splitting weights into two halves of closest total weight."""
+    total = sum(weights)
+    best, best_difference = 1, None
+    left = 0
+    for index in range(1, len(weights)):
+        left += weights[index - 1]
+        difference = abs(total - 2 * left)
+        if best_difference is None or difference < best_difference:
+            best, best_difference = index, difference
+    return best
+
+
+def leaf_tests(range_, low, high):
+    """Returns the (operator, value) comparisons telling whether the
+    subject is in range_, knowing it is at least low and at most high
+    unless they are None."""
+    range_low, range_high, _ = range_
+    below = low is None or low < range_low
+    above = high is None or high > range_high
+    if below and above and range_low == range_high:
+        return [(EqualToOp, range_low)]
+    tests = []
+    if below:
+        tests.append((GreaterThanOrEqualToOp, range_low))
+    if above:
+        tests.append((LessThanOrEqualToOp, range_high))
+    return tests
+
+
+def expected_tests(ranges, weights, low=None, high=None):
+    """Returns the weighted number of comparisons the decision tree over
+    ranges takes."""
+    if len(ranges) == 1:
+        return weights[0] * len(leaf_tests(ranges[0], low, high))
+    split = split_point(weights)
+    pivot = ranges[split][0]
+    return (sum(weights) +
+            expected_tests(ranges[:split], weights[:split], low, pivot - 1) +
+            expected_tests(ranges[split:], weights[split:], pivot, high))
+
+
+def as_block(stmt):
+    return stmt if isinstance(stmt, Block) else Block([stmt])
+
+
+def typed(node):
+    node.type = int_
+    return node
+
+
+class DecisionTreeLowerer(ASTTransformer):
+    """Replaces if/elif chains over constants by binary searches."""
+    def __init__(self):
+        super(DecisionTreeLowerer, self).__init__()
+        self.temporary_counter = 0
+        self.chains = 0
+        self.lowered = 0
+
+    def new_temporary(self, prefix):
+        temporary = typed(VarRef("%s%d" % (prefix, self.temporary_counter)))
+        self.temporary_counter += 1
+        return temporary
+
+    def visit_Expr(self, expr):
+        return expr
+
+    def visit_FunctionDefinition(self, func_def):
+        return func_def
+
+    def visit_IfStmt(self, if_stmt):
+        arms, else_part = if_chain(if_stmt)
+        for arm in arms:
+            arm.then_block = self.visit(arm.then_block)
+        if else_part is not None:
+            arms[-1].else_part = else_part = self.visit(else_part)
+
+        cases = chain_cases(arms)
+        if cases is None or not (cases[0].type is int_ or
+                                 isinstance(cases[0].type,
+                                            BitfieldDefinition)):
+            return if_stmt
+        subject, cases = cases
+        self.chains += 1
+
+        ranges = value_ranges(cases)
+        ranges_per_arm = [0] * len(arms)
+        for _, _, index in ranges:
+            ranges_per_arm[index] += 1
+        if any(count > 1 and count_nodes(arm.then_block) > DUPLICATION_LIMIT
+               for arm, count in zip(arms, ranges_per_arm)):
+            return if_stmt
+
+        if all(getattr(arm, "taken", None) is not None for arm in arms):
+            arm_weights = [arm.taken + 1.0 for arm in arms]
+        else:
+            arm_weights = [1.0] * len(arms)
+        weights = [arm_weights[index] / ranges_per_arm[index]
+                   for _, _, index in ranges]
+
+        linear = 0.0
+        tested = 0
+        for arm_weight, values in zip(arm_weights, cases):
+            tested += len(values)
+            linear += arm_weight * tested
+        if expected_tests(ranges, weights) >= linear:
+            return if_stmt
+
+        self.lowered += 1
+        return self.lower(arms, else_part, subject, ranges, weights)
+
+    def lower(self, arms, else_part, subject, ranges, weights):
+        statements = []
+        if not isinstance(subject, VarRef):
+            temporary = self.new_temporary("__case")
+            statements.append(Assignment(temporary, subject, True))
+            subject = temporary
+
+        builder = TreeBuilder(subject, [arm.then_block for arm in arms])
+        statements.append(builder.build(ranges, weights, None, None))
+
+        fallthroughs = builder.fallthroughs
+        if else_part is None or not fallthroughs:
+            pass
+        elif (len(fallthroughs) == 1 or
+              count_nodes(else_part) <= DUPLICATION_LIMIT):
+            fallthroughs[0].else_part = else_part
+            for leaf in fallthroughs[1:]:
+                leaf.else_part = deepcopy(else_part)
+        else:
+            # Runs the else block once, after the tree.
+            flag = self.new_temporary("__default")
+            statements.insert(0, Assignment(
+                flag, typed(make_constant((int_, 0))), True))
+            for leaf in fallthroughs:
+                leaf.else_part = Block([Assignment(
+                    deepcopy(flag), typed(make_constant((int_, 1))))])
+            statements.append(IfStmt(deepcopy(flag), else_part))
+        return Block(statements)
+
+    def report(self):
+        return {"chains": self.chains, "lowered": self.lowered}
+
+
+class TreeBuilder(object):
+    """Builds the decision tree of a chain, leaving the leaves where no arm
+    runs in fallthroughs."""
+    def __init__(self, subject, blocks):
+        super(TreeBuilder, self).__init__()
+        self.subject = subject
+        self.blocks = blocks
+        self.used = set()
+        self.fallthroughs = []
+
+    def compare(self, op_type, value):
+        return typed(op_type(deepcopy(self.subject),
+                             typed(make_constant((int_, value)))))
+
+    def build(self, ranges, weights, low, high):
+        if len(ranges) == 1:
+            return self.leaf(ranges[0], low, high)
+        split = split_point(weights)
+        pivot = ranges[split][0]
+        below = self.build(ranges[:split], weights[:split], low, pivot - 1)
+        above = self.build(ranges[split:], weights[split:], pivot, high)
+        return IfStmt(self.compare(LessThanOp, pivot), as_block(below),
+                      as_block(above))
+
+    def leaf(self, range_, low, high):
+        index = range_[2]
+        block = self.blocks[index]
+        if index in self.used:
+            block = deepcopy(block)
+        self.used.add(index)
+
+        tests = [self.compare(op_type, value)
+                 for op_type, value in leaf_tests(range_, low, high)]
+        if not tests:
+            return block
+        condition = tests[0]
+        for test in tests[1:]:
+            condition = typed(LogicalAndOp(condition, test))
+        leaf = IfStmt(condition, block)
+        self.fallthroughs.append(leaf)
+        return leaf
+
+
+def format_report(report):
+    return "%d of %d if/elif chain(s) over constants lowered\n" % (
+        report["lowered"], report["chains"])
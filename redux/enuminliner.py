@@ -1,3 +1,4 @@
+from redux.symtab import Scope
 from redux.visitor import ASTTransformer
 
 
@@ -5,20 +6,16 @@ class EnumInliner(ASTTransformer):
     """Inlines all enum constants."""
     def __init__(self):
         super(ASTTransformer, self).__init__()
-        self.scopes = []
+        self.scope = Scope()
 
     def push_scope(self):
-        self.scopes.append({})
+        self.scope = self.scope.child()
 
     def pop_scope(self):
-        self.scopes.pop()
+        self.scope = self.scope.parent
 
     def find_enum_constant(self, name):
-        for scope in reversed(self.scopes):
-            if name in scope:
-                return scope[name]
-
-        raise KeyError(name)
+        return self.scope.lookup(name)
 
     def visit_VarRef(self, var_ref):
         try:
@@ -30,6 +27,6 @@ class EnumInliner(ASTTransformer):
         self.generic_visit(enum_def)
 
         for name, value in enum_def.members:
-            self.scopes[-1][name] = value
+            self.scope.define(name, value)
 
         return enum_def
@@ -0,0 +1,36 @@
+"""Writing of compiler outputs."""
+from os import chmod, makedirs, remove, replace, stat, umask
+from os.path import dirname
+from tempfile import NamedTemporaryFile
+
+
+# The umask can only be read by setting it, which other threads could
+# observe, so it is read once.
+UMASK = umask(0)
+umask(UMASK)
+
+
+def write_atomically(path, data):
+    """Writes text or bytes to path so that readers never see a partial file.
+
+    The file keeps the mode of the one it replaces, or gets the mode open()
+    would have created it with.
+    """
+    directory = dirname(path) or "."
+    makedirs(directory, exist_ok=True)
+    try:
+        mode = stat(path).st_mode & 0o7777
+    except OSError:
+        mode = 0o666 & ~UMASK
+    with NamedTemporaryFile("wb" if isinstance(data, bytes) else "wt",
+                            dir=directory, prefix=".redux-",
+                            delete=False) as file_:
+        temporary_path = file_.name
+        try:
+            file_.write(data)
+            chmod(temporary_path, mode)
+        except BaseException:
+            file_.close()
+            remove(temporary_path)
+            raise
+    replace(temporary_path, path)
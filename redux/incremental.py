@@ -0,0 +1,127 @@
+"""Incremental parsing of scripts of which only a few definitions change.
+
+A script is split into regions at the boundaries of its top-level function,
+enum and bitfield definitions and require statements, with the statements
+between two definitions sharing a region. Regions are parsed on their own
+and their statements kept, keyed by a hash of their text, so that after an
+edit only the regions that changed are parsed again.
+"""
+from collections import OrderedDict
+from hashlib import sha1
+from redux.ast import Block
+from redux.lexer import Lexer
+from redux.parser import parse
+from redux.serialize import encode, decode
+import re
+
+
+# Scans for the keywords that open and close blocks, skipping over strings,
+# code literals and comments the same way the lexer does.
+KEYWORD_SCANNER = re.compile(r"""
+    "(?:[^\\"]*(?:\\.[^\\"]*)*)"
+  | `.+?`
+  | \#.*
+  | \b(def|enum|bitfield|require|if|while|for|end)\b
+""", re.VERBOSE)
+
+OPENING_KEYWORDS = frozenset(["def", "if", "while", "for", "enum", "bitfield"])
+DEFINITION_KEYWORDS = frozenset(["def", "enum", "bitfield", "require"])
+
+
+def split_regions(code):
+    """Splits a script into regions of whole top-level statements.
+
+    Returns a list of (start, end) offsets, or None if blocks do not nest
+    properly, in which case only a full parse can report the right errors.
+    """
+    regions = []
+    start = 0
+    definition = None
+    depth = 0
+
+    for match in KEYWORD_SCANNER.finditer(code):
+        keyword = match.group(1)
+
+        if definition == "require":
+            # A require statement ends with the string following it.
+            regions.append((start, match.end()))
+            start = match.end()
+            definition = None
+            if keyword is None:
+                continue
+
+        if keyword is None:
+            continue
+
+        if depth == 0 and keyword in DEFINITION_KEYWORDS:
+            if code[start:match.start()].strip():
+                regions.append((start, match.start()))
+            start = match.start()
+            definition = keyword
+
+        if keyword in OPENING_KEYWORDS:
+            depth += 1
+        elif keyword == "end":
+            depth -= 1
+            if depth < 0:
+                return None
+            if depth == 0 and definition is not None:
+                regions.append((start, match.end()))
+                start = match.end()
+                definition = None
+
+    if depth != 0 or definition is not None:
+        return None
+    if code[start:].strip():
+        regions.append((start, len(code)))
+
+    return regions
+
+
+class IncrementalParser(object):
+    """Parser reusing the parsed statements of unchanged regions.
+
+    parse() returns the same (ast, errors) as redux.parser.parse. Scripts
+    with syntax errors are always parsed in full so that errors are
+    reported exactly as usual. At most max_regions regions are remembered,
+    the least recently used ones being forgotten first.
+    """
+    def __init__(self, max_regions=4096):
+        super(IncrementalParser, self).__init__()
+        self.max_regions = max_regions
+        self.lexer = Lexer()
+        self.regions = OrderedDict()
+        self.parsed_regions = 0
+        self.reused_regions = 0
+
+    def parse_region(self, text):
+        key = sha1(text.encode("utf8")).digest()
+        encoded = self.regions.get(key)
+        if encoded is not None:
+            self.regions.move_to_end(key)
+            self.reused_regions += 1
+            return encoded
+
+        ast_, errors = parse(text, self.lexer)
+        if errors:
+            return None
+
+        encoded = self.regions[key] = encode(ast_.statements)
+        while len(self.regions) > self.max_regions:
+            self.regions.popitem(last=False)
+        self.parsed_regions += 1
+        return encoded
+
+    def parse(self, code):
+        regions = split_regions(code)
+        if regions is None:
+            return parse(code, self.lexer)
+
+        statements = []
+        for start, end in regions:
+            encoded = self.parse_region(code[start:end].strip())
+            if encoded is None:
+                return parse(code, self.lexer)
+            statements.extend(decode(encoded))
+
+        return Block(statements), []
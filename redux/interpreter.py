@@ -0,0 +1,840 @@
+"""Interpreter for the Rescript the code generator emits.
+
+Runs generated scripts outside the game, against a World faking the units
+and engine state scripts read and act on, and counts the operations they
+execute by the categories of redux.costmodel. The counts measure what a
+compiler change does to the runtime cost of a script, and compare directly
+with the estimates of CostEstimator:
+
+    interpreter = Interpreter(World([Unit(1, HP=50)]))
+    interpreter.run(compile_script("example.redux", code), unit=1)
+    interpreter.cost.total(CostModel())
+
+Only the subset of Rescript the compiler produces is understood:
+declarations and assignments, blocks, if/else, while, for and break, say,
+the `->`, `::` and `.` accesses, bitfield accesses `x[offset, width]`, the
+operators and intrinsics of redux.intrinsics, QUERY and PERFORM. Scripts
+are translated to Python closures once, so a Program may be run any number
+of times.
+"""
+from collections import Counter, OrderedDict
+from redux.costmodel import Cost
+from redux.typeannotate import INITIAL_SCOPE
+from redux.types import float_, int_, object_
+import codecs
+import math
+import re
+
+
+# Operations a single run may execute before it is considered stuck.
+MAX_OPERATIONS = 10000000
+
+# Rotations are measured in 1/ROTATION_UNITS of a full turn.
+ROTATION_UNITS = 65536
+
+
+class InterpreterError(RuntimeError):
+    pass
+
+
+class RescriptSyntaxError(InterpreterError):
+    pass
+
+
+class Unit(object):
+    """A unit of a World, with the values of its attributes by name."""
+    def __init__(self, id_, **attributes):
+        super(Unit, self).__init__()
+        self.id = id_
+        self.attributes = attributes
+
+
+class World(object):
+    """The game as scripts see it.
+
+    Objects are represented by the id of their unit, 0 being no object.
+    Attributes missing from a unit read as 0, and every unit is a candidate
+    of every query. PERFORM GET_ACHRONAL_FIELD and SET_ACHRONAL_FIELD use
+    achronal_fields; other actions are recorded in performed. Subclass it
+    to fake more of the engine.
+    """
+    def __init__(self, units=(), classes=None, player=0, config=None):
+        super(World, self).__init__()
+        self.units = OrderedDict((unit.id, unit) for unit in units)
+        # Achronal attributes of each class, by class id.
+        self.classes = dict(classes or {})
+        self.player = player
+        self.config = dict(config or {})
+        self.achronal_fields = {}
+        self.said = []
+        self.say_target = None
+        self.performed = []
+
+    def attribute(self, object_id, member):
+        unit = self.units.get(object_id)
+        if unit is None:
+            return 0
+        return unit.attributes.get(member, 0)
+
+    def chronal(self, object_id, member):
+        return self.attribute(object_id, member)
+
+    def achronal(self, object_id, member):
+        return self.attribute(object_id, member)
+
+    def class_attribute(self, class_id, member):
+        return self.classes.get(class_id, {}).get(member, 0)
+
+    def candidates(self, active_unit):
+        """Returns the ids of the units a query run by active_unit sees."""
+        return list(self.units)
+
+    def position(self, object_id):
+        return [self.attribute(object_id, member)
+                for member in ["XPosition", "YPosition", "ZPosition"]]
+
+    def say(self, values):
+        self.said.append(tuple(values))
+
+    def set_say_target(self, name):
+        self.say_target = name
+
+    def say_config_var(self, name):
+        return self.config.get(name, 0)
+
+    def perform(self, action, target, argument):
+        """Runs an action, returning what the engine leaves in perf_ret, or
+        in perf_ret_float if it is a float."""
+        if action == "GET_ACHRONAL_FIELD":
+            return self.achronal_fields.get(argument, 0)
+        if action == "SET_ACHRONAL_FIELD":
+            self.achronal_fields[target] = argument
+            return 0
+        self.performed.append((action, target, argument))
+        return 0
+
+
+def wrap(value):
+    """Wraps an int to 32 bits, like the engine."""
+    return (value + 0x80000000) % 0x100000000 - 0x80000000
+
+
+def integral(function):
+    def apply(a, b):
+        result = function(a, b)
+        if isinstance(result, int):
+            return wrap(result)
+        return result
+    return apply
+
+
+def divide(a, b):
+    if b == 0:
+        raise InterpreterError("division by zero")
+    if isinstance(a, int) and isinstance(b, int):
+        quotient = abs(a) // abs(b)
+        return -quotient if (a < 0) != (b < 0) else quotient
+    return a / b
+
+
+def modulo(a, b):
+    if b == 0:
+        raise InterpreterError("division by zero")
+    if isinstance(a, int) and isinstance(b, int):
+        return a - divide(a, b) * b
+    return math.fmod(a, b)
+
+
+def power(a, b):
+    if isinstance(a, int) and isinstance(b, int) and b >= 0:
+        return a ** b
+    return float(a) ** b
+
+
+def bitwise(function):
+    return lambda a, b: function(int(a), int(b))
+
+
+BINARY_OPERATORS = {
+    "+": integral(lambda a, b: a + b),
+    "-": integral(lambda a, b: a - b),
+    "*": integral(lambda a, b: a * b),
+    "/": integral(divide),
+    "%": integral(modulo),
+    "**": integral(power),
+    "<": lambda a, b: int(a < b),
+    ">": lambda a, b: int(a > b),
+    "<=": lambda a, b: int(a <= b),
+    ">=": lambda a, b: int(a >= b),
+    "==": lambda a, b: int(a == b),
+    "!=": lambda a, b: int(a != b),
+    "|": integral(bitwise(lambda a, b: a | b)),
+    "^": integral(bitwise(lambda a, b: a ^ b)),
+    "&": integral(bitwise(lambda a, b: a & b)),
+    "<<": integral(bitwise(lambda a, b: a << (b & 31))),
+    ">>": integral(bitwise(lambda a, b: a >> (b & 31))),
+}
+
+UNARY_OPERATORS = {
+    "-": integral(lambda a, _: -a),
+    "~": integral(lambda a, _: ~int(a)),
+    "!": lambda a, _: int(not a),
+}
+
+
+def checked(function, domain):
+    def apply(value):
+        if not domain(value):
+            raise InterpreterError("%s of %r is undefined" % (
+                function.__name__, value))
+        return function(value)
+    return apply
+
+
+def distance_sq(axes):
+    def apply(world, a, b):
+        return float(sum((p - q) ** 2 for p, q in
+                         list(zip(world.position(a), world.position(b)))[axes]))
+    return apply
+
+
+# Intrinsics by the operator they are emitted as, with the name the cost
+# model knows them by.
+PREFIX_INTRINSICS = {
+    "|/": ("sqrt", checked(math.sqrt, lambda x: x >= 0)),
+    "trunc": ("int", lambda x: wrap(int(x))),
+    "to_float": ("float", float),
+    "abs": ("abs", lambda x: float(abs(x))),
+    "sin": ("sin", math.sin),
+    "cos": ("cos", math.cos),
+    "tan": ("tan", math.tan),
+    "log": ("log", checked(math.log, lambda x: x > 0)),
+    "asin": ("asin", checked(math.asin, lambda x: -1 <= x <= 1)),
+    "acos": ("acos", checked(math.acos, lambda x: -1 <= x <= 1)),
+    "radtorot": ("rad2rot",
+                 lambda x: wrap(int(x * ROTATION_UNITS / (2 * math.pi)))),
+    "rottorad": ("rot2rad", lambda x: x * 2 * math.pi / ROTATION_UNITS),
+    "to_object": ("object", int),
+}
+
+# Intrinsics that act on the world.
+WORLD_INTRINSICS = {
+    "say_to_var": ("set_say_target",
+                   lambda world, name: world.set_say_target(name)),
+    "say_from_config": ("say_config_var",
+                        lambda world, name: world.say_config_var(name)),
+}
+
+INFIX_INTRINSICS = {
+    "atan2": ("atan2", lambda world, a, b: math.atan2(a, b)),
+    "|>": ("max", lambda world, a, b: max(a, b)),
+    "<|": ("min", lambda world, a, b: min(a, b)),
+    "<=>": ("dist_sq", distance_sq(slice(0, 3))),
+    "<_>": ("hdist_sq", distance_sq(slice(0, 2))),
+    "<^>": ("vdist_sq", distance_sq(slice(2, 3))),
+}
+
+# Binary operators from the loosest binding to the tightest.
+PRECEDENCE = [["||"], ["&&"], ["|"], ["^"], ["&"], ["==", "!="],
+              ["<", ">", "<=", ">="],
+              ["|>", "<|", "<=>", "<_>", "<^>", "atan2"],
+              ["<<", ">>"], ["+", "-"], ["*", "/", "%"]]
+
+TYPES = {"int": int_, "float": float_, "object": object_}
+
+TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<number>\d+\.\d*(?:[eE][-+]?\d+)?|\d+[eE][-+]?\d+|\d+)
+  | (?P<string>"(?:[^"\\\n]|\\.)*")
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<op><=>|<_>|<\^>|->|::|\|/|\|>|<\||<<|>>|<=|>=|==|!=|&&|\|\||\*\*
+         |[-+*/%&|^~!<>=()\[\]{};,.])
+""", re.VERBOSE)
+
+
+def tokenize(code):
+    """Returns the (kind, text, line) tuples of code, then an "end"."""
+    tokens = []
+    line = 1
+    position = 0
+    while position < len(code):
+        match = TOKEN_RE.match(code, position)
+        if match is None:
+            raise RescriptSyntaxError("line %d: unexpected character %r" % (
+                line, code[position]))
+        if match.lastgroup != "space":
+            tokens.append((match.lastgroup, match.group(), line))
+        line += match.group().count("\n")
+        position = match.end()
+    tokens.append(("end", "", line))
+    return tokens
+
+
+class Break(Exception):
+    pass
+
+
+def convert(type_, value):
+    """Converts a value assigned to a variable of type type_."""
+    if type_ is float_:
+        return float(value)
+    if isinstance(value, float):
+        return wrap(int(value))
+    return value
+
+
+class Frame(object):
+    """Variables declared by a block, and the types they were declared
+    with."""
+    __slots__ = ["values", "types", "parent"]
+
+    def __init__(self, parent):
+        self.values = {}
+        self.types = {}
+        self.parent = parent
+
+    def find(self, name):
+        frame = self
+        while frame is not None:
+            if name in frame.values:
+                return frame
+            frame = frame.parent
+        raise InterpreterError("undefined variable %s" % name)
+
+
+class Program(object):
+    """A parsed script, which can be run by any number of Interpreters."""
+    def __init__(self, statements):
+        super(Program, self).__init__()
+        self.statements = statements
+
+
+class RescriptParser(object):
+    """Translates Rescript to closures run with an Interpreter.
+
+    Statements become functions of the Interpreter running them, and
+    expressions functions of the Interpreter returning their value.
+    """
+    def __init__(self, code):
+        super(RescriptParser, self).__init__()
+        self.tokens = tokenize(code)
+        self.position = 0
+
+    def parse(self):
+        statements = []
+        while self.peek() != "end":
+            statements.append(self.statement())
+        return Program(statements)
+
+    def peek(self, offset=0):
+        kind, text, _ = self.tokens[self.position + offset]
+        if kind in ("name", "op"):
+            return text
+        return kind
+
+    def next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def error(self, message):
+        raise RescriptSyntaxError("line %d: %s" % (
+            self.tokens[self.position][2], message))
+
+    def expect(self, text):
+        if self.peek() != text:
+            self.error("expected %r, got %r" % (
+                text, self.tokens[self.position][1]))
+        return self.next()
+
+    def accept(self, text):
+        if self.peek() == text:
+            self.next()
+            return True
+        return False
+
+    def name(self):
+        kind, text, _ = self.next()
+        if kind != "name":
+            self.position -= 1
+            self.error("expected a name, got %r" % text)
+        return text
+
+    def statement(self):
+        token = self.peek()
+        if token == "{":
+            return self.block()
+        if token == ";":
+            self.next()
+            return lambda interpreter: None
+        if token == "if":
+            return self.if_statement()
+        if token == "while":
+            return self.while_statement()
+        if token == "for":
+            return self.for_statement()
+        if token == "break":
+            self.next()
+            self.accept(";")
+            return break_statement
+        if token == "say":
+            return self.say_statement()
+        if token == "PERFORM":
+            return self.perform_statement()
+        statement = self.simple_statement()
+        self.accept(";")
+        return statement
+
+    def block(self):
+        self.expect("{")
+        statements = []
+        while not self.accept("}"):
+            if self.peek() == "end":
+                self.error("premature end of script")
+            statements.append(self.statement())
+
+        def run(interpreter):
+            interpreter.push()
+            try:
+                for statement in statements:
+                    statement(interpreter)
+            finally:
+                interpreter.pop()
+        return run
+
+    def if_statement(self):
+        self.expect("if")
+        self.expect("(")
+        condition = self.expression()
+        self.expect(")")
+        then_part = self.statement()
+        else_part = None
+        if self.accept("else"):
+            else_part = self.statement()
+
+        def run(interpreter):
+            interpreter.count("branch")
+            if condition(interpreter):
+                then_part(interpreter)
+            elif else_part is not None:
+                else_part(interpreter)
+        return run
+
+    def while_statement(self):
+        self.expect("while")
+        self.expect("(")
+        condition = self.expression()
+        self.expect(")")
+        body = self.statement()
+        return loop(None, condition, None, body)
+
+    def for_statement(self):
+        self.expect("for")
+        self.expect("(")
+        init = step = condition = None
+        if self.peek() != ";":
+            init = self.simple_statement()
+        self.expect(";")
+        if self.peek() != ";":
+            condition = self.expression()
+        self.expect(";")
+        if self.peek() != ")":
+            step = self.simple_statement()
+        self.expect(")")
+        body = self.statement()
+        return loop(init, condition, step, body)
+
+    def say_statement(self):
+        self.expect("say")
+        values = [self.expression()]
+        while self.accept(","):
+            values.append(self.expression())
+        self.accept(";")
+
+        def run(interpreter):
+            interpreter.count("statement")
+            interpreter.count("intrinsic:say")
+            interpreter.world.say([value(interpreter) for value in values])
+        return run
+
+    def perform_statement(self):
+        self.expect("PERFORM")
+        action = self.name()
+        argument = None
+        if self.peek() != ";":
+            argument = self.expression()
+        self.accept(";")
+        kind = {"GET_ACHRONAL_FIELD": "af_get",
+                "SET_ACHRONAL_FIELD": "af_set"}.get(action, "perform")
+
+        def run(interpreter):
+            interpreter.count("statement")
+            interpreter.count(kind)
+            value = None
+            if argument is not None:
+                value = argument(interpreter)
+            result = interpreter.world.perform(
+                action, interpreter.lookup("target"), value)
+            if isinstance(result, float):
+                interpreter.assign("perf_ret_float", result)
+            else:
+                interpreter.assign("perf_ret", result)
+        return run
+
+    def simple_statement(self):
+        """A declaration, an assignment or an expression."""
+        if self.peek() in TYPES and self.tokens[self.position + 1][0] == "name":
+            type_ = TYPES[self.name()]
+            name = self.name()
+            self.expect("=")
+            value = self.expression()
+
+            def declare(interpreter):
+                interpreter.count("assignment")
+                interpreter.declare(name, type_, value(interpreter))
+            return declare
+
+        if self.tokens[self.position][0] == "name" and self.peek(1) == "=":
+            name = self.name()
+            self.expect("=")
+            value = self.expression()
+
+            def assign(interpreter):
+                interpreter.count("assignment")
+                interpreter.assign(name, value(interpreter))
+            return assign
+
+        if self.tokens[self.position][0] == "name" and self.peek(1) == "[":
+            name = self.name()
+            offset, width = self.bit_range()
+            self.expect("=")
+            value = self.expression()
+            mask = ((1 << width) - 1) << offset
+
+            def assign_bits(interpreter):
+                interpreter.count("assignment")
+                interpreter.count("dotted_access")
+                bits = (int(value(interpreter)) << offset) & mask
+                interpreter.assign(name, wrap(
+                    (interpreter.lookup(name) & ~mask) | bits))
+            return assign_bits
+
+        expression = self.expression()
+
+        def evaluate(interpreter):
+            interpreter.count("statement")
+            expression(interpreter)
+        return evaluate
+
+    def bit_range(self):
+        self.expect("[")
+        offset = self.integer()
+        self.expect(",")
+        width = self.integer()
+        self.expect("]")
+        return offset, width
+
+    def integer(self):
+        kind, text, _ = self.next()
+        if kind != "number" or not text.isdigit():
+            self.position -= 1
+            self.error("expected an integer, got %r" % text)
+        return int(text)
+
+    def expression(self, level=0):
+        if level == len(PRECEDENCE):
+            return self.power()
+        lhs = self.expression(level + 1)
+        while self.peek() in PRECEDENCE[level]:
+            op = self.next()[1]
+            rhs = self.expression(level + 1)
+            lhs = binary(op, lhs, rhs)
+        return lhs
+
+    def power(self):
+        base = self.unary()
+        if self.accept("**"):
+            # Right associative.
+            return binary("**", base, self.power())
+        return base
+
+    def unary(self):
+        op = self.peek()
+        if op in UNARY_OPERATORS or op == "+":
+            self.next()
+            operand = self.unary()
+            if op == "+":
+                return operand
+            function = UNARY_OPERATORS[op]
+
+            def evaluate(interpreter):
+                value = operand(interpreter)
+                interpreter.count_operation(value)
+                return function(value, None)
+            return evaluate
+        if op in PREFIX_INTRINSICS:
+            self.next()
+            operand = self.unary()
+            name, function = PREFIX_INTRINSICS[op]
+            kind = "intrinsic:" + name
+
+            def evaluate(interpreter):
+                value = operand(interpreter)
+                interpreter.count(kind)
+                return function(value)
+            return evaluate
+        if op in WORLD_INTRINSICS:
+            self.next()
+            operand = self.unary()
+            name, function = WORLD_INTRINSICS[op]
+            kind = "intrinsic:" + name
+
+            def evaluate(interpreter):
+                value = operand(interpreter)
+                interpreter.count(kind)
+                return function(interpreter.world, value)
+            return evaluate
+        return self.postfix(self.primary())
+
+    def postfix(self, expression):
+        while True:
+            op = self.peek()
+            if op in ("->", ".", "::"):
+                self.next()
+                expression = access(op, expression, self.name())
+            elif op == "[":
+                offset, width = self.bit_range()
+                expression = bits(expression, offset, width)
+            else:
+                return expression
+
+    def primary(self):
+        kind, text, _ = self.next()
+        if kind == "number":
+            if text.isdigit():
+                value = wrap(int(text))
+            else:
+                value = float(text)
+            return lambda interpreter: value
+        if kind == "string":
+            value = codecs.decode(text[1:-1], "unicode_escape")
+            return lambda interpreter: value
+        if text == "(":
+            expression = self.expression()
+            self.expect(")")
+            return expression
+        if text == "QUERY":
+            return self.query()
+        if kind == "name":
+            return lambda interpreter: interpreter.lookup(text)
+        self.position -= 1
+        self.error("unexpected %r" % (text or "end of script"))
+
+    def query(self):
+        query_type = self.name()
+        self.expect("[")
+        active = self.expression()
+        self.expect("]")
+        op = self.name()
+        self.expect("[")
+        op_expr = self.expression()
+        self.expect("]")
+        self.expect("WHERE")
+        self.expect("[")
+        where_cond = self.expression()
+        self.expect("]")
+        if op not in ("MIN", "MAX", "SUM", "AVE"):
+            self.error("unknown query operation %s" % op)
+
+        def evaluate(interpreter):
+            interpreter.count("query")
+            outer = interpreter.lookup("query")
+            matches = []
+            try:
+                for candidate in interpreter.world.candidates(
+                        active(interpreter)):
+                    interpreter.assign("query", candidate)
+                    if where_cond(interpreter):
+                        matches.append((op_expr(interpreter), candidate))
+            finally:
+                interpreter.assign("query", outer)
+            return query_result(query_type, op, matches)
+        return evaluate
+
+
+def query_result(query_type, op, matches):
+    if not matches:
+        return 0
+    if query_type == "VALUE":
+        values = [value for value, _ in matches]
+        if op == "SUM":
+            return sum(values)
+        if op == "AVE":
+            return divide(sum(values), len(values))
+        return max(values) if op == "MAX" else min(values)
+    # The first of equally good units wins.
+    if op == "MAX":
+        return max(matches, key=lambda match: match[0])[1]
+    return min(matches, key=lambda match: match[0])[1]
+
+
+def break_statement(interpreter):
+    interpreter.count("statement")
+    raise Break
+
+
+def loop(init, condition, step, body):
+    def run(interpreter):
+        # Like the compiler, declares the variable of a for loop in the
+        # enclosing block.
+        if init is not None:
+            init(interpreter)
+        while condition is None or condition(interpreter):
+            interpreter.count("loop_iteration")
+            try:
+                body(interpreter)
+            except Break:
+                break
+            if step is not None:
+                step(interpreter)
+    return run
+
+
+def binary(op, lhs, rhs):
+    if op in ("&&", "||"):
+        stop = op == "||"
+
+        def evaluate(interpreter):
+            value = lhs(interpreter)
+            interpreter.count_operation(value)
+            if bool(value) == stop:
+                return int(stop)
+            return int(bool(rhs(interpreter)))
+        return evaluate
+
+    if op in INFIX_INTRINSICS:
+        name, function = INFIX_INTRINSICS[op]
+        kind = "intrinsic:" + name
+
+        def evaluate(interpreter):
+            a = lhs(interpreter)
+            b = rhs(interpreter)
+            interpreter.count(kind)
+            return function(interpreter.world, a, b)
+        return evaluate
+
+    function = BINARY_OPERATORS[op]
+
+    def evaluate(interpreter):
+        a = lhs(interpreter)
+        b = rhs(interpreter)
+        interpreter.count_operation(a, b)
+        return function(a, b)
+    return evaluate
+
+
+def access(op, expression, member):
+    kind, method = {"->": ("chronal_access", "chronal"),
+                    ".": ("dotted_access", "achronal"),
+                    "::": ("class_access", "class_attribute")}[op]
+
+    def evaluate(interpreter):
+        value = expression(interpreter)
+        interpreter.count(kind)
+        return getattr(interpreter.world, method)(value, member)
+    return evaluate
+
+
+def bits(expression, offset, width):
+    mask = (1 << width) - 1
+
+    def evaluate(interpreter):
+        value = expression(interpreter)
+        interpreter.count("dotted_access")
+        return (int(value) >> offset) & mask
+    return evaluate
+
+
+def parse_rescript(code):
+    """Parses Rescript code into a Program."""
+    return RescriptParser(code).parse()
+
+
+class Interpreter(object):
+    """Runs Programs against a World, counting the operations executed.
+
+    counts accumulates over every run, keyed by the categories of
+    redux.costmodel: "statement", "assignment", "branch", "loop_iteration",
+    "int_op", "float_op", the accesses, "query", "perform", "af_get",
+    "af_set" and "intrinsic:NAME". A run executing more than max_operations
+    of them raises InterpreterError.
+    """
+    def __init__(self, world=None, max_operations=MAX_OPERATIONS):
+        super(Interpreter, self).__init__()
+        if world is None:
+            world = World()
+        self.world = world
+        self.max_operations = max_operations
+        self.counts = Counter()
+        self.operations = 0
+        self.frame = None
+
+    @property
+    def cost(self):
+        return Cost(self.counts)
+
+    def run(self, program, unit=0):
+        """Runs program, or Rescript code, as run by the unit with id
+        unit."""
+        if not isinstance(program, Program):
+            program = parse_rescript(program)
+
+        self.frame = Frame(None)
+        for name, entry in INITIAL_SCOPE.items():
+            self.frame.types[name] = entry.type
+            self.frame.values[name] = convert(entry.type, 0)
+        self.frame.values["unit"] = unit
+        self.frame.values["player"] = self.world.player
+        self.operations = 0
+
+        for statement in program.statements:
+            try:
+                statement(self)
+            except Break:
+                raise InterpreterError("break outside of a loop")
+        return self
+
+    def count(self, kind):
+        self.counts[kind] += 1
+        self.operations += 1
+        if self.operations > self.max_operations:
+            raise InterpreterError("operation limit of %d exceeded" %
+                                   self.max_operations)
+
+    def count_operation(self, *operands):
+        if any(isinstance(operand, float) for operand in operands):
+            self.count("float_op")
+        else:
+            self.count("int_op")
+
+    def push(self):
+        self.frame = Frame(self.frame)
+
+    def pop(self):
+        self.frame = self.frame.parent
+
+    def declare(self, name, type_, value):
+        self.frame.types[name] = type_
+        self.frame.values[name] = convert(type_, value)
+
+    def lookup(self, name):
+        return self.frame.find(name).values[name]
+
+    def assign(self, name, value):
+        frame = self.frame.find(name)
+        frame.values[name] = convert(frame.types[name], value)
+
+
+def run_script(code, world=None, unit=0, max_operations=MAX_OPERATIONS):
+    """Runs Rescript code once, returning the Interpreter that ran it."""
+    return Interpreter(world, max_operations).run(code, unit)
@@ -1,10 +1,41 @@
+"""Operations of the engine that scripts call like functions.
+
+Every intrinsic is registered once, when this module is imported, and
+declares what the optimizers need to know about it:
+
+- arity: the number of arguments, None for any positive number;
+- argument_types: for every argument, the tuple of types it accepts, or
+  None to accept anything;
+- return_type: the type of the result, None if there is none;
+- pure: whether calling it has no effect besides computing its result;
+- total: whether it computes a result for all arguments, so that evaluating
+  it never fails;
+- cost: its relative runtime cost, in the units of redux.costmodel;
+- evaluate: a function computing its result from constant arguments, or
+  None.
+
+register_perform adds intrinsics that run an engine action with PERFORM.
+"""
+from collections import OrderedDict
 from redux.ast import (Block, FunctionDefinition, CodeLiteral, ReturnStmt,
                        VarRef)
 from redux.types import int_, float_, object_, str_, is_numeric, common_arithmetic_type
 
 import re
 
+
+NUMERIC = (int_, float_)
+
+
 class IntrinsicFunction(object):
+    arity = None
+    argument_types = None
+    return_type = None
+    pure = False
+    total = False
+    cost = 1
+    evaluate = None
+
     @property
     def nontrivial(self):
         return False
@@ -13,8 +44,13 @@ class IntrinsicFunction(object):
     def name(self):
         return _convert(self.__class__.__name__)
 
+    def type(self, args):
+        return self.return_type
+
 
 class Say(IntrinsicFunction):
+    cost = 10
+
     def codegen(self, code_generator, args):
         assert len(args) > 0
 
@@ -24,11 +60,12 @@ class Say(IntrinsicFunction):
             code_generator.emit(", ")
             code_generator.visit(arg)
 
-    def type(self, args):
-        return None
-
 
 class SetSayTarget(IntrinsicFunction):
+    arity = 1
+    argument_types = [(str_,)]
+    cost = 2
+
     def codegen(self, code_generator, args):
         assert len(args) == 1
         assert args[0].type == str_
@@ -37,11 +74,12 @@ class SetSayTarget(IntrinsicFunction):
         code_generator.visit(args[0])
         code_generator.emit(")")
 
-    def type(self, args):
-        return None
-
 
 class SayConfigVar(IntrinsicFunction):
+    arity = 1
+    argument_types = [(str_,)]
+    cost = 2
+
     def codegen(self, code_generator, args):
         assert len(args) == 1
         assert args[0].type == str_
@@ -50,12 +88,15 @@ class SayConfigVar(IntrinsicFunction):
         code_generator.visit(args[0])
         code_generator.emit(")")
 
-    def type(self, args):
-        return None
 
-
-def _unary_numeric_intrinsic(name, op, type_):
+def _unary_numeric_intrinsic(name, op, type_, cost=1, total=False,
+                             evaluate=None):
     class _Intrinsic(IntrinsicFunction):
+        arity = 1
+        argument_types = [NUMERIC]
+        return_type = type_
+        pure = True
+
         def codegen(self, code_generator, args):
             assert len(args) == 1
             assert is_numeric(args[0].type)
@@ -63,22 +104,23 @@ def _unary_numeric_intrinsic(name, op, type_):
             code_generator.emit("(" + op + " ")
             code_generator.visit(args[0])
             code_generator.emit(")")
-
-        def type(self, args):
-            return type_
     _Intrinsic.__name__ = name
+    _Intrinsic.cost = cost
+    _Intrinsic.total = total
+    if evaluate is not None:
+        _Intrinsic.evaluate = staticmethod(evaluate)
     return _Intrinsic
 
-Sqrt = _unary_numeric_intrinsic("Sqrt", "|/", float_)
-Int = _unary_numeric_intrinsic("Int", "trunc", int_)
+Sqrt = _unary_numeric_intrinsic("Sqrt", "|/", float_, cost=4)
+Int = _unary_numeric_intrinsic("Int", "trunc", int_, evaluate=int)
 Float = _unary_numeric_intrinsic("Float", "to_float", float_)
 Abs = _unary_numeric_intrinsic("Abs", "abs", float_)
-Sin = _unary_numeric_intrinsic("Sin", "sin", float_)
-Cos = _unary_numeric_intrinsic("Cos", "cos", float_)
-Tan = _unary_numeric_intrinsic("Tan", "tan", float_)
-Log = _unary_numeric_intrinsic("Log", "log", float_)
-Asin = _unary_numeric_intrinsic("Asin", "asin", float_)
-Acos = _unary_numeric_intrinsic("Acos", "acos", float_)
+Sin = _unary_numeric_intrinsic("Sin", "sin", float_, cost=4, total=True)
+Cos = _unary_numeric_intrinsic("Cos", "cos", float_, cost=4, total=True)
+Tan = _unary_numeric_intrinsic("Tan", "tan", float_, cost=4, total=True)
+Log = _unary_numeric_intrinsic("Log", "log", float_, cost=4)
+Asin = _unary_numeric_intrinsic("Asin", "asin", float_, cost=4)
+Acos = _unary_numeric_intrinsic("Acos", "acos", float_, cost=4)
 Rad2Rot = _unary_numeric_intrinsic("Rad2Rot", "radtorot", int_)
 Rot2Rad = _unary_numeric_intrinsic("Rot2Rad", "rottorad", float_)
 
@@ -86,6 +128,12 @@ Rad2Rot.name = "rad2rot"
 Rot2Rad.name = "rot2rad"
 
 class Object(IntrinsicFunction):
+    arity = 1
+    argument_types = [(int_,)]
+    return_type = object_
+    pure = True
+    total = True
+
     def codegen(self, code_generator, args):
         assert len(args) == 1
         assert args[0].type == int_
@@ -94,10 +142,14 @@ class Object(IntrinsicFunction):
         code_generator.visit(args[0])
         code_generator.emit(")")
 
-    def type(self, args):
-        return object_
-
 class Atan2(IntrinsicFunction):
+    arity = 2
+    argument_types = [NUMERIC, NUMERIC]
+    return_type = float_
+    pure = True
+    total = True
+    cost = 4
+
     def codegen(self, code_generator, args):
         assert len(args) == 2
         assert is_numeric(args[0].type)
@@ -109,10 +161,13 @@ class Atan2(IntrinsicFunction):
         code_generator.visit(args[1])
         code_generator.emit(")")
 
-    def type(self, args):
-        return float_
-
 class Max(IntrinsicFunction):
+    arity = 2
+    argument_types = [NUMERIC, NUMERIC]
+    pure = True
+    total = True
+    evaluate = staticmethod(max)
+
     def codegen(self, code_generator, args):
         assert len(args) == 2
         assert is_numeric(args[0].type)
@@ -128,6 +183,12 @@ class Max(IntrinsicFunction):
         return common_arithmetic_type(args[0].type, args[1].type)
 
 class Min(IntrinsicFunction):
+    arity = 2
+    argument_types = [NUMERIC, NUMERIC]
+    pure = True
+    total = True
+    evaluate = staticmethod(min)
+
     def codegen(self, code_generator, args):
         assert len(args) == 2
         assert is_numeric(args[0].type)
@@ -144,6 +205,14 @@ class Min(IntrinsicFunction):
 
 
 class DistSq(IntrinsicFunction):
+    arity = 2
+    argument_types = [(object_,), (object_,)]
+    return_type = float_
+    pure = True
+    total = True
+    # Distances read the position of both units.
+    cost = 12
+
     def codegen(self, code_generator, args):
         assert len(args) == 2
         assert args[0].type == object_
@@ -155,10 +224,14 @@ class DistSq(IntrinsicFunction):
         code_generator.visit(args[1])
         code_generator.emit(")")
 
-    def type(self, args):
-        return float_
-
 class HDistSq(IntrinsicFunction):
+    arity = 2
+    argument_types = [(object_,), (object_,)]
+    return_type = float_
+    pure = True
+    total = True
+    cost = 8
+
     def codegen(self, code_generator, args):
         assert len(args) == 2
         assert args[0].type == object_
@@ -170,15 +243,19 @@ class HDistSq(IntrinsicFunction):
         code_generator.visit(args[1])
         code_generator.emit(")")
 
-    def type(self, args):
-        return float_
-
     @property
     def name(self):
         return "hdist_sq"
 
 
 class VDistSq(IntrinsicFunction):
+    arity = 2
+    argument_types = [(object_,), (object_,)]
+    return_type = float_
+    pure = True
+    total = True
+    cost = 4
+
     def codegen(self, code_generator, args):
         assert len(args) == 2
         assert args[0].type == object_
@@ -190,23 +267,123 @@ class VDistSq(IntrinsicFunction):
         code_generator.visit(args[1])
         code_generator.emit(")")
 
-    def type(self, args):
-        return float_
-
     @property
     def name(self):
         return "vdist_sq"
 
 
-GetAchronalField = lambda: FunctionDefinition("__get_achronal_field", ["num"], Block([CodeLiteral("PERFORM GET_ACHRONAL_FIELD num;"), ReturnStmt(VarRef("perf_ret"))]))
-SetAchronalField = lambda: FunctionDefinition("__set_achronal_field", ["num", "value"], Block([CodeLiteral("target = num; PERFORM SET_ACHRONAL_FIELD value;")]))
+class PerformIntrinsic(object):
+    """An engine action scripts call like a function.
+
+    Calls are inlined like those of the definition this returns, which
+    assigns its target argument, if any, to target, PERFORMs action with
+    its other argument, if any, and returns what the engine leaves in
+    perf_ret or perf_ret_float, depending on return_type. The cost model
+    charges them its "perform" weight.
+    """
+    argument_types = None
+    pure = False
+    total = False
+    evaluate = None
+
+    def __init__(self, name, action, argument=None, target=None,
+                 return_type=None):
+        super(PerformIntrinsic, self).__init__()
+        assert return_type in (None, int_, float_)
+        self.name = name
+        self.action = action
+        self.arguments = [name_ for name_ in (target, argument)
+                          if name_ is not None]
+        self.arity = len(self.arguments)
+        self.target = target
+        self.argument = argument
+        self.return_type = return_type
+        self.cost = None
+
+    @property
+    def code(self):
+        code = "PERFORM %s;" % self.action
+        if self.argument is not None:
+            code = "PERFORM %s %s;" % (self.action, self.argument)
+        if self.target is not None:
+            code = "target = %s; %s" % (self.target, code)
+        return code
+
+    def definition(self):
+        """Returns a new definition of a function running the action."""
+        statements = [CodeLiteral(self.code)]
+        if self.return_type is int_:
+            statements.append(ReturnStmt(VarRef("perf_ret")))
+        elif self.return_type is float_:
+            statements.append(ReturnStmt(VarRef("perf_ret_float")))
+        return FunctionDefinition(self.name, list(self.arguments),
+                                  Block(statements))
+
 
 # From http://stackoverflow.com/a/1176023/126977
 def _convert(name):
     s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', name)
     return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
 
+
+# Intrinsics by name, in the order they were registered.
+_registry = OrderedDict()
+
+
+def register_intrinsic(intrinsic):
+    """Makes an intrinsic callable from scripts.
+
+    Compilers only see the intrinsics registered before they were created,
+    so register extra intrinsics before compiling anything.
+    """
+    if intrinsic.name in _registry:
+        raise ValueError("intrinsic %r is already registered" %
+                         intrinsic.name)
+    _registry[intrinsic.name] = intrinsic
+    return intrinsic
+
+
+def register_perform(name, action, argument=None, target=None,
+                     return_type=None):
+    """Registers a function name(target, argument) running PERFORM action.
+
+    argument and target are the names of its parameters, either of which
+    may be left out; see PerformIntrinsic.
+    """
+    return register_intrinsic(PerformIntrinsic(name, action, argument, target,
+                                               return_type))
+
+
 def get_intrinsic_functions():
-    for cls in IntrinsicFunction.__subclasses__():
-        intrinsic = cls()
-        yield intrinsic.name, intrinsic
+    """Yields the name and object of every intrinsic emitted as an
+    expression."""
+    for name, intrinsic in _registry.items():
+        if isinstance(intrinsic, IntrinsicFunction):
+            yield name, intrinsic
+
+
+def get_perform_intrinsics():
+    for name, intrinsic in _registry.items():
+        if isinstance(intrinsic, PerformIntrinsic):
+            yield name, intrinsic
+
+
+def get_intrinsic(name):
+    """Returns the intrinsic registered under name, or None."""
+    return _registry.get(name)
+
+
+for _cls in [Say, SetSayTarget, SayConfigVar, Sqrt, Int, Float, Abs, Sin, Cos,
+             Tan, Log, Asin, Acos, Rad2Rot, Rot2Rad, Object, Atan2, Max, Min,
+             DistSq, HDistSq, VDistSq]:
+    register_intrinsic(_cls())
+
+GET_ACHRONAL_FIELD = register_perform("__get_achronal_field",
+                                      "GET_ACHRONAL_FIELD", argument="num",
+                                      return_type=int_)
+SET_ACHRONAL_FIELD = register_perform("__set_achronal_field",
+                                      "SET_ACHRONAL_FIELD", argument="value",
+                                      target="num")
+
+GET_ACHRONAL_FIELD_CODE = GET_ACHRONAL_FIELD.code
+SET_ACHRONAL_FIELD_CODE = SET_ACHRONAL_FIELD.code
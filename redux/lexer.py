@@ -9,6 +9,7 @@ class Lexer(object):
 
     def input(self, data):
         self._lexer.input(data)
+        self._lexer.lineno = 1
 
     def token(self):
         return self._lexer.token()
@@ -0,0 +1,349 @@
+"""Packing of small-range int locals into shared bitfield ints.
+
+Runs on the lowered AST, once all calls have been inlined. Every int
+variable whose values provably fit in a few bits is given a slice of a
+shared int, declared at the start of the script, and accessed with the
+bitfield syntax (a[offset, length]) instead of taking a variable of its own.
+
+Ranges are inferred from the values assigned: constants, comparisons and
+logical operators (0 or 1), masks, remainders, bitfield members, arithmetic
+on other small variables, and the induction variables of for loops with
+constant bounds. Variables that may ever hold a negative value, and any
+variable whose name appears in a code literal, are left alone.
+"""
+from collections import OrderedDict
+from redux.ast import (Assignment, BitfieldAssignment, BitfieldDefinition,
+                       Constant, DottedAccess, VarRef, RelationalOp, AddOp,
+                       SubOp, MulOp, ModuloOp, BitwiseAndOp,
+                       BitwiseRightShiftOp)
+from redux.loops import induction_values
+from redux.symtab import Scope
+from redux.types import int_
+from redux.visitor import ASTTransformer, ASTVisitor
+import re
+
+
+PACK_WIDTH = 32
+MAX_MEMBER_WIDTH = 16
+MAX_INDUCTION_STEPS = 1 << 16
+# Ranges still growing after this many rounds are taken to be unbounded.
+MAX_WIDENINGS = 16
+
+# The range of a variable nothing has been assigned to yet.
+EMPTY = ()
+
+
+class Variable(object):
+    """A declared variable together with everything that accesses it."""
+    def __init__(self, name, declaration):
+        super(Variable, self).__init__()
+        self.name = name
+        self.declaration = declaration
+        self.assignments = [declaration]
+        self.loops = []
+
+
+class VariableResolver(ASTVisitor):
+    """Resolves every variable reference and assignment to its declaration."""
+    def __init__(self):
+        super(VariableResolver, self).__init__()
+        self.scope = Scope()
+        self.variables = []
+        # Declarations by id() of the VarRefs and Assignments using them.
+        self.references = {}
+        self.assignments = {}
+        self.code_literals = []
+
+    def push_scope(self):
+        self.scope = self.scope.child()
+
+    def pop_scope(self):
+        self.scope = self.scope.parent
+
+    def visit_FunctionDefinition(self, function_def):
+        pass
+
+    def visit_CodeLiteral(self, code_literal):
+        self.code_literals.append(code_literal.code)
+
+    def visit_VarRef(self, var_ref):
+        try:
+            self.references[id(var_ref)] = self.scope.lookup(var_ref.name)
+        except KeyError:
+            pass
+
+    def visit_BitfieldAssignment(self, assignment):
+        self.generic_visit(assignment)
+
+    def visit_Assignment(self, assignment):
+        self.visit(assignment.expression)
+
+        name = assignment.variable.name
+        if assignment.declare is True:
+            variable = Variable(name, assignment)
+            self.variables.append(variable)
+            self.scope.define(name, variable)
+        else:
+            try:
+                variable = self.scope.lookup(name)
+            except KeyError:
+                return
+            variable.assignments.append(assignment)
+        self.assignments[id(assignment)] = variable
+
+    def visit_ForStmt(self, for_stmt):
+        self.push_scope()
+        self.generic_visit(for_stmt)
+        self.pop_scope()
+
+        step = for_stmt.step_expr
+        if type(step) is Assignment and id(step) in self.assignments:
+            self.assignments[id(step)].loops.append(for_stmt)
+
+
+def join(a, b):
+    if a is EMPTY:
+        return b
+    if b is EMPTY:
+        return a
+    if a is None or b is None:
+        return None
+    return (min(a[0], b[0]), max(a[1], b[1]))
+
+
+def interval(a, b, operation):
+    """Applies an operation monotonic in each operand to two ranges."""
+    if a is EMPTY or b is EMPTY:
+        return EMPTY
+    if a is None or b is None:
+        return None
+    corners = [operation(x, y) for x in a for y in b]
+    return (min(corners), max(corners))
+
+
+class LocalPacker(ASTTransformer):
+    """Packs small-range int locals of a lowered script into shared ints."""
+    def __init__(self):
+        super(LocalPacker, self).__init__()
+        self.resolver = VariableResolver()
+        self.ranges = {}
+        # Packed variables, mapped to their pack and member name.
+        self.members = {}
+        # (BitfieldDefinition, variables) of every pack.
+        self.packs = []
+
+    def expression_range(self, expr):
+        """Returns (lowest, highest) value of expr, None if unbounded, or
+        EMPTY if it depends on variables nothing was assigned to yet."""
+        if getattr(expr, "type", None) is not int_:
+            if isinstance(expr, DottedAccess):
+                return self.member_range(expr)
+            return None
+
+        if isinstance(expr, Constant):
+            return (expr.value, expr.value)
+        elif isinstance(expr, VarRef):
+            variable = self.resolver.references.get(id(expr))
+            return self.ranges.get(variable)
+        elif isinstance(expr, RelationalOp):
+            return (0, 1)
+        elif isinstance(expr, DottedAccess):
+            return self.member_range(expr)
+        elif isinstance(expr, AddOp):
+            return interval(self.expression_range(expr.lhs),
+                            self.expression_range(expr.rhs),
+                            lambda x, y: x + y)
+        elif isinstance(expr, SubOp):
+            return interval(self.expression_range(expr.lhs),
+                            self.expression_range(expr.rhs),
+                            lambda x, y: x - y)
+        elif isinstance(expr, MulOp):
+            return interval(self.expression_range(expr.lhs),
+                            self.expression_range(expr.rhs),
+                            lambda x, y: x * y)
+        elif isinstance(expr, BitwiseAndOp):
+            ranges = [self.expression_range(expr.lhs),
+                      self.expression_range(expr.rhs)]
+            if EMPTY in ranges:
+                return EMPTY
+            highs = [range_[1] for range_ in ranges
+                     if range_ is not None and range_[0] >= 0]
+            return (0, min(highs)) if highs else None
+        elif isinstance(expr, ModuloOp):
+            lhs = self.expression_range(expr.lhs)
+            rhs = self.expression_range(expr.rhs)
+            if lhs is EMPTY or rhs is EMPTY:
+                return EMPTY
+            if lhs is None or rhs is None or lhs[0] < 0 or rhs[0] <= 0:
+                return None
+            return (0, min(lhs[1], rhs[1] - 1))
+        elif isinstance(expr, BitwiseRightShiftOp):
+            lhs = self.expression_range(expr.lhs)
+            rhs = self.expression_range(expr.rhs)
+            if lhs is EMPTY or rhs is EMPTY:
+                return EMPTY
+            if lhs is None or rhs is None or lhs[0] < 0 or rhs[0] < 0:
+                return None
+            return (lhs[0] >> rhs[1], lhs[1] >> rhs[0])
+        else:
+            return None
+
+    def member_range(self, dotted_access):
+        type_ = dotted_access.expression.type
+        if not isinstance(type_, BitfieldDefinition):
+            return None
+        offset, length = type_.get_member_limits(dotted_access.member)
+        return (0, (1 << length) - 1)
+
+    def infer_ranges(self, candidates):
+        covered = set()
+        for variable in candidates:
+            self.ranges[variable] = EMPTY
+            for loop in variable.loops:
+                values = induction_values(loop, MAX_INDUCTION_STEPS)
+                if values is None:
+                    self.ranges[variable] = None
+                else:
+                    self.ranges[variable] = join(self.ranges[variable],
+                                                 (min(values), max(values)))
+                    covered.add(id(loop.step_expr))
+
+        widenings = dict.fromkeys(candidates, 0)
+        changed = True
+        while changed:
+            changed = False
+            for variable in candidates:
+                old_range = range_ = self.ranges[variable]
+                for assignment in variable.assignments:
+                    if range_ is None:
+                        break
+                    if id(assignment) not in covered:
+                        range_ = join(range_, self.expression_range(
+                            assignment.expression))
+                if range_ != old_range:
+                    widenings[variable] += 1
+                    if widenings[variable] > MAX_WIDENINGS:
+                        range_ = None
+                    self.ranges[variable] = range_
+                    changed = True
+
+    def member_width(self, variable):
+        range_ = self.ranges.get(variable)
+        if range_ is None or range_ is EMPTY or range_[0] < 0:
+            return None
+        width = max(1, range_[1].bit_length())
+        return width if width <= MAX_MEMBER_WIDTH else None
+
+    def allocate(self, candidates):
+        """Assigns slices of packs to variables, first fit in order."""
+        packs = []
+        for variable in candidates:
+            width = self.member_width(variable)
+            if width is None:
+                continue
+            for pack in packs:
+                if pack["width"] + width <= PACK_WIDTH:
+                    break
+            else:
+                pack = {"width": 0, "variables": []}
+                packs.append(pack)
+            pack["variables"].append((variable, width))
+            pack["width"] += width
+
+        # A pack of one variable saves nothing.
+        for pack in packs:
+            if len(pack["variables"]) < 2:
+                continue
+            name = "__packed%d" % len(self.packs)
+            members = []
+            for variable, width in pack["variables"]:
+                member = variable.name
+                while member in dict(members):
+                    member += "_"
+                members.append((member, width))
+            definition = BitfieldDefinition(name, members)
+            variables = [variable for variable, _ in pack["variables"]]
+            for variable, (member, _) in zip(variables, members):
+                self.members[variable] = (definition, member)
+            self.packs.append((definition, variables))
+
+    def access(self, variable):
+        definition, member = self.members[variable]
+        pack = VarRef(definition.name)
+        pack.type = definition
+        access = DottedAccess(pack, member)
+        access.type = int_
+        return access
+
+    def visit_Block(self, block):
+        if self.depth > 1:
+            return super(LocalPacker, self).visit_Block(block)
+
+        # The block of the whole script: analyse it, then rewrite accesses.
+        self.resolver.visit(block)
+        literal_names = set(re.findall(r"\w+",
+                                       " ".join(self.resolver.code_literals)))
+        candidates = [variable for variable in self.resolver.variables
+                      if variable.declaration.expression.type is int_ and
+                      variable.name not in literal_names]
+        self.infer_ranges(candidates)
+        self.allocate(candidates)
+
+        block = super(LocalPacker, self).visit_Block(block)
+        declarations = []
+        for definition, _ in self.packs:
+            pack = VarRef(definition.name)
+            pack.type = definition
+            declarations.append(Assignment(pack, Constant(0, int_), True))
+        block.statements[:0] = declarations
+        return block
+
+    def visit_FunctionDefinition(self, function_def):
+        return function_def
+
+    def visit_VarRef(self, var_ref):
+        variable = self.resolver.references.get(id(var_ref))
+        if variable in self.members:
+            return self.access(variable)
+        return var_ref
+
+    def visit_BitfieldAssignment(self, assignment):
+        return self.generic_visit(assignment)
+
+    def visit_Assignment(self, assignment):
+        assignment.expression = self.visit(assignment.expression)
+        variable = self.resolver.assignments.get(id(assignment))
+        if variable in self.members:
+            return BitfieldAssignment(self.access(variable),
+                                      assignment.expression, False)
+        return assignment
+
+    def report(self):
+        packs = []
+        for definition, variables in self.packs:
+            members = []
+            for variable, (member, length) in zip(variables,
+                                                  definition.members):
+                offset, _ = definition.get_member_limits(member)
+                members.append({"name": variable.name, "offset": offset,
+                                "length": length,
+                                "range": list(self.ranges[variable])})
+            packs.append({"name": definition.name, "members": members})
+        packed = len(self.members)
+        return OrderedDict([("variables", len(self.resolver.variables)),
+                            ("packed", packed),
+                            ("saved", packed - len(self.packs)),
+                            ("packs", packs)])
+
+
+def format_report(report):
+    lines = ["%d of %d variable(s) packed into %d int(s), %d saved" % (
+        report["packed"], report["variables"], len(report["packs"]),
+        report["saved"])]
+    for pack in report["packs"]:
+        lines.append("  %s: %s" % (pack["name"], ", ".join(
+            "%s [%d, %d] %d..%d" % ((member["name"], member["offset"],
+                                     member["length"]) +
+                                    tuple(member["range"]))
+            for member in pack["members"])))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,126 @@
+from redux.ast import (Assignment, Constant, VarRef, NegateOp, AddOp, SubOp,
+                       LessThanOp, LessThanOrEqualToOp, GreaterThanOp,
+                       GreaterThanOrEqualToOp, NotEqualToOp)
+from redux.types import int_
+from redux.visitor import ASTVisitor
+
+
+CONDITIONS = {
+    LessThanOp: lambda a, b: a < b,
+    LessThanOrEqualToOp: lambda a, b: a <= b,
+    GreaterThanOp: lambda a, b: a > b,
+    GreaterThanOrEqualToOp: lambda a, b: a >= b,
+    NotEqualToOp: lambda a, b: a != b,
+}
+
+# Mirrored relations for conditions written as "constant op variable".
+MIRRORED_CONDITIONS = {
+    LessThanOp: GreaterThanOp,
+    LessThanOrEqualToOp: GreaterThanOrEqualToOp,
+    GreaterThanOp: LessThanOp,
+    GreaterThanOrEqualToOp: LessThanOrEqualToOp,
+    NotEqualToOp: NotEqualToOp,
+}
+
+
+def int_constant_value(expr):
+    """Returns the value of an integer constant expression, or None."""
+    if isinstance(expr, NegateOp):
+        value = int_constant_value(expr.expression)
+        return None if value is None else -value
+    if isinstance(expr, Constant) and expr.type is int_:
+        return expr.value
+    return None
+
+
+class AssignmentFinder(ASTVisitor):
+    """Checks whether a variable is assigned anywhere in a subtree."""
+    def __init__(self, name):
+        super(AssignmentFinder, self).__init__()
+        self.name = name
+        self.found = False
+
+    def visit_Assignment(self, assignment):
+        if assignment.variable.name == self.name:
+            self.found = True
+        self.generic_visit(assignment)
+
+    def visit_BitfieldAssignment(self, assignment):
+        if assignment.variable.expression.name == self.name:
+            self.found = True
+        self.generic_visit(assignment)
+
+    def visit_CodeLiteral(self, code_literal):
+        # Code literals are opaque, so assume they may write anything.
+        if self.name in code_literal.code:
+            self.found = True
+
+
+def is_assigned_in(name, node):
+    finder = AssignmentFinder(name)
+    finder.visit(node)
+    return finder.found
+
+
+def induction_variable(for_stmt):
+    """Returns the name of the induction variable of a for loop, or None."""
+    assignment = for_stmt.assignment
+    if type(assignment) is not Assignment:
+        return None
+    return assignment.variable.name
+
+
+def induction_values(for_stmt, limit):
+    """Computes the values taken by the induction variable of a for loop.
+
+    Returns a list with the value at the start of every iteration followed by
+    the value the variable holds once the loop exits, or None if the loop is
+    not of the form 'for i = C, i op C, i = i +/- C' with an untouched
+    induction variable, or runs for more than limit iterations.
+    """
+    name = induction_variable(for_stmt)
+    if name is None or for_stmt.condition is None or for_stmt.step_expr is None:
+        return None
+
+    value = int_constant_value(for_stmt.assignment.expression)
+    if value is None:
+        return None
+
+    condition = for_stmt.condition
+    if type(condition) not in CONDITIONS:
+        return None
+    if isinstance(condition.lhs, VarRef) and condition.lhs.name == name:
+        relation = type(condition)
+        bound = int_constant_value(condition.rhs)
+    elif isinstance(condition.rhs, VarRef) and condition.rhs.name == name:
+        relation = MIRRORED_CONDITIONS[type(condition)]
+        bound = int_constant_value(condition.lhs)
+    else:
+        return None
+    if bound is None:
+        return None
+
+    step = for_stmt.step_expr
+    if (type(step) is not Assignment or step.variable.name != name or
+        type(step.expression) not in (AddOp, SubOp) or
+        not isinstance(step.expression.lhs, VarRef) or
+        step.expression.lhs.name != name):
+        return None
+    increment = int_constant_value(step.expression.rhs)
+    if not increment:
+        return None
+    if type(step.expression) is SubOp:
+        increment = -increment
+
+    if is_assigned_in(name, for_stmt.block):
+        return None
+
+    test = CONDITIONS[relation]
+    values = []
+    while test(value, bound):
+        if len(values) >= limit:
+            return None
+        values.append(value)
+        value += increment
+    values.append(value)
+    return values
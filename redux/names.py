@@ -1,8 +1,10 @@
 from redux.typeannotate import INITIAL_SCOPE
-from redux.intrinsics import get_intrinsic_functions
+from redux.intrinsics import get_intrinsic_functions, get_perform_intrinsics
 
 def get_initial_names():
     for name in INITIAL_SCOPE:
         yield name
     for name, _ in get_intrinsic_functions():
         yield name
+    for name, _ in get_perform_intrinsics():
+        yield name
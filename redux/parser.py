@@ -9,9 +9,10 @@ from redux.ast import (Block, Assignment, BitfieldAssignment, WhileStmt, IfStmt,
                        ChronalAccess, ClassAccess, Query, BitwiseOrOp,
                        BitwiseXorOp, BitwiseAndOp, BitwiseLeftShiftOp,
                        BitwiseRightShiftOp, ModuloOp, NegateOp, BitwiseNotOp,
-                       PowerOp, ForStmt, Require)
+                       PowerOp, ForStmt, Require, LazyBlock)
 from redux.lexer import Lexer
 from redux.types import str_, int_, float_
+import threading
 
 
 class Parser(object):
@@ -20,9 +21,11 @@ class Parser(object):
     def __init__(self, **kwargs):
         self._parser = yacc.yacc(module=self, **kwargs)
 
-    def parse(self, code):
+    def parse(self, code, lexer=None):
         self.errors = []
-        return self._parser.parse(code, lexer=Lexer()), self.errors
+        if lexer is None:
+            lexer = Lexer()
+        return self._parser.parse(code, lexer=lexer), self.errors
 
     def error(self, lineno, message):
         self.errors.append((lineno, message))
@@ -384,8 +387,101 @@ binary_expr(BitwiseRightShiftOp, 'RSHIFT')
 binary_expr(ModuloOp, 'PERCENT')
 binary_expr(PowerOp, 'POW')
 
-_parser = Parser()
-
-
-def parse(code):
-    return _parser.parse(code)
+# PLY parsers keep their parse state, and ours the errors, on the instance,
+# so every thread gets a parser of its own. The one built on import writes
+# the parse tables the others then load.
+_parsers = threading.local()
+_parsers.parser = Parser()
+
+
+def get_parser():
+    """Returns the parser of the calling thread."""
+    parser = getattr(_parsers, "parser", None)
+    if parser is None:
+        parser = _parsers.parser = Parser(write_tables=False, debug=False)
+    return parser
+
+
+def parse(code, lexer=None):
+    return get_parser().parse(code, lexer)
+
+
+# Keywords whose construct is closed by END.
+BLOCK_KEYWORDS = frozenset(["IF", "WHILE", "FOR", "DEF", "BITFIELD", "ENUM"])
+
+
+def function_spans(code):
+    """Yields (start, body_start, body_end, end, lineno) for every top-level
+    function definition of code with a well-formed signature, by matching
+    its END token; the span of the body excludes both."""
+    lexer = Lexer()
+    lexer.input(code)
+    depth = 0
+    header = body_start = None
+    while True:
+        token = lexer.token()
+        if token is None:
+            return
+        if header is not None:
+            # DEF ID LPAREN [ID {COMMA ID}] RPAREN
+            header.append(token.type)
+            if token.type == "RPAREN":
+                if _is_signature(header):
+                    body_start = token.lexpos + 1
+                header = None
+        if token.type in BLOCK_KEYWORDS:
+            if depth == 0 and token.type == "DEF":
+                start, lineno = token.lexpos, token.lineno
+                header, body_start = [], None
+            depth += 1
+        elif token.type == "END" and depth > 0:
+            depth -= 1
+            if depth == 0 and body_start is not None:
+                yield (start, body_start, token.lexpos,
+                       token.lexpos + len(token.value), lineno)
+                body_start = None
+
+
+def _is_signature(header):
+    tokens = header[2:-1]
+    return (header[:2] == ["ID", "LPAREN"] and
+            tokens[0::2] == ["ID"] * len(tokens[0::2]) and
+            tokens[1::2] == ["COMMA"] * len(tokens[1::2]) and
+            (not tokens or tokens[-1] == "ID"))
+
+
+def parse_library(code, path=None):
+    """Parses a required file without parsing the bodies of its top-level
+    function definitions.
+
+    Every body is only lexed to find where the definition ends, and left
+    out of the code that is parsed, keeping its line breaks so that line
+    numbers do not change. The block of each definition is a LazyBlock
+    that parse_body() turns into the parsed body.
+    """
+    spans = list(function_spans(code))
+    pieces = []
+    position = 0
+    for _, body_start, body_end, _, _ in spans:
+        pieces.append(code[position:body_start])
+        pieces.append("\n" * code.count("\n", body_start, body_end))
+        position = body_end
+    pieces.append(code[position:])
+
+    ast_, errors = parse("".join(pieces))
+    if not errors:
+        definitions = [stmt for stmt in ast_.statements
+                       if isinstance(stmt, FunctionDefinition)]
+        for function_def, (start, _, _, end, lineno) in zip(definitions,
+                                                            spans):
+            function_def.block = LazyBlock(code[start:end], lineno, path)
+    return ast_, errors
+
+
+def parse_body(lazy_block):
+    """Parses the body of a function definition parse_library() left
+    unparsed, returning (block, errors)."""
+    ast_, errors = parse("\n" * (lazy_block.lineno - 1) + lazy_block.code)
+    if errors:
+        return None, errors
+    return ast_.statements[0].block, errors
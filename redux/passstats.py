@@ -0,0 +1,134 @@
+"""Per-stage statistics of a compilation (--time-passes, --mem-stats)."""
+from os import makedirs
+from os.path import join, basename
+import cProfile
+import time
+import tracemalloc
+
+from redux.ast import ASTNode
+
+
+def count_nodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children())
+    return count
+
+
+def _ast_of(value):
+    # Parsers return an (ast, errors) tuple.
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    return value if isinstance(value, ASTNode) else None
+
+
+class StageStats(object):
+    def __init__(self, name, wall_time, cpu_time, nodes_before=None,
+                 nodes_after=None, peak_memory=None):
+        super(StageStats, self).__init__()
+        self.name = name
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.nodes_before = nodes_before
+        self.nodes_after = nodes_after
+        self.peak_memory = peak_memory
+
+    def to_json(self):
+        return dict((name, getattr(self, name)) for name in
+                    ("name", "wall_time", "cpu_time", "nodes_before",
+                     "nodes_after", "peak_memory"))
+
+
+class NullPassStats(object):
+    """Runs stages without measuring anything."""
+    def run(self, name, function, *args):
+        return function(*args)
+
+
+class PassStats(NullPassStats):
+    """Measures every stage of a compilation run through it.
+
+    Records wall and CPU time and the number of AST nodes before and after
+    each stage. With mem_stats set, tracemalloc is used to record how much
+    memory each stage needed at its peak, beyond what was allocated when it
+    started. With profile_dir set, each stage is profiled with cProfile and
+    its statistics dumped to <profile_dir>/<prefix>.<index>-<stage>.prof.
+    """
+    def __init__(self, mem_stats=False, profile_dir=None, prefix="redux"):
+        super(PassStats, self).__init__()
+        self.mem_stats = mem_stats
+        self.profile_dir = profile_dir
+        self.prefix = basename(prefix)
+        self.stages = []
+
+    def run(self, name, function, *args):
+        before = _ast_of(args[0]) if args else None
+        nodes_before = count_nodes(before) if before is not None else None
+
+        if self.mem_stats:
+            was_tracing = tracemalloc.is_tracing()
+            if not was_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        if self.profile_dir is not None:
+            profile = cProfile.Profile()
+            profile.enable()
+
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        result = function(*args)
+        wall_time = time.perf_counter() - start_wall
+        cpu_time = time.process_time() - start_cpu
+
+        if self.profile_dir is not None:
+            profile.disable()
+            makedirs(self.profile_dir, exist_ok=True)
+            profile.dump_stats(join(self.profile_dir, "%s.%02d-%s.prof" % (
+                self.prefix, len(self.stages), name)))
+        peak_memory = None
+        if self.mem_stats:
+            peak_memory = tracemalloc.get_traced_memory()[1] - start_memory
+            if not was_tracing:
+                tracemalloc.stop()
+
+        after = _ast_of(result)
+        self.stages.append(StageStats(
+            name, wall_time, cpu_time, nodes_before,
+            count_nodes(after) if after is not None else None, peak_memory))
+        return result
+
+    def total(self):
+        peaks = [stage.peak_memory for stage in self.stages
+                 if stage.peak_memory is not None]
+        return StageStats("total",
+                          sum(stage.wall_time for stage in self.stages),
+                          sum(stage.cpu_time for stage in self.stages),
+                          peak_memory=max(peaks) if peaks else None)
+
+    def to_json(self):
+        return {"stages": [stage.to_json() for stage in self.stages],
+                "total": self.total().to_json()}
+
+    def format(self):
+        def optional(value, fmt):
+            return "-" if value is None else fmt % value
+
+        lines = ["%-24s %10s %10s %10s %10s%s" % (
+            "stage", "wall ms", "cpu ms", "nodes in", "nodes out",
+            " %10s" % "peak KiB" if self.mem_stats else "")]
+        for stage in self.stages + [self.total()]:
+            line = "%-24s %10.2f %10.2f %10s %10s" % (
+                stage.name, stage.wall_time * 1000, stage.cpu_time * 1000,
+                optional(stage.nodes_before, "%d"),
+                optional(stage.nodes_after, "%d"))
+            if self.mem_stats:
+                peak_memory = stage.peak_memory
+                if peak_memory is not None:
+                    peak_memory /= 1024.0
+                line += " %10s" % optional(peak_memory, "%.1f")
+            lines.append(line)
+        return "\n".join(lines) + "\n"
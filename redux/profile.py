@@ -0,0 +1,318 @@
+"""Instrumented builds and profile-guided ordering of tests.
+
+The order of the arms of an if/elif chain and of the operands of a query
+condition is a guess at how often each test holds. An instrumented build
+counts it instead: every if/elif chain and every query WHERE condition that
+is an `and`/`or` chain is a site with counters in achronal fields, from a
+counter base up.
+
+- branch sites count how often each arm of the chain is entered, with an
+  increment at the start of its block;
+- where sites count the candidate units of the query and, for every
+  operand of the chain, those it holds for, with VALUE SUM queries run just
+  before the statement containing the query. Operands that may fail or have
+  effects are not evaluated on their own and have no counter.
+
+The compiler writes a map of the sites and their counters. Once the map has
+been run, the map with a "counts" object added, mapping each counter's
+field to its value, is a profile: a build using it reorders the arms of
+if/elif chains that test one expression against distinct constants, most
+often taken first, and query conditions by the measured probabilities
+instead of fixed guesses.
+
+Sites are labeled right after parsing, so an instrumented build and a
+profile-guided one of the same source agree on them whatever optimizations
+either runs. A site is found in a profile by its kind, a fingerprint of its
+conditions and how many sites with both came before it; sites that changed
+since the profile was taken are left alone.
+"""
+from copy import deepcopy
+from hashlib import sha1
+from redux.ast import (AddOp, Assignment, Block, Constant, ExprStmt,
+                       FunctionCall, LogicalAndOp, LogicalOrOp, Query,
+                       ReturnStmt)
+from redux.conditionorder import chain_operands
+from redux.decisiontree import chain_cases, if_chain
+from redux.intrinsics import get_intrinsic
+from redux.types import int_
+from redux.visitor import ASTTransformer, ASTVisitor
+
+
+# First achronal field used for counters unless told otherwise.
+DEFAULT_COUNTER_BASE = 1000
+
+
+class ProfileError(ValueError):
+    pass
+
+
+def fingerprint(conditions):
+    return sha1(repr(conditions).encode("utf8")).hexdigest()[:12]
+
+
+class Profile(object):
+    """Counts taken by running an instrumented build."""
+    def __init__(self, sites, counts):
+        super(Profile, self).__init__()
+        self.sites = {}
+        occurrences = {}
+        for site in sites:
+            key = (site["kind"], site["fingerprint"])
+            occurrences[key] = occurrences.get(key, 0) + 1
+            self.sites[key + (occurrences[key],)] = site["counters"]
+        self.counts = counts
+
+    @classmethod
+    def from_json(cls, data):
+        try:
+            counts = dict((int(field), int(count))
+                          for field, count in data["counts"].items())
+            return cls(data["sites"], counts)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            raise ProfileError("not a profile of an instrumented build")
+
+    def site_counts(self, kind, fingerprint_, occurrence):
+        """Returns the counts of a site, None where it has no counter, or
+        None if the profile has no such site.
+
+        Achronal fields start at zero, so counters missing from the profile
+        count zero.
+        """
+        counters = self.sites.get((kind, fingerprint_, occurrence))
+        if counters is None:
+            return None
+        return [None if field is None else self.counts.get(field, 0)
+                for field in counters]
+
+
+class QueryFinder(ASTVisitor):
+    """Lists the queries of a statement that are not part of another."""
+    def __init__(self):
+        super(QueryFinder, self).__init__()
+        self.queries = []
+
+    def visit_Query(self, query):
+        self.queries.append(query)
+
+
+class CountableCheck(ASTVisitor):
+    """Checks an expression can be evaluated on its own: it has no effect
+    and cannot fail."""
+    def __init__(self):
+        super(CountableCheck, self).__init__()
+        self.countable = True
+
+    def visit_FunctionCall(self, func_call):
+        intrinsic = get_intrinsic(func_call.function)
+        if intrinsic is None or not (intrinsic.pure and intrinsic.total):
+            self.countable = False
+        self.generic_visit(func_call)
+
+    def visit_Query(self, query):
+        self.countable = False
+
+    def visit_CodeLiteral(self, code_literal):
+        self.countable = False
+
+    def visit_DivOp(self, op):
+        self.countable = False
+
+    def visit_ModuloOp(self, op):
+        self.countable = False
+
+
+def is_countable(expr):
+    check = CountableCheck()
+    check.visit(expr)
+    return check.countable
+
+
+def increment(field, amount):
+    """Returns the statement AF[field] = AF[field] + amount."""
+    return ExprStmt(FunctionCall("__set_achronal_field", [
+        Constant(field, int_),
+        AddOp(FunctionCall("__get_achronal_field", [Constant(field, int_)]),
+              amount)]))
+
+
+class SiteLabeler(ASTTransformer):
+    """Finds the sites of a parsed script, before type annotation.
+
+    With counter_base set, counters are added to every site and described
+    in counter_map(). With a profile, the arms of branch sites get the
+    number of times they were taken as `taken`, and the operands of where
+    sites the probability that they hold as `probability`.
+    """
+    def __init__(self, counter_base=None, profile=None):
+        super(SiteLabeler, self).__init__()
+        self.counter_base = counter_base
+        self.profile = profile
+        self.next_field = counter_base
+        self.sites = []
+        self.occurrences = {}
+        # Statements to insert before the statement being visited.
+        self.before = []
+        self.profiled = 0
+
+    def visit_Expr(self, expr):
+        return expr
+
+    def visit_Block(self, block):
+        outer = self.before
+        statements = []
+        for stmt in block.statements:
+            self.before = []
+            if isinstance(stmt, (Assignment, ExprStmt, ReturnStmt)):
+                self.before = self.label_queries(stmt)
+            else:
+                stmt = self.visit(stmt)
+            statements.extend(self.before)
+            statements.append(stmt)
+        block.statements = statements
+        self.before = outer
+        return block
+
+    def visit_IfStmt(self, if_stmt):
+        arms, else_part = if_chain(if_stmt)
+        self.label_branches(arms)
+        for index, arm in enumerate(arms):
+            # The condition of an elif is evaluated in the else block of the
+            # arm before it.
+            counters = self.label_queries(arm.condition)
+            if index == 0:
+                self.before.extend(counters)
+            else:
+                arms[index - 1].else_part.statements[:0] = counters
+            arm.then_block = self.visit(arm.then_block)
+        if else_part is not None:
+            arms[-1].else_part = self.visit(else_part)
+        return if_stmt
+
+    def add_site(self, kind, conditions, counters):
+        """Registers a site, returning its counter fields and its counts in
+        the profile, or None."""
+        fingerprint_ = fingerprint(conditions)
+        key = (kind, fingerprint_)
+        self.occurrences[key] = self.occurrences.get(key, 0) + 1
+        fields = []
+        for countable in counters:
+            if self.counter_base is not None and countable:
+                fields.append(self.next_field)
+                self.next_field += 1
+            else:
+                fields.append(None)
+        self.sites.append({"kind": kind, "fingerprint": fingerprint_,
+                           "counters": fields})
+
+        counts = None
+        if self.profile is not None:
+            counts = self.profile.site_counts(kind, fingerprint_,
+                                              self.occurrences[key])
+            if counts is not None:
+                self.profiled += 1
+        return fields, counts
+
+    def label_branches(self, arms):
+        fields, counts = self.add_site(
+            "branch", [arm.condition for arm in arms], [True] * len(arms))
+        if counts is None:
+            counts = [None] * len(arms)
+        for arm, field, count in zip(arms, fields, counts):
+            if count is not None:
+                arm.taken = count
+            if field is not None:
+                arm.then_block.statements.insert(
+                    0, increment(field, Constant(1, int_)))
+
+    def label_queries(self, node):
+        """Labels the queries of node, returning the statements counting
+        them."""
+        finder = QueryFinder()
+        finder.visit(node)
+        statements = []
+        for query in finder.queries:
+            self.label_where(query, statements)
+        return statements
+
+    def label_where(self, query, statements):
+        op_type = type(query.where_cond)
+        if op_type not in (LogicalAndOp, LogicalOrOp):
+            return
+        operands = chain_operands(query.where_cond, op_type)
+        countable = [is_countable(operand) for operand in operands]
+        fields, counts = self.add_site("where", operands,
+                                       [True] + countable)
+
+        if counts is not None and counts[0]:
+            for operand, count in zip(operands, counts[1:]):
+                if count is not None:
+                    operand.probability = float(count) / counts[0]
+
+        for field, condition in zip(fields, [Constant(1, int_)] + operands):
+            if field is not None:
+                candidates = Query("VALUE", deepcopy(query.unit), "SUM",
+                                   Constant(1, int_), deepcopy(condition))
+                statements.append(increment(field, candidates))
+
+    def counter_map(self):
+        return {"counter_base": self.counter_base,
+                "fields": self.next_field - self.counter_base,
+                "sites": self.sites}
+
+    def report(self):
+        return {"sites": len(self.sites), "profiled": self.profiled}
+
+
+class BranchReorderer(ASTTransformer):
+    """Reorders if/elif chains by how often a profile saw each arm taken.
+
+    Only chains whose conditions cannot hold together are reordered, which
+    is the case when they compare the same movable expression with distinct
+    constants; a test for several constants counts as several tests.
+    """
+    def __init__(self):
+        super(BranchReorderer, self).__init__()
+        self.chains = 0
+        self.reordered = 0
+
+    def visit_Expr(self, expr):
+        return expr
+
+    def visit_FunctionDefinition(self, func_def):
+        return func_def
+
+    def visit_IfStmt(self, if_stmt):
+        arms, else_part = if_chain(if_stmt)
+        for arm in arms:
+            arm.then_block = self.visit(arm.then_block)
+        if else_part is not None:
+            else_part = self.visit(else_part)
+
+        if any(getattr(arm, "taken", None) is None for arm in arms):
+            return if_stmt
+        cases = chain_cases(arms)
+        if cases is None:
+            return if_stmt
+
+        self.chains += 1
+        ranks = dict((id(arm), float(arm.taken) / len(values))
+                     for arm, values in zip(arms, cases[1]))
+        # sorted() is stable, so arms taken as often keep their order.
+        ordered = sorted(arms, key=lambda arm: -ranks[id(arm)])
+        if all(a is b for a, b in zip(ordered, arms)):
+            return if_stmt
+
+        self.reordered += 1
+        for arm, next_arm in zip(ordered, ordered[1:]):
+            arm.else_part = Block([next_arm])
+        ordered[-1].else_part = else_part
+        return ordered[0]
+
+    def report(self):
+        return {"chains": self.chains, "reordered": self.reordered}
+
+
+def format_report(report):
+    return ("%d of %d site(s) found in the profile, %d of %d if/elif chain(s) "
+            "reordered\n" % (report["profiled"], report["sites"],
+                             report["reordered"], report["chains"]))
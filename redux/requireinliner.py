@@ -1,48 +1,301 @@
+import marshal
 import sys
-from os import getcwd
-from os.path import splitext
-from redux.parser import parse
+import threading
+from collections import OrderedDict
+from hashlib import sha1
+from os.path import splitext, getmtime, realpath, join
+from redux.ast import LazyBlock
+from redux.parser import parse_body, parse_library
+from redux.serialize import (load_library, write_library, encode, decode,
+                             source_hash, InvalidLibraryError)
 from redux.visitor import ASTTransformer, ASTVisitor
 
 
+class RequireCycleError(RuntimeError):
+    pass
+
+
+class TopLevelCodeError(RuntimeError):
+    pass
+
+
+class RequireSyntaxError(RuntimeError):
+    pass
+
+
+class TopLevelCodeChecker(ASTVisitor):
+    """Checks there is no top-level code in the required file."""
+    def __init__(self, path):
+        super(TopLevelCodeChecker, self).__init__()
+        self.path = path
+
+    def visit_FunctionDefinition(self, funcdef):
+        pass
+
+    def visit_EnumDefinition(self, enumdef):
+        pass
+
+    def visit_BitfieldDefinition(self, bitfielddef):
+        pass
+
+    def visit_Require(self, require):
+        pass
+
+    def visit_Stmt(self, stmt):
+        raise TopLevelCodeError("%s: code outside of definitions in a "
+                                "required file" % self.path)
+
+
+class LibraryCache(object):
+    """Parsed required files, keyed by canonical path and modification time.
+
+    Libraries are kept in the encoded form of redux.serialize, from which
+    every compilation decodes its own copy. The bodies of their functions
+    are only parsed once a compilation calls them, see BodyParser, and then
+    kept the same way. With precompiled set, they are
+    also stored as .reduxc files, either next to their source or in
+    precompiled_dir, and loaded from there instead of being parsed again
+    while their source is unchanged.
+
+    The hash of the source of each cached library is kept along with it,
+    see source_hash().
+
+    If max_size is given, the least recently used libraries are evicted,
+    along with their parsed bodies, once the total size of their marshalled
+    encodings exceeds it.
+
+    A LibraryCache can be shared by compilations running in several threads.
+    """
+    def __init__(self, precompiled=False, precompiled_dir=None, max_size=None):
+        super(LibraryCache, self).__init__()
+        self.precompiled = precompiled
+        self.precompiled_dir = precompiled_dir
+        self.max_size = max_size
+        self.size = 0
+        self.libraries = OrderedDict()
+        # (canonical path, line, source) of a body -> (encoded body, size)
+        self.bodies = {}
+        self.lock = threading.Lock()
+
+    def precompiled_path(self, canonical_path):
+        if self.precompiled_dir is None:
+            return splitext(canonical_path)[0] + ".reduxc"
+        digest = sha1(canonical_path.encode("utf8")).hexdigest()
+        return join(self.precompiled_dir, digest + ".reduxc")
+
+    def load_precompiled(self, canonical_path, code):
+        try:
+            with open(self.precompiled_path(canonical_path), "rb") as file_:
+                data = file_.read()
+            return load_library(data, code)[0]
+        except (IOError, InvalidLibraryError):
+            return None
+
+    def parse(self, path, canonical_path):
+        """Returns the encoded AST of a required file and the hash of the
+        source it was parsed from."""
+        with open(canonical_path, "rt") as file_:
+            code = file_.read()
+
+        if self.precompiled:
+            encoded = self.load_precompiled(canonical_path, code)
+            if encoded is not None:
+                return encoded, source_hash(code)
+
+        ast_, errors = parse_library(code, canonical_path)
+        report_errors(path, errors)
+
+        TopLevelCodeChecker(path).visit(ast_)
+
+        if self.precompiled:
+            write_library(self.precompiled_path(canonical_path), ast_, code)
+
+        return encode(ast_), source_hash(code)
+
+    def encoded_size(self, encoded):
+        if self.max_size is None:
+            return 0
+        return len(marshal.dumps(encoded))
+
+    def evict(self, key):
+        self.size -= self.libraries.pop(key)[1]
+        for body_key in [body_key for body_key in self.bodies
+                         if body_key[0] == key[0]]:
+            self.size -= self.bodies.pop(body_key)[1]
+
+    def make_room(self, size):
+        if self.max_size is not None:
+            while self.libraries and self.size + size > self.max_size:
+                self.evict(next(iter(self.libraries)))
+
+    def add(self, key, encoded, digest):
+        # Older versions of the same file will never be asked for again.
+        for old_key in [old_key for old_key in self.libraries
+                        if old_key[0] == key[0]]:
+            self.evict(old_key)
+
+        size = self.encoded_size(encoded)
+        self.make_room(size)
+        self.libraries[key] = (encoded, size, digest)
+        self.size += size
+
+    def load(self, path, canonical_path):
+        """Returns a fresh copy of the AST of a required file."""
+        key = (canonical_path, getmtime(canonical_path))
+        with self.lock:
+            entry = self.libraries.get(key)
+            if entry is not None:
+                self.libraries.move_to_end(key)
+        if entry is None:
+            # Threads requiring the same new file may all parse it.
+            encoded, digest = self.parse(path, canonical_path)
+            with self.lock:
+                self.add(key, encoded, digest)
+        else:
+            encoded = entry[0]
+        return decode(encoded)
+
+    def source_hash(self, canonical_path):
+        """Returns the hash of the source the cached copy of a required file
+        was parsed from, or None if the file changed since or is not
+        cached."""
+        try:
+            key = (canonical_path, getmtime(canonical_path))
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.libraries.get(key)
+        return None if entry is None else entry[2]
+
+    def load_body(self, lazy_block):
+        """Returns a fresh copy of the parsed body of a LazyBlock."""
+        key = (lazy_block.path, lazy_block.lineno, lazy_block.code)
+        with self.lock:
+            entry = self.bodies.get(key)
+        if entry is not None:
+            return decode(entry[0])
+
+        block, errors = parse_body(lazy_block)
+        report_errors(lazy_block.path, errors)
+        encoded = encode(block)
+        size = self.encoded_size(encoded)
+        with self.lock:
+            # Bodies go when their library does.
+            if any(library_key[0] == lazy_block.path
+                   for library_key in self.libraries):
+                self.make_room(size)
+                self.bodies[key] = (encoded, size)
+                self.size += size
+        return block
+
+
+def report_errors(path, errors):
+    if errors:
+        for lineno, message in errors:
+            sys.stderr.write("%s:%d: %s\n" % (path, lineno, message))
+        raise RequireSyntaxError("%s: syntax errors in a required file" %
+                                 path)
+
+
 class RequireInliner(ASTTransformer):
-    """Inlines the AST of files included with 'require'."""
+    """Inlines the AST of files included with 'require'.
+
+    Every file is included at most once per compilation, however many times
+    and through however many paths it is required. Parsed files are kept in
+    library_cache; pass the same LibraryCache to several RequireInliners to
+    share it between compilations. The paths of all required files end up in
+    the dependencies list.
+    """
+    def __init__(self, library_cache=None, filename=None):
+        super(RequireInliner, self).__init__()
+        if library_cache is None:
+            library_cache = LibraryCache()
+        self.library_cache = library_cache
+        self.dependencies = []
+        self.included = set()
+        # Chain of files currently being inlined, for cycle detection.
+        self.stack = []
+        if filename is not None:
+            self.included.add(realpath(filename))
+            self.stack.append((realpath(filename), filename))
+
+    def visit_Expr(self, expr):
+        # Expressions cannot contain require statements.
+        return expr
+
     def visit_Require(self, require):
         base_filename, extension = splitext(require.path)
 
         if extension == ".redux":
-            with open(require.path, "rt") as file_:
-                code = file_.read()
-        else:
-            with open(require.path + ".redux", "rt") as file_:
-                code = file_.read()
-
-        ast_, errors = parse(code)
-        if errors:
-            for lineno, message in errors:
-                sys.stderr.write("%s:%d: %s\n" % (require.path, lineno, message))
-            raise RuntimeError
+            path = require.path
         else:
-            class TopLevelCodeError(RuntimeError):
-                pass
+            path = require.path + ".redux"
+        canonical_path = realpath(path)
+
+        for index, (stacked_path, _) in enumerate(self.stack):
+            if stacked_path == canonical_path:
+                chain = [name for _, name in self.stack[index:]] + [path]
+                raise RequireCycleError("require cycle: " + " -> ".join(chain))
 
-            class TopLevelCodeChecker(ASTVisitor):
-                """Checks there is no top-level code in the required file."""
-                def visit_FunctionDefinition(self, funcdef):
-                    pass
+        if canonical_path in self.included:
+            return None
 
-                def visit_EnumDefinition(self, enumdef):
-                    pass
+        self.included.add(canonical_path)
+        self.dependencies.append(path)
+        ast_ = self.library_cache.load(path, canonical_path)
 
-                def visit_BitfieldDefinition(self, bitfielddef):
-                    pass
+        self.stack.append((canonical_path, path))
+        self.visit(ast_)
+        self.stack.pop()
 
-                def visit_Require(self, require):
-                    pass
+        return ast_.statements
+
+
+class BodyParser(ASTVisitor):
+    """Parses the bodies of the functions of required files a script calls.
+
+    Required files are parsed without the bodies of their functions, which
+    are LazyBlocks until parsed here. A body is parsed if the script, or a
+    body parsed before, calls a function of the same name: this may parse
+    functions the calls do not resolve to, but never leaves out one they
+    do. The other bodies are never parsed, so that compilation time does not
+    grow with the parts of a library a script does not use.
+    """
+    def __init__(self, library_cache=None):
+        super(BodyParser, self).__init__()
+        if library_cache is None:
+            library_cache = LibraryCache()
+        self.library_cache = library_cache
+        # Name -> definitions whose body is not parsed yet.
+        self.unparsed = {}
+        self.called = set()
+        self.pending = []
+        self.parsed = 0
+
+    def visit_FunctionCall(self, func_call):
+        if func_call.function not in self.called:
+            self.called.add(func_call.function)
+            self.pending.append(func_call.function)
+        self.generic_visit(func_call)
+
+    def visit_FunctionDefinition(self, function_def):
+        if isinstance(function_def.block, LazyBlock):
+            self.unparsed.setdefault(function_def.name, []).append(
+                function_def)
+        else:
+            self.visit(function_def.block)
 
-                def visit_Stmt(self, stmt):
-                    raise TopLevelCodeError(stmt)
+    def visit_Block(self, block):
+        super(BodyParser, self).visit_Block(block)
+        if self.depth == 1:
+            self.parse_called()
+        return block
 
-            TopLevelCodeChecker().visit(ast_)
-            self.visit(ast_)
-            return ast_.statements
+    def parse_called(self):
+        while self.pending:
+            name = self.pending.pop()
+            for function_def in self.unparsed.pop(name, []):
+                function_def.block = self.library_cache.load_body(
+                    function_def.block)
+                self.parsed += 1
+                self.visit(function_def.block)
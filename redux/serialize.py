@@ -0,0 +1,120 @@
+"""Compact binary serialization of parsed ASTs (.reduxc files).
+
+ASTs are flattened into dicts, lists and tuples of plain values and written
+with marshal, so that loading a library costs one marshal.loads plus a
+single walk re-creating the nodes, instead of lexing and parsing it again.
+"""
+from hashlib import sha1
+import marshal
+
+from redux import __version__
+from redux import ast
+from redux.ast import (ASTNode, FunctionDefinition, EnumDefinition,
+                       BitfieldDefinition)
+from redux.files import write_atomically
+from redux.types import int_, float_, str_, object_
+
+
+MAGIC = b"REDUXC\x01"
+
+TYPES = dict((type_[0], type_) for type_ in (int_, float_, str_, object_))
+
+NODE_CLASSES = dict((name, cls) for name, cls in vars(ast).items()
+                    if isinstance(cls, type) and issubclass(cls, ASTNode))
+
+
+class InvalidLibraryError(ValueError):
+    pass
+
+
+def encode(value):
+    if isinstance(value, ASTNode):
+        encoded = {"": type(value).__name__}
+        for name, field in value.__dict__.items():
+            encoded[name] = encode(field)
+        return encoded
+    elif isinstance(value, list):
+        return [encode(item) for item in value]
+    elif isinstance(value, tuple):
+        if TYPES.get(value[0] if len(value) == 1 else None) is value:
+            return ("T", value[0])
+        return ("U", [encode(item) for item in value])
+    else:
+        return value
+
+
+def decode(value):
+    if isinstance(value, dict):
+        # Nodes are re-created without calling their constructors, as those
+        # may compute fields (EnumDefinition) or reset them
+        # (FunctionDefinition).
+        cls = NODE_CLASSES[value[""]]
+        node = cls.__new__(cls)
+        for name, field in value.items():
+            if name:
+                node.__dict__[name] = decode(field)
+        return node
+    elif isinstance(value, list):
+        return [decode(item) for item in value]
+    elif isinstance(value, tuple):
+        if value[0] == "T":
+            return TYPES[value[1]]
+        return tuple(decode(item) for item in value[1])
+    else:
+        return value
+
+
+def source_hash(code):
+    return sha1(code.encode("utf8")).hexdigest()
+
+
+def exported_definitions(ast_):
+    """Lists the definitions a library makes available to its users."""
+    exports = {"functions": [], "enums": {}, "bitfields": []}
+    for stmt in ast_.statements:
+        if isinstance(stmt, FunctionDefinition):
+            exports["functions"].append(stmt.name)
+        elif isinstance(stmt, EnumDefinition):
+            exports["enums"][stmt.name] = [name for name, _ in stmt.members]
+        elif isinstance(stmt, BitfieldDefinition):
+            exports["bitfields"].append(stmt.name)
+    return exports
+
+
+def dump_library(ast_, code):
+    """Serializes the parsed AST of a library with the given source."""
+    return MAGIC + marshal.dumps({
+        "compiler": __version__,
+        "source_hash": source_hash(code),
+        "exports": exported_definitions(ast_),
+        "ast": encode(ast_),
+    })
+
+
+def read_header(data):
+    if not data.startswith(MAGIC):
+        raise InvalidLibraryError("not a precompiled Redux library")
+    try:
+        return marshal.loads(data[len(MAGIC):])
+    except (EOFError, ValueError, TypeError):
+        raise InvalidLibraryError("corrupt precompiled Redux library")
+
+
+def load_library(data, code):
+    """Loads a library, checking it was built from code by this compiler.
+
+    Returns a (encoded ast, exports) tuple; the AST is left encoded so that
+    callers can keep it around and decode() a fresh copy whenever they need
+    one, which is much cheaper than deep-copying the nodes.
+    """
+    library = read_header(data)
+    if library.get("compiler") != __version__:
+        raise InvalidLibraryError("built by another compiler version")
+    if library.get("source_hash") != source_hash(code):
+        raise InvalidLibraryError("out of date")
+    return library["ast"], library["exports"]
+
+
+def write_library(path, ast_, code):
+    """Writes a .reduxc file so that readers never see a partial file."""
+    write_atomically(path, dump_library(ast_, code))
@@ -0,0 +1,260 @@
+"""Long-running compile server keeping the compiler and libraries warm.
+
+Clients connect to a Unix socket and send one JSON object per line; each
+gets one JSON object per line back. Requests look like
+
+    {"command": "compile", "input": "maps/a.redux", "output": "out/a.rescript"}
+
+where "output" is optional (the code is then returned as "code") and a
+"code" member can be given to compile unsaved editor contents instead of
+the file on disk. {"command": "stats"} reports cache and watch statistics.
+
+The server can also watch source directories, recompiling a script as soon
+as it or any file it requires changes.
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from os import remove
+from os.path import realpath, getmtime, exists
+import asyncio
+import json
+import socket
+import sys
+import time
+import traceback
+
+from redux.build import find_scripts, output_path
+from redux.codegenerator import Compiler
+from redux.files import write_atomically
+from redux.incremental import IncrementalParser
+from redux.requireinliner import LibraryCache
+
+
+DEFAULT_SOCKET = ".redux.sock"
+
+
+class Watch(object):
+    """A source directory whose scripts are compiled into an output directory."""
+    def __init__(self, source_dir, output_dir, extension=".rescript"):
+        super(Watch, self).__init__()
+        self.source_dir = source_dir
+        self.output_dir = output_dir
+        self.extension = extension
+
+    def output_path(self, path):
+        return output_path(self.source_dir, self.output_dir, path,
+                           self.extension)
+
+
+class CompileServer(object):
+    """Serves compile requests from warm caches.
+
+    Compilation happens on a single worker thread, so the caches never see
+    concurrent access while the event loop stays responsive.
+    """
+    def __init__(self, socket_path=DEFAULT_SOCKET, watches=(),
+                 interval=0.05, cache_size=256 * 1024 * 1024,
+                 precompiled=False, precompiled_dir=None):
+        super(CompileServer, self).__init__()
+        self.socket_path = socket_path
+        self.watches = list(watches)
+        self.interval = interval
+        self.library_cache = LibraryCache(precompiled, precompiled_dir,
+                                          cache_size)
+        self.compiler = Compiler(self.library_cache)
+        self.parser = IncrementalParser()
+        self.executor = ThreadPoolExecutor(1)
+        # Canonical paths of the files each watched script depends on.
+        self.dependencies = {}
+        self.mtimes = {}
+        self.compilations = 0
+
+    def compile(self, input_path, output_path_=None, code=None):
+        """Compiles a script, returning a JSON-serializable result."""
+        start = time.perf_counter()
+        dependencies = []
+        try:
+            if code is None:
+                with open(input_path, "rt") as file_:
+                    code = file_.read()
+            output_code = self.compiler.compile(input_path, code,
+                                                dependencies, self.parser)
+            if output_path_ is not None:
+                write_atomically(output_path_, output_code)
+        except Exception:
+            return {"ok": False, "input": input_path,
+                    "error": traceback.format_exc()}
+        finally:
+            self.compilations += 1
+
+        result = {"ok": True, "input": input_path,
+                  "dependencies": dependencies,
+                  "seconds": time.perf_counter() - start}
+        if output_path_ is None:
+            result["code"] = output_code
+        else:
+            result["output"] = output_path_
+        return result
+
+    def stats(self):
+        return {"ok": True, "compilations": self.compilations,
+                "libraries": len(self.library_cache.libraries),
+                "library_cache_size": self.library_cache.size,
+                "parsed_regions": self.parser.parsed_regions,
+                "reused_regions": self.parser.reused_regions,
+                "watched_scripts": len(self.dependencies)}
+
+    def handle_request(self, request):
+        command = request.get("command", "compile")
+        if command == "compile":
+            if "input" not in request:
+                return {"ok": False, "error": "no input given"}
+            return self.compile(request["input"], request.get("output"),
+                                request.get("code"))
+        elif command == "stats":
+            return self.stats()
+        else:
+            return {"ok": False, "error": "unknown command %r" % command}
+
+    async def handle_client(self, reader, writer):
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line.decode("utf8"))
+                except ValueError as e:
+                    response = {"ok": False, "error": "invalid request: %s" % e}
+                else:
+                    response = await loop.run_in_executor(
+                        self.executor, self.handle_request, request)
+                writer.write(json.dumps(response).encode("utf8") + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def stat(self, path):
+        try:
+            return getmtime(path)
+        except OSError:
+            return None
+
+    def scan(self):
+        """Returns the watched scripts that need to be recompiled."""
+        watched = {}
+        for watch in self.watches:
+            for path in find_scripts(watch.source_dir):
+                watched[path] = watch
+
+        changed = set()
+        required = set().union(*self.dependencies.values())
+        for path in list(watched) + list(required):
+            mtime = self.stat(path)
+            if self.mtimes.get(realpath(path)) != mtime:
+                self.mtimes[realpath(path)] = mtime
+                changed.add(realpath(path))
+
+        for path in list(self.dependencies):
+            if path not in watched:
+                del self.dependencies[path]
+
+        return [(watch, path) for path, watch in sorted(watched.items())
+                if realpath(path) in changed or
+                changed.intersection(self.dependencies.get(path, ()))]
+
+    def rebuild(self, stale):
+        for watch, path in stale:
+            result = self.compile(path, watch.output_path(path))
+            if result["ok"]:
+                dependencies = [realpath(dependency)
+                                for dependency in result["dependencies"]]
+                for dependency in dependencies:
+                    self.mtimes.setdefault(dependency, self.stat(dependency))
+                self.dependencies[path] = dependencies
+                sys.stderr.write("%s: compiled in %.1f ms\n" % (
+                    path, result["seconds"] * 1000))
+            else:
+                sys.stderr.write("%s: compilation failed\n%s" % (
+                    path, result["error"]))
+
+    async def watch(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            stale = await loop.run_in_executor(self.executor, self.scan)
+            if stale:
+                await loop.run_in_executor(self.executor, self.rebuild, stale)
+            await asyncio.sleep(self.interval)
+
+    async def serve(self):
+        if exists(self.socket_path):
+            remove(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle_client,
+                                                 path=self.socket_path)
+        tasks = [asyncio.ensure_future(server.serve_forever())]
+        if self.watches:
+            tasks.append(asyncio.ensure_future(self.watch()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            server.close()
+            if exists(self.socket_path):
+                remove(self.socket_path)
+
+
+def request(message, socket_path=DEFAULT_SOCKET):
+    """Sends one request to a running compile server and returns the reply."""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+        client.sendall(json.dumps(message).encode("utf8") + b"\n")
+        reply = b""
+        while not reply.endswith(b"\n"):
+            data = client.recv(65536)
+            if not data:
+                break
+            reply += data
+    finally:
+        client.close()
+    return json.loads(reply.decode("utf8"))
+
+
+def main(argv):
+    parser = ArgumentParser(prog='python -m redux serve',
+                            description='Serve compile requests over a Unix '
+                                        'socket, optionally recompiling '
+                                        'watched scripts when they change.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, metavar='PATH',
+                        help='socket to listen on (default: %(default)s)')
+    parser.add_argument('--watch', nargs=2, action='append', default=[],
+                        metavar=('SRC', 'OUT'),
+                        help='recompile scripts below SRC into OUT whenever '
+                             'they or the files they require change')
+    parser.add_argument('--extension', default='.rescript',
+                        help='extension of watched outputs '
+                             '(default: %(default)s)')
+    parser.add_argument('--interval', type=float, default=0.05,
+                        help='seconds between checks for changed files '
+                             '(default: %(default)s)')
+    parser.add_argument('--cache-size', type=int, default=256, metavar='MB',
+                        help='memory budget of the library cache '
+                             '(default: %(default)s)')
+    parser.add_argument('--precompile', action='store_true',
+                        help='keep parsed required files in .reduxc files '
+                             'next to their sources')
+    parser.add_argument('--precompile-dir', metavar='DIR',
+                        help='keep .reduxc files in DIR instead')
+    args = parser.parse_args(argv)
+
+    watches = [Watch(source_dir, output_dir, args.extension)
+               for source_dir, output_dir in args.watch]
+    server = CompileServer(args.socket, watches, args.interval,
+                           args.cache_size * 1024 * 1024,
+                           args.precompile or args.precompile_dir is not None,
+                           args.precompile_dir)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
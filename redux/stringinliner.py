@@ -1,3 +1,4 @@
+from redux.symtab import Scope
 from redux.types import str_
 from redux.visitor import ASTTransformer
 
@@ -6,20 +7,16 @@ class StringInliner(ASTTransformer):
     """Inlines all string references."""
     def __init__(self):
         super(ASTTransformer, self).__init__()
-        self.scopes = []
+        self.scope = Scope()
 
     def push_scope(self):
-        self.scopes.append({})
+        self.scope = self.scope.child()
 
     def pop_scope(self):
-        self.scopes.pop()
+        self.scope = self.scope.parent
 
     def find_variable(self, name):
-        for scope in reversed(self.scopes):
-            if name in scope:
-                return scope[name]
-
-        raise KeyError(name)
+        return self.scope.lookup(name)
 
     def visit_BitfieldAssignment(self, bitfield_assignment):
         return self.generic_visit(bitfield_assignment)
@@ -39,7 +36,7 @@ class StringInliner(ASTTransformer):
         try:
             self.find_variable(assignment.variable.name)
         except KeyError:
-            self.scopes[-1][assignment.variable.name] = assignment.expression
+            self.scope.define(assignment.variable.name, assignment.expression)
 
         if assignment.expression.type is str_:
             return None
@@ -0,0 +1,64 @@
+"""Persistent symbol table shared by the scoping passes.
+
+A Scope holds the names defined in one block and points to the scope
+enclosing it. Entering a block creates a child scope and leaving it returns
+to the parent, so taking a snapshot of the visible names, as function
+definitions do, is just keeping a reference to the current scope. Snapshots
+see names defined later in the scopes they share, like the list of scope
+dicts they replace did.
+
+Lookups remember where names resolved to, so repeated lookups of a name
+cost one dict access. Every definition of a name bumps a counter shared by
+the whole table, which invalidates the remembered resolutions of that name
+in all scopes.
+"""
+
+
+class Scope(object):
+    def __init__(self, parent=None, bindings=None):
+        super(Scope, self).__init__()
+        self.parent = parent
+        self.bindings = {} if bindings is None else dict(bindings)
+        self.resolved = {}
+        if parent is None:
+            self.versions = dict.fromkeys(self.bindings, 1)
+        else:
+            self.versions = parent.versions
+            for name in self.bindings:
+                self.versions[name] = self.versions.get(name, 0) + 1
+
+    def child(self, bindings=None):
+        return Scope(self, bindings)
+
+    def define(self, name, value):
+        """Binds name to value in this scope, shadowing outer bindings."""
+        self.bindings[name] = value
+        self.versions[name] = self.versions.get(name, 0) + 1
+
+    def lookup(self, name):
+        """Returns the innermost value bound to name, or raises KeyError."""
+        resolved = self.resolved.get(name)
+        if resolved is not None and resolved[0] == self.versions[name]:
+            return resolved[1]
+
+        scope = self
+        while scope is not None:
+            if name in scope.bindings:
+                value = scope.bindings[name]
+                self.resolved[name] = (self.versions[name], value)
+                return value
+            scope = scope.parent
+
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        try:
+            self.lookup(name)
+        except KeyError:
+            return False
+        return True
+
+    def __deepcopy__(self, memo):
+        # Copies of function definitions share the scope they were defined
+        # in; calls bind arguments in a new child scope instead of a copy.
+        return self
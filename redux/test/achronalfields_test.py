@@ -0,0 +1,67 @@
+from nose.tools import eq_
+from redux.codegenerator import compile_script
+
+
+def c(code, reports=None):
+    return compile_script("achronalfields_test", code,
+                          optimizations=["af-cache"], reports=reports)
+
+
+def performs(code):
+    rescript_code = c(code)
+    return (rescript_code.count("GET_ACHRONAL_FIELD"),
+            rescript_code.count("SET_ACHRONAL_FIELD"))
+
+
+def test_field_accesses():
+    code_examples = [
+        ("a = AF[1] b = AF[1] say(a, b)", (1, 0)),
+        ("enum E x y end a = AF[y] b = AF[y] say(a, b)", (1, 0)),
+        ("a = AF[1] b = AF[2] say(a, b)", (2, 0)),
+        # A write invalidates the slot it writes to only.
+        ("a = AF[1] AF[1] = 2 b = AF[1] say(a, b)", (2, 1)),
+        ("a = AF[1] AF[2] = 2 b = AF[1] say(a, b)", (1, 1)),
+        ("a = AF[1] i = a AF[i] = 2 b = AF[1] say(a, b)", (2, 1)),
+        # Reads in one branch are not known after the if.
+        ("if unit->HP > 0 a = AF[1] say(a) end b = AF[1] say(b)", (2, 0)),
+        ("a = AF[1] if a > 0 b = AF[1] say(b) end", (1, 0)),
+        ("a = AF[1] while a < 3 a = a + AF[1] end", (1, 0)),
+        ("a = AF[1] while a < 3 a = a + AF[1] AF[1] = a end", (2, 1)),
+        # Code literals may do anything.
+        ("a = AF[1] `say 1;` b = AF[1] say(a, b)", (2, 0)),
+        ("a = AF[1] `say perf_ret;` b = AF[1] say(a, b)", (2, 0)),
+        ("AF[1] = 1 AF[1] = 2", (0, 1)),
+        ("AF[1] = 1 AF[2] = 2", (0, 2)),
+        ("AF[1] = 1 a = AF[1] AF[1] = a + 1", (1, 2)),
+        ("AF[1] = 1 if unit->HP > 0 AF[1] = 2 end", (0, 2)),
+        ("AF[1] = 1 if unit->HP > 0 AF[1] = 2 end AF[1] = 3", (0, 2)),
+        ("AF[1] = 1 `say target;` AF[1] = 2", (0, 2)),
+        ("AF[1] = 1 say(target) AF[1] = 2", (0, 2)),
+        ("for i = 0, i < 3, i = i + 1 AF[1] = i end AF[1] = 3", (0, 2)),
+        ("while 1 AF[1] = 1 break AF[1] = 2 end", (0, 2)),
+    ]
+
+    for redux_code, counts in code_examples:
+        yield check_field_accesses, redux_code, counts
+
+
+def check_field_accesses(redux_code, counts):
+    eq_(performs(redux_code), counts)
+
+
+def test_cached_read_copies_temporary():
+    eq_(c("a = AF[1] b = AF[1]"),
+        "{\nint __retval0 = 0;\n{\nint num = 1;\n"
+        "PERFORM GET_ACHRONAL_FIELD num;__retval0 = perf_ret;\n}\n"
+        "int a = __retval0;\nint __retval1 = 0;\n__retval1 = __retval0;\n"
+        "int b = __retval1;\n}\n")
+
+
+def test_reads_not_cached_when_perf_ret_used():
+    eq_(performs("a = AF[1] b = AF[1] say(perf_ret)"), (2, 0))
+
+
+def test_report():
+    reports = {}
+    c("a = AF[1] b = AF[1] AF[2] = a AF[2] = b", reports)
+    eq_(dict(reports["af-cache"]), {"cached_reads": 1, "removed_writes": 1})
@@ -0,0 +1,60 @@
+from nose.tools import eq_, raises
+from redux.ast import AddOp, Constant, DivOp, VarRef
+from redux.attributes import (AttributeSynthesizer, attributes,
+                              synthesize_attributes)
+from redux.codegenerator import annotate_script
+from redux.types import int_
+from redux.typeannotate import InvalidExpressionError
+
+
+def flags(code):
+    ast_ = annotate_script("attributes_test", code)
+    result = []
+    for stmt in ast_.statements:
+        stmt_attributes = attributes(stmt)
+        result.append(tuple(name for name in ["nontrivial_call", "query",
+                                              "pure", "total"]
+                            if getattr(stmt_attributes, name)))
+    return result
+
+
+def test_flags():
+    eq_(flags("def f(x) return (QUERY UNIT WHERE query->HP > x) end "
+              "bitfield B x : 12 end "
+              "a = 1 + 2 "
+              "say(sqrt(a), a / 2) "
+              "b = B(a).x "
+              "c = f(a) "
+              "d = (QUERY VALUE SUM dist_sq(unit, query) WHERE 1)"),
+        [("pure", "total"), ("pure", "total"), ("total",), (), ("total",),
+         ("nontrivial_call", "query"), ("query", "total")])
+
+
+def test_cached_after_annotation():
+    ast_ = annotate_script("attributes_test", "a = unit->HP * 2 say(a)")
+    expr = ast_.statements[0].expression
+    assert expr.attributes is attributes(expr)
+    eq_(expr.attributes.cost.counts, {"int_op": 1, "chronal_access": 1})
+
+
+def test_refresh():
+    a = VarRef("a")
+    a.type = int_
+    expr = AddOp(a, DivOp(a, Constant(2, int_)))
+    expr.type = expr.rhs.type = int_
+    eq_(attributes(expr).total, False)
+
+    # Rewrites leave attributes stale until they are synthesized again.
+    expr.rhs = Constant(1, int_)
+    eq_(attributes(synthesize_attributes(expr)).total, False)
+    synthesizer = AttributeSynthesizer(refresh=True)
+    synthesizer.visit(expr)
+    synthesizer.visit(expr)
+    eq_(expr.attributes.total, True)
+    eq_(len(synthesizer.synthesized), 3)
+
+
+@raises(InvalidExpressionError)
+def test_bestmove_subquery():
+    annotate_script("attributes_test", "a = (QUERY VALUE SUM "
+                    "(QUERY BESTMOVE unit MIN query->HP) WHERE 1)")
@@ -0,0 +1,69 @@
+from nose.tools import eq_
+from shutil import rmtree
+from tempfile import mkdtemp
+from redux.bench.generator import WORKLOADS, generate, write_program
+from redux.bench.runner import STAGES, run_workload, compare, format_results
+from redux.codegenerator import compile_script
+
+
+def test_generator_is_deterministic():
+    for name, _ in WORKLOADS:
+        yield check_deterministic, name
+
+
+def check_deterministic(name):
+    eq_(generate(name, seed=1, directory="/tmp"),
+        generate(name, seed=1, directory="/tmp"))
+
+
+def test_workloads_compile():
+    for name, _ in WORKLOADS:
+        yield check_compiles, name
+
+
+def check_compiles(name):
+    directory = mkdtemp()
+    try:
+        program = generate(name, directory=directory)
+        path = write_program(program, directory)
+        compile_script(path, program.code)
+    finally:
+        rmtree(directory)
+
+
+def test_run_workload_times_every_stage():
+    result = run_workload("queries", repeat=1)
+    eq_(sorted(result["stages"]), sorted(STAGES))
+    eq_(result["lines"], 27)
+    assert 0 < result["executed_cost"]["all"] <= result["executed_cost"]["none"]
+
+
+def test_compare_reports_slower_stages():
+    def results(parse_seconds, seed=0):
+        return {"scale": 1, "seed": seed, "workloads": {"queries": {
+            "stages": {"lex": 1.0, "parse": parse_seconds},
+            "total": 1.0 + parse_seconds}}}
+
+    eq_(compare(results(1.05), results(1.0)), [])
+    eq_(compare(results(1.5), results(1.0)),
+        [("queries", "parse", 1.0, 1.5), ("queries", "total", 2.0, 2.5)])
+    eq_(compare(results(1.5), results(1.0, seed=1)), [])
+
+
+def test_other_pass_sets():
+    def results(stages):
+        return {"scale": 1, "seed": 0, "workloads": {"queries": {
+            "lines": 27, "nodes": 100, "lines_per_second": 2700.0,
+            "nodes_per_second": 10000.0, "stages": stages,
+            "total": sum(stages.values())}}}
+
+    new = results({"lex": 0.001, "parse": 0.002, "Renamed": 0.001})
+    old = results({"lex": 0.001, "parse": 0.001, "Removed": 0.001})
+    eq_(compare(new, old), [("queries", "parse", 0.001, 0.002),
+                            ("queries", "total", 0.003, 0.004)])
+    lines = format_results(new, old).splitlines()
+    eq_(lines[1:3], ["  lex                           1.00 ms    +0.0%",
+                     "  parse                         2.00 ms  +100.0%"])
+    eq_(lines[3], "  RequireInliner                   -")
+    eq_(lines[-2:], ["  total                         4.00 ms   +33.3%",
+                     "  Renamed                       1.00 ms"])
@@ -0,0 +1,206 @@
+from nose.tools import eq_
+from os import chmod, makedirs, remove, stat
+from os.path import dirname, exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from redux import build as build_module
+from redux.build import (BUILD_CACHE_FILENAME, BuildCache, build,
+                         compile_file, init_worker)
+from redux.files import UMASK
+import json
+
+
+def setup_scripts(scripts):
+    directory = mkdtemp()
+    for name, code in scripts.items():
+        path = join(directory, "src", name)
+        makedirs(dirname(path), exist_ok=True)
+        with open(path, "wt") as file_:
+            file_.write(code.replace("DIR", directory))
+    return directory
+
+
+def test_outputs_get_default_mode():
+    directory = setup_scripts({"a.redux": "say(1)"})
+    try:
+        output_dir = join(directory, "out")
+        build(join(directory, "src"), output_dir, jobs=1, depfiles=True)
+        for name in ["a.rescript", "a.rescript.d", ".redux-build-cache.json"]:
+            eq_(stat(join(output_dir, name)).st_mode & 0o777, 0o666 & ~UMASK)
+
+        # A replaced output keeps its mode.
+        chmod(join(output_dir, "a.rescript"), 0o640)
+        build(join(directory, "src"), output_dir, jobs=1, incremental=False)
+        eq_(stat(join(output_dir, "a.rescript")).st_mode & 0o777, 0o640)
+    finally:
+        rmtree(directory)
+
+
+def read(path):
+    with open(path, "rt") as file_:
+        return file_.read()
+
+
+def test_output_paths():
+    directory = setup_scripts({"a.redux": "say(1)",
+                               "maps/b.redux": "say(2)",
+                               "maps/notes.txt": ""})
+    try:
+        results = build(join(directory, "src"), join(directory, "out"),
+                        jobs=2, extension=".rs")
+        eq_(sorted((result.input_path[len(directory):],
+                    result.output_path[len(directory):])
+                   for result in results),
+            [("/src/a.redux", "/out/a.rs"),
+             ("/src/maps/b.redux", "/out/maps/b.rs")])
+        eq_(read(join(directory, "out", "maps", "b.rs")), "{\nsay 2;\n}\n")
+    finally:
+        rmtree(directory)
+
+
+def test_up_to_date_scripts_skipped():
+    directory = setup_scripts({"a.redux": "say(1)", "b.redux": "say(2)"})
+    try:
+        source_dir, output_dir = join(directory, "src"), join(directory, "out")
+        build(source_dir, output_dir, jobs=1)
+        with open(join(source_dir, "b.redux"), "wt") as file_:
+            file_.write("say(3)")
+        results = build(source_dir, output_dir, jobs=1)
+        eq_(sorted((result.input_path[len(source_dir):], result.skipped)
+                   for result in results),
+            [("/a.redux", True), ("/b.redux", False)])
+        eq_(read(join(output_dir, "b.rescript")), "{\nsay 3;\n}\n")
+
+        results = build(source_dir, output_dir, jobs=1, incremental=False)
+        eq_([result.skipped for result in results], [False, False])
+    finally:
+        rmtree(directory)
+
+
+def test_failed_compile_keeps_previous_output():
+    directory = setup_scripts({"a.redux": "say(1)"})
+    try:
+        source_dir, output_dir = join(directory, "src"), join(directory, "out")
+        build(source_dir, output_dir, jobs=1)
+        with open(join(source_dir, "a.redux"), "wt") as file_:
+            file_.write("say(undefined_variable)")
+        results = build(source_dir, output_dir, jobs=1)
+        assert results[0].error
+        eq_(read(join(output_dir, "a.rescript")), "{\nsay 1;\n}\n")
+        # Failed scripts are tried again.
+        assert not build(source_dir, output_dir, jobs=1)[0].skipped
+    finally:
+        rmtree(directory)
+
+
+LIBRARIES = {"lib/base.redux": "def f(x) return x + 1 end",
+             "lib/extra.redux": 'require "DIR/lib/base" def g(x) return f(x) end',
+             "src/a.redux": 'require "DIR/lib/base" say(f(1))',
+             "src/b.redux": 'require "DIR/lib/extra" say(g(2))',
+             "src/c.redux": "say(3)"}
+
+
+def setup_libraries():
+    directory = mkdtemp()
+    for name, code in LIBRARIES.items():
+        path = join(directory, name)
+        makedirs(dirname(path), exist_ok=True)
+        with open(path, "wt") as file_:
+            file_.write(code.replace("DIR", directory))
+    return directory
+
+
+def compiled(results):
+    return sorted(result.input_path.rsplit("/", 1)[1] for result in results
+                  if not result.skipped)
+
+
+def test_changed_library_rebuilds_dependents():
+    directory = setup_libraries()
+    try:
+        source_dir, output_dir = join(directory, "src"), join(directory, "out")
+        build(source_dir, output_dir, jobs=1)
+        with open(join(directory, "lib", "base.redux"), "wt") as file_:
+            file_.write("def f(x) return x + 2 end")
+        eq_(compiled(build(source_dir, output_dir, jobs=1)),
+            ["a.redux", "b.redux"])
+        assert "(x+2)" in read(join(output_dir, "b.rescript"))
+
+        with open(join(directory, "lib", "extra.redux"), "at") as file_:
+            file_.write(" def h() end")
+        eq_(compiled(build(source_dir, output_dir, jobs=1)), ["b.redux"])
+        eq_(compiled(build(source_dir, output_dir, jobs=1)), [])
+    finally:
+        rmtree(directory)
+
+
+def test_depfiles_list_requires():
+    directory = setup_libraries()
+    try:
+        build(join(directory, "src"), join(directory, "out"), jobs=1,
+              depfiles=True)
+        eq_(read(join(directory, "out", "b.rescript.d")),
+            "%s/out/b.rescript: %s/src/b.redux \\\n  %s/lib/base.redux "
+            "\\\n  %s/lib/extra.redux\n" % ((directory,) * 4))
+        eq_(read(join(directory, "out", "c.rescript.d")),
+            "%s/out/c.rescript: %s/src/c.redux\n" % (directory, directory))
+    finally:
+        rmtree(directory)
+
+
+def test_output_written_last():
+    directory = setup_libraries()
+    try:
+        def vanished(canonical_path):
+            raise OSError("%s vanished" % canonical_path)
+
+        init_worker()
+        build_module._compiler.library_cache.source_hash = vanished
+        output_path = join(directory, "out", "a.rescript")
+        result = compile_file((join(directory, "src", "a.redux"), output_path,
+                               True))
+        assert "vanished" in result.error
+        assert not exists(output_path)
+    finally:
+        init_worker()
+        rmtree(directory)
+
+
+def test_library_edited_during_build_rebuilt():
+    directory = setup_libraries()
+    try:
+        source_dir, output_dir = join(directory, "src"), join(directory, "out")
+        build(source_dir, output_dir, jobs=1)
+        # Edits base.redux after b.redux was compiled, but before its result
+        # is recorded.
+        with open(join(directory, "lib", "base.redux"), "wt") as file_:
+            file_.write("def f(x) return x + 2 end")
+        init_worker()
+        cache = BuildCache(join(output_dir, BUILD_CACHE_FILENAME),
+                           {"extension": ".rescript", "depfiles": False})
+        result = compile_file((join(source_dir, "b.redux"),
+                               join(output_dir, "b.rescript"), False))
+        with open(join(directory, "lib", "base.redux"), "wt") as file_:
+            file_.write("def f(x) return x + 3 end")
+        cache.record(result)
+        cache.save()
+        eq_(compiled(build(source_dir, output_dir, jobs=1)),
+            ["a.redux", "b.redux"])
+        assert "(x+3)" in read(join(output_dir, "b.rescript"))
+    finally:
+        rmtree(directory)
+
+
+def test_removed_scripts_pruned():
+    directory = setup_libraries()
+    try:
+        source_dir, output_dir = join(directory, "src"), join(directory, "out")
+        build(source_dir, output_dir, jobs=1)
+        remove(join(source_dir, "a.redux"))
+        build(source_dir, output_dir, jobs=1)
+        with open(join(output_dir, BUILD_CACHE_FILENAME), "rt") as file_:
+            entries = json.load(file_)["entries"]
+        eq_(sorted(entries), [join(source_dir, "b.redux"),
+                              join(source_dir, "c.redux")])
+    finally:
+        rmtree(directory)
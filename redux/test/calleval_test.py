@@ -0,0 +1,66 @@
+from nose.tools import eq_
+from redux.calleval import CallEvaluator
+from redux.codegenerator import annotate_script, compile_script
+from redux.interpreter import run_script
+
+
+def evaluate(code, budget=10000):
+    ast_ = annotate_script("calleval_test", code)
+    evaluator = CallEvaluator(budget)
+    evaluator.visit(ast_)
+    return evaluator.report()
+
+
+def test_evaluated():
+    for code in [
+            "enum Dir north east south west end "
+            "def opposite(d) r = d if d == north r = south elif d == east "
+            "r = west end return r end say(opposite(east))",
+            "def mask(n) m = 0 for i = 0, i < n, i = i + 1 m = m | 1 << i end "
+            "return m end say(mask(5))",
+            "bitfield P x : 8 y : 8 end "
+            "def pack(x, y) p = P(0) p.x = x p.y = y return p.y end "
+            "say(pack(3, 9))",
+            "def square(x) return x * x end def f(x) return square(x) + 1 end "
+            "say(f(3))",
+            ]:
+        yield check_report, code, {"calls": 1, "evaluated": 1,
+                                   "over_budget": 0}
+
+
+def test_left_alone():
+    for code in [
+            "def hp(x) return unit->HP + x end say(hp(1))",
+            "a = 2 def f(x) return a * x end say(f(3))",
+            "def f(x) return 1 / x end say(f(0))",
+            "def f(x) AF[x] = 1 return x end say(f(1))",
+            ]:
+        yield check_report, code, {"calls": 1, "evaluated": 0,
+                                   "over_budget": 0}
+
+
+def check_report(code, expected):
+    eq_(evaluate(code), expected)
+
+
+def test_budget():
+    code = ("def f(n) s = 0 for i = 0, i < n, i = i + 1 s = s + i end "
+            "return s end say(f(100))")
+    eq_(evaluate(code, budget=100),
+        {"calls": 1, "evaluated": 0, "over_budget": 1})
+    eq_(evaluate(code)["evaluated"], 1)
+
+
+def test_same_result_as_inlined_code():
+    code = ("enum Kind p q s end "
+            "def g(a, b) return a * 10 + b end "
+            "def f(x, y) z = x * 2 + y r = -z / 3 if x > y r = g(z, x) end "
+            "return r end "
+            "say(f(3, 1), f(1, 3), f(s, p))")
+    results = []
+    for optimizations in [(), ("eval-calls",)]:
+        compiled = compile_script("calleval_test", code,
+                                  optimizations=optimizations)
+        results.append(run_script(compiled).world.said)
+    eq_(results[0], [(73, -1, 42)])
+    eq_(results[1], results[0])
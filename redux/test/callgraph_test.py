@@ -0,0 +1,92 @@
+from nose.tools import eq_, raises
+from redux.callgraph import (ExpansionBudgetError, RecursiveCallError,
+                             format_report)
+from redux.codegenerator import annotate_script, compile_script
+
+
+def expansion(code, budget=None):
+    reports = {}
+    annotate_script("callgraph_test", code, reports=reports,
+                    expansion_budget=budget)
+    report = reports["call-graph"]
+    return report["total"], dict(
+        (function["name"], (function["nodes"], function["inlined_nodes"],
+                            function["copies"]))
+        for function in report["functions"])
+
+
+def test_expansion():
+    eq_(expansion("def sq(x) return x * x end "
+                  "def quad(x) return sq(x) * sq(x) end "
+                  "say(quad(unit->HP), sq(2))"),
+        (30, {"sq": (5, 5, 3), "quad": (7, 17, 1)}))
+    # Functions that are never called add nothing.
+    eq_(expansion("def f(x) return x end say(1)"), (4, {"f": (3, None, 0)}))
+    # Calls of intrinsics are not expanded.
+    eq_(expansion("def f(x) say(x) end f(2)"), (8, {"f": (4, 4, 1)}))
+
+
+def test_format_report():
+    reports = {}
+    annotate_script("callgraph_test", "def sq(x) return x * x end "
+                    "def quad(x) return sq(x) * sq(x) end def f() end "
+                    "say(quad(unit->HP), sq(2))", reports=reports)
+    eq_(format_report(reports["call-graph"]),
+        "script expands to 30 nodes once calls are inlined (budget 200000)\n"
+        "  sq: 5 nodes, 5 when inlined, 3 copies\n"
+        "  quad: 7 nodes, 17 when inlined, 1 copy\n"
+        "  f: 1 nodes, never called\n")
+
+
+def test_calls_resolve_like_type_annotation():
+    # Function bodies see functions defined after them.
+    eq_(expansion("def f(x) return g(x) end def g(x) return x end "
+                  "say(f(1))")[1],
+        {"f": (4, 7, 1), "g": (3, 3, 1)})
+    # The top level sees the definition made before the call.
+    reports = {}
+    annotate_script("callgraph_test", "def f() return 1 end say(f()) "
+                    "def f() return 2 + 3 end", reports=reports)
+    eq_([(function["nodes"], function["copies"])
+         for function in reports["call-graph"]["functions"]],
+        [(3, 1), (5, 0)])
+
+
+def test_recursion_reports_cycle():
+    code = ("def f(x) return g(x) end def g(x) return h(x) end "
+            "def h(x) return g(x) end say(f(1))")
+    try:
+        compile_script("callgraph_test", code)
+    except RecursiveCallError as e:
+        eq_(str(e), "recursive call: g -> h -> g")
+    else:
+        assert False, "recursion not detected"
+
+
+def test_uncalled_recursion_allowed():
+    eq_(compile_script("callgraph_test", "def f(x) return f(x) end say(1)"),
+        "{\nsay 1;\n}\n")
+
+
+def test_budget():
+    code = ("def f(x) return x * x + x end def g(x) return f(x) + f(x) end "
+            "say(g(1), g(2))")
+    eq_(expansion(code, 49)[0], 49)
+    try:
+        expansion(code, 48)
+    except ExpansionBudgetError as e:
+        eq_(str(e), "inlining calls expands the script to 49 nodes, over the "
+                    "budget of 48; largest expansions: f (4 copies of 7 "
+                    "nodes), g (2 copies of 7 nodes)")
+    else:
+        assert False, "budget not enforced"
+
+
+@raises(ExpansionBudgetError)
+def test_budget_applies_by_default():
+    # Each level doubles the size of the output.
+    code = "def f0(x) return x end "
+    for level in range(1, 20):
+        code += "def f%d(x) return f%d(x) + f%d(x) end " % (
+            level, level - 1, level - 1)
+    compile_script("callgraph_test", code + "say(f19(1))")
@@ -1,5 +1,6 @@
 from nose.tools import eq_, raises
 from redux.codegenerator import compile_script
+from redux.interpreter import run_script
 from redux.typeannotate import UndefinedVariableError, InvalidExpressionError, NotCallableError, IncompatibleTypeError, UndefinedTypeError, ImmutabilityViolationError
 
 
@@ -102,6 +103,16 @@ def check_code_generation(redux_code, rescript_code):
     eq_(c(redux_code), rescript_code)
 
 
+def test_arguments_shadowed_by_parameters():
+    # The argument a is read before the parameter a shadows it.
+    code = c("def g(a, b) return a * 10 + b end a = 1 c = 2 say(g(c, a))")
+    eq_(code, "{\nint a = 1;\nint c = 2;\nint __retval0 = 0;\n{\n"
+              "int __arg0 = c;\nint __arg1 = a;\nint a = __arg0;\n"
+              "int b = __arg1;\n__retval0 = ((a*10)+b);\n}\n"
+              "say __retval0;\n}\n")
+    eq_(run_script(code).world.said, [(21,)])
+
+
 @raises(UndefinedVariableError)
 def test_undefined_var_use():
     c("say(a)")
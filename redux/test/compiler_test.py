@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+from nose.tools import eq_, with_setup
+from redux.codegenerator import Compiler, compile_script
+from redux.parser import parse
+import sys
+
+
+SNIPPETS = [
+    "def f(x) return x * %d end say(f(unit->HP))",
+    "enum E a b c end x = %d + c if x > 3 say(x) elif x > 1 say(1) end",
+    "bitfield B x : 12 y : 12 end v = B(%d) v.x = 1 say(v.x + v.y)",
+    "s = 0 for i = 0, i < %d, i = i + 1 s = s + i end say(s)",
+    "say(AF[%d]) AF[2] = unit->HP",
+    "a = (QUERY UNIT WHERE query->HP > %d) say(a->HP)",
+]
+
+BROKEN_SNIPPETS = [
+    "say(%d) )",
+    "a = %d\n\nb = = 2",
+    "if %d say(1)",
+]
+
+
+def scripts(count, snippets):
+    return [snippets[index % len(snippets)] % index for index in range(count)]
+
+
+switch_interval = None
+
+
+def switch_often():
+    # Make threads take turns in the middle of compilations.
+    global switch_interval
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+
+
+def restore_switch_interval():
+    sys.setswitchinterval(switch_interval)
+
+
+@with_setup(switch_often, restore_switch_interval)
+def test_concurrent_compiles_match_sequential_ones():
+    codes = scripts(2000, SNIPPETS)
+    compiler = Compiler(optimizations=["const-prop", "copy-prop"])
+    expected = [compile_script("compiler_test", code,
+                               optimizations=["const-prop", "copy-prop"])
+                for code in codes]
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(
+            lambda code: compiler.compile("compiler_test", code), codes))
+    eq_(results, expected)
+
+
+@with_setup(switch_often, restore_switch_interval)
+def test_concurrent_parses_keep_their_errors():
+    codes = scripts(2000, SNIPPETS + BROKEN_SNIPPETS)
+    expected = [parse(code) for code in codes]
+
+    with ThreadPoolExecutor(8) as executor:
+        eq_(list(executor.map(parse, codes)), expected)
+
+
+def test_compiler_reused():
+    compiler = Compiler()
+    for code in scripts(20, SNIPPETS):
+        eq_(compiler.compile("compiler_test", code),
+            compile_script("compiler_test", code))
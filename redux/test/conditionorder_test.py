@@ -0,0 +1,171 @@
+from copy import deepcopy
+from nose.tools import eq_
+from random import Random
+from redux.ast import (Constant, VarRef, ChronalAccess,
+                       FunctionCall, LessThanOp, GreaterThanOp, EqualToOp,
+                       NotEqualToOp, LogicalAndOp, LogicalOrOp, LogicalNotOp,
+                       DivOp)
+from redux.codegenerator import annotate_script, compile_script
+from redux.conditionorder import ConditionReorderer
+
+
+def c(code, reports=None):
+    return compile_script("conditionorder_test", code,
+                          optimizations=["reorder-where"], reports=reports)
+
+
+def where(code):
+    rescript_code = c("a = QUERY UNIT WHERE " + code)
+    return rescript_code[rescript_code.index("WHERE [") + 7:
+                         rescript_code.rindex("])")]
+
+
+def test_reordering():
+    code_examples = [
+        ("dist_sq(query, unit) < 100.0 and query->IsAlly == 0 and "
+         "query->HP > 0",
+         "((((query->IsAlly)==0)&&((query->HP)>0))&&((query<=>unit)<100.0))"),
+        # Likely true conditions go first in an or.
+        ("query->HP == 0 or query->IsAlly != 0",
+         "(((query->IsAlly)!=0)||((query->HP)==0))"),
+        ("query->HP > 0 and (dist_sq(query, unit) < 9.0 or query->HP == 1)",
+         "(((query->HP)>0)&&(((query<=>unit)<9.0)||((query->HP)==1)))"),
+        # Divisions stay behind the conditions guarding them.
+        ("query->HP != 0 and 100 / query->HP > 3 and query->IsAlly == 0",
+         "((((query->HP)!=0)&&((100/(query->HP))>3))&&((query->IsAlly)==0))"),
+        ("dist_sq(query, unit) < 1.0 and query->HP / 2 > 3 and "
+         "query->Energy > 2 and query->IsAlly == 0",
+         "(((((query<=>unit)<1.0)&&(((query->HP)/2)>3))&&"
+         "((query->IsAlly)==0))&&((query->Energy)>2))"),
+    ]
+
+    for redux_code, rescript_code in code_examples:
+        yield check_reordering, redux_code, rescript_code
+
+
+def check_reordering(redux_code, rescript_code):
+    eq_(where(redux_code), rescript_code)
+
+
+def test_conditions_outside_queries_untouched():
+    eq_(c("a = unit->HP > 0 and unit->IsAlly == 0"),
+        "{\nint a = (((unit->HP)>0)&&((unit->IsAlly)==0));\n}\n")
+
+
+def test_report():
+    reports = {}
+    c("a = QUERY UNIT WHERE query->HP > 0 and query->IsAlly == 0 "
+      "b = QUERY UNIT WHERE query->IsAlly == 0 and query->HP > 0", reports)
+    eq_(reports["reorder-where"], {"chains": 2, "reordered": 1})
+
+
+class Unit(object):
+    def __init__(self, random):
+        self.HP = random.randint(-2, 3)
+        self.IsAlly = random.randint(0, 1)
+        self.Energy = random.randint(0, 3)
+        self.position = random.randint(0, 4)
+
+
+def evaluate(expr, units):
+    """Evaluates a query condition for the units named in units."""
+    if isinstance(expr, Constant):
+        return expr.value
+    elif isinstance(expr, VarRef):
+        return units[expr.name]
+    elif isinstance(expr, ChronalAccess):
+        return getattr(evaluate(expr.object, units), expr.member)
+    elif isinstance(expr, FunctionCall):
+        a, b = [evaluate(arg, units) for arg in expr.arguments]
+        return float((a.position - b.position) ** 2)
+    elif isinstance(expr, LogicalNotOp):
+        return int(not evaluate(expr.expression, units))
+    elif isinstance(expr, LogicalAndOp):
+        return int(bool(evaluate(expr.lhs, units) and
+                        evaluate(expr.rhs, units)))
+    elif isinstance(expr, LogicalOrOp):
+        return int(bool(evaluate(expr.lhs, units) or
+                        evaluate(expr.rhs, units)))
+
+    lhs = evaluate(expr.lhs, units)
+    rhs = evaluate(expr.rhs, units)
+    if isinstance(expr, DivOp):
+        if rhs == 0:
+            raise ZeroDivisionError
+        return int(float(lhs) / rhs)
+    operators = {LessThanOp: lambda a, b: a < b,
+                 GreaterThanOp: lambda a, b: a > b,
+                 EqualToOp: lambda a, b: a == b,
+                 NotEqualToOp: lambda a, b: a != b}
+    return int(operators[type(expr)](lhs, rhs))
+
+
+def random_condition(random, depth=0):
+    choice = random.randint(0, 7 if depth < 3 else 3)
+    attribute = ChronalAccess(VarRef("query"),
+                              random.choice(["HP", "IsAlly", "Energy"]))
+    if choice == 0:
+        return EqualToOp(attribute, Constant(random.randint(0, 2), None))
+    elif choice == 1:
+        return GreaterThanOp(attribute, Constant(random.randint(0, 2), None))
+    elif choice == 2:
+        return LessThanOp(FunctionCall("dist_sq", [VarRef("query"),
+                                                   VarRef("unit")]),
+                          Constant(float(random.randint(0, 9)), None))
+    elif choice == 3:
+        divisor = ChronalAccess(VarRef("query"), "HP")
+        return GreaterThanOp(DivOp(Constant(6, None), divisor),
+                             Constant(1, None))
+    elif choice == 4:
+        return NotEqualToOp(attribute, Constant(0, None))
+    elif choice == 5:
+        return LogicalNotOp(random_condition(random, depth + 1))
+    elif choice == 6:
+        return LogicalOrOp(random_condition(random, depth + 1),
+                           random_condition(random, depth + 1))
+    return LogicalAndOp(random_condition(random, depth + 1),
+                        random_condition(random, depth + 1))
+
+
+def test_rewrites_preserve_meaning():
+    # Divisions by zero count as a result of their own, so moving a division
+    # in front of its guard fails the test.
+    random = Random(38)
+    for _ in range(200):
+        condition = random_condition(random)
+        code = "a = QUERY UNIT WHERE %s" % to_redux(condition)
+        ast_ = annotate_script("conditionorder_test", code)
+        original = deepcopy(ast_.statements[0].expression.where_cond)
+        ConditionReorderer().visit(ast_)
+        reordered = ast_.statements[0].expression.where_cond
+
+        for _ in range(20):
+            units = {"query": Unit(random), "unit": Unit(random)}
+            try:
+                expected = evaluate(original, units)
+            except ZeroDivisionError:
+                expected = ZeroDivisionError
+            try:
+                actual = evaluate(reordered, units)
+            except ZeroDivisionError:
+                actual = ZeroDivisionError
+            eq_(actual, expected, code)
+
+
+def to_redux(expr):
+    if isinstance(expr, Constant):
+        return repr(expr.value)
+    elif isinstance(expr, VarRef):
+        return expr.name
+    elif isinstance(expr, ChronalAccess):
+        return "%s->%s" % (to_redux(expr.object), expr.member)
+    elif isinstance(expr, FunctionCall):
+        return "%s(%s)" % (expr.function,
+                           ", ".join(to_redux(arg) for arg in expr.arguments))
+    elif isinstance(expr, LogicalNotOp):
+        return "(not %s)" % to_redux(expr.expression)
+    operators = {LessThanOp: "<", GreaterThanOp: ">", EqualToOp: "==",
+                 NotEqualToOp: "!=", LogicalAndOp: "and", LogicalOrOp: "or",
+                 DivOp: "/"}
+    return "(%s %s %s)" % (to_redux(expr.lhs), operators[type(expr)],
+                           to_redux(expr.rhs))
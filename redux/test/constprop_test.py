@@ -0,0 +1,77 @@
+from nose.tools import eq_
+from redux.codegenerator import compile_script
+
+
+def c(code, reports=None):
+    return compile_script("constprop_test", code,
+                          optimizations=["const-prop"], reports=reports)
+
+
+def test_propagation():
+    code_examples = [
+        ("a = 3 b = a * 4 say(b)", "int a = 3;\nint b = 12;\nsay 12;"),
+        ("enum E x y z end a = z + 1 say(a)", "int a = 3;\nsay 3;"),
+        # Division and remainder round towards zero, like C.
+        ("a = 7 / -2 b = -7 % 2 say(a, b)",
+         "int a = (-3);\nint b = (-1);\nsay (-3), (-1);"),
+        ("a = 1 / 0 say(a)", "int a = (1/0);\nsay a;"),
+        ("a = 2147483647 + 1 b = 1 << 31 say(a, b)",
+         "int a = (2147483647+1);\nint b = (1<<31);\nsay a, b;"),
+        ("a = 1.5 b = a < 2 say(a, b)", "float a = 1.5;\nint b = 1;\nsay 1.5, 1;"),
+        ("a = unit->HP b = a + 1 say(b)",
+         "int a = (unit->HP);\nint b = (a+1);\nsay b;"),
+        ("a = 1 if unit->HP > 0 a = 2 end say(a)",
+         "int a = 1;\nif(((unit->HP)>0)){\na = 2;\n}\nsay a;"),
+        ("a = 1 if unit->HP > 0 a = 1 end say(a)",
+         "int a = 1;\nif(((unit->HP)>0)){\na = 1;\n}\nsay 1;"),
+        # Branches are resolved, and assignments in branches never taken do
+        # not count.
+        ("a = 1 b = 0 if a == 1 b = 2 else b = 3 end say(b)",
+         "int a = 1;\nint b = 0;\n{\nb = 2;\n}\nsay 2;"),
+        ("a = 0 if a say(1) end say(2)", "int a = 0;\nsay 2;"),
+        ("a = 1 `a = 2;` say(a)", "int a = 1;\na = 2;say a;"),
+        ("a = 1 b = 2 `say b;` say(a, b)",
+         "int a = 1;\nint b = 2;\nsay b;say 1, b;"),
+    ]
+
+    for redux_code, rescript_code in code_examples:
+        yield check_propagation, redux_code, "{\n" + rescript_code + "\n}\n"
+
+
+def check_propagation(redux_code, rescript_code):
+    eq_(c(redux_code), rescript_code)
+
+
+def test_inlined_arguments():
+    eq_(c("def f(x) return x * 4 end a = f(3) say(a)"),
+        "{\nint __retval0 = 0;\n{\nint x = 3;\n__retval0 = 12;\n}\n"
+        "int a = 12;\nsay 12;\n}\n")
+
+
+def test_loops():
+    # Values only assigned before the loop survive it...
+    eq_(c("a = 1 b = 5 while b > 0 b = b - 1 say(a) end say(a, b)"),
+        "{\nint a = 1;\nint b = 5;\nwhile(1){\nif((b>0)){\nb = (b-1);\n"
+        "say 1;\n}\nelse {\nbreak;\n}\n}\nsay 1, b;\n}\n")
+    # ...and so do values every iteration assigns again.
+    eq_(c("a = 1 for i = 0, i < 3, i = i + 1 a = 1 say(i) end say(a)"),
+        "{\nint a = 1;\nfor(int i = 0; (i<3); i = (i+1)){\na = 1;\nsay i;\n}"
+        "\nsay 1;\n}\n")
+    eq_(c("a = 1 for i = 0, i < 3, i = i + 1 say(a) a = a + 1 end"),
+        "{\nint a = 1;\nfor(int i = 0; (i<3); i = (i+1)){\nsay a;\n"
+        "a = (a+1);\n}\n}\n")
+
+
+def test_loops_never_entered():
+    # Only the initialization is left, still declaring the variable for the
+    # code after the loop.
+    eq_(c("for i = -2, 0, i = i + 1 say(i) end say(i)"),
+        "{\nint i = -2;\nsay i;\n}\n")
+    eq_(c("a = 0 for i = 0, i < a, i = i + 1 say(i) end say(a)"),
+        "{\nint a = 0;\nint i = 0;\nsay 0;\n}\n")
+
+
+def test_report():
+    reports = {}
+    c("a = 2 b = a + 1 if b == 3 say(b) end", reports)
+    eq_(reports["const-prop"], {"substituted": 3, "folded": 2, "resolved": 1})
@@ -0,0 +1,66 @@
+from nose.tools import eq_
+from redux.codegenerator import compile_script
+from redux.copyprop import format_report
+
+
+def c(code, reports=None):
+    return compile_script("copyprop_test", code, optimizations=["copy-prop"],
+                          reports=reports)
+
+
+def test_copy_propagation():
+    code_examples = [
+        ("def f(x) return x * x end a = unit->HP y = f(a) say(y)",
+         "int a = (unit->HP);\nint y = (a*a);\nsay y;"),
+        ("def f(x) return x * x end a = unit->HP a = f(a) say(a)",
+         "int a = (unit->HP);\na = (a*a);\nsay a;"),
+        # Nested calls declare parameters of the same name.
+        ("def g(x) return x + 1 end def f(x) return g(x * 2) end "
+         "a = unit->HP y = f(a) say(y)",
+         "int a = (unit->HP);\nint y = 0;\n{\nint x = (a*2);\ny = (x+1);\n}\n"
+         "say y;"),
+        # Copies of variables assigned while the copy is in use are kept.
+        ("a = unit->HP b = a a = 2 say(b)",
+         "int a = (unit->HP);\nint b = a;\na = 2;\nsay b;"),
+        ("a = unit->HP b = a c = b say(c)",
+         "int a = (unit->HP);\nsay a;"),
+        # Locals shadowing the copied variable.
+        ("def f(x) a = 2 return x end a = unit->HP y = f(a) say(y)",
+         "int a = (unit->HP);\nint y = 0;\n{\nint x = a;\nint a = 2;\n"
+         "y = x;\n}\nsay y;"),
+        ("def f(x) return x end a = unit->HP `say a;` y = f(a) say(y)",
+         "int a = (unit->HP);\nsay a;int y = 0;\n{\nint x = a;\ny = x;\n}\n"
+         "say y;"),
+        ("a = 0 a = unit->HP say(a)", "int a = (unit->HP);\nsay a;"),
+        ("a = 0 a = a + 1 say(a)", "int a = 0;\na = (a+1);\nsay a;"),
+        ("a = 1.0 a = 2 say(a)", "float a = 1.0;\na = 2;\nsay a;"),
+        ("a = 1 b = unit->HP say(b)", "int b = (unit->HP);\nsay b;"),
+        ("a = 1 `say a;` say(2)", "int a = 1;\nsay a;say 2;"),
+    ]
+
+    for redux_code, rescript_code in code_examples:
+        yield check_copy_propagation, redux_code, "{\n" + rescript_code + "\n}\n"
+
+
+def check_copy_propagation(redux_code, rescript_code):
+    eq_(c(redux_code), rescript_code)
+
+
+def test_temporaries_used_twice_kept():
+    eq_(c("def f(x) return x * x end a = unit->HP say(f(a), f(a))"),
+        "{\nint a = (unit->HP);\nint __retval0 = (a*a);\n"
+        "int __retval1 = (a*a);\nsay __retval0, __retval1;\n}\n")
+
+
+def test_report():
+    reports = {}
+    c("def f(x) return x * x end a = unit->HP y = f(a) say(y)", reports)
+    eq_(reports["copy-prop"], {"propagated": 1, "coalesced": 1,
+                               "spliced": 1, "removed": 1})
+    eq_(format_report(reports["copy-prop"]),
+        "1 copy propagated, 1 temporary coalesced, 1 block(s) spliced, "
+        "1 declaration(s) removed\n")
+    eq_(format_report({"propagated": 2, "coalesced": 0, "spliced": 0,
+                       "removed": 0}),
+        "2 copies propagated, 0 temporaries coalesced, 0 block(s) spliced, "
+        "0 declaration(s) removed\n")
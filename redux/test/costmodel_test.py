@@ -0,0 +1,52 @@
+from nose.tools import eq_
+from redux.codegenerator import annotate_script
+from redux.costmodel import CostModel, estimate_cost
+
+
+def report(code, model=None):
+    return estimate_cost("costmodel_test", annotate_script("costmodel_test", code), model)
+
+
+def test_constant_for_loop_is_bounded():
+    total = report("for i = 0, i < 4, i = i + 1 say(i) end").total
+    eq_(total.unbounded, False)
+    eq_(total.counts["loop_iteration"], 4)
+    eq_(total.counts["intrinsic:say"], 4)
+    eq_(total.loop_depth, 1)
+
+
+def test_while_loop_is_unbounded():
+    eq_(report("a = 1 while a end").total.unbounded, True)
+
+
+def test_nested_loop_depth():
+    code = "for i = 0, i < 2, i = i + 1 for j = 3, j > 0, j = j - 1 say(j) end end"
+    total = report(code).total
+    eq_(total.loop_depth, 2)
+    eq_(total.counts["intrinsic:say"], 6)
+
+
+def test_achronal_fields_and_performs():
+    counts = report("AF[1] = AF[2] `PERFORM RAND;`").total.counts
+    eq_(counts["af_get"], 1)
+    eq_(counts["af_set"], 1)
+    eq_(counts["perform"], 1)
+
+
+def test_query_weighted_by_candidates():
+    model = CostModel(query_candidates=10)
+    counts = report("a = QUERY UNIT WHERE query->HP > 0", model).total.counts
+    eq_(counts["query"], 1)
+    eq_(counts["chronal_access"], 10)
+
+
+def test_intrinsic_costs_are_configurable():
+    model = CostModel(intrinsics={"sqrt": 100})
+    eq_(report("a = sqrt(2.0)", model).total.total(model), 101)
+
+
+def test_function_costs_reported_per_call():
+    functions = report("def f(x) return x * x end a = f(1) b = f(2.0)").functions
+    cost, calls = functions["f"]
+    eq_(calls, 2)
+    eq_(cost.counts["float_op"], 1)
@@ -0,0 +1,100 @@
+from nose.tools import eq_
+from redux.codegenerator import Compiler, compile_script
+from redux.interpreter import Interpreter, Unit, World
+from redux.profile import Profile
+
+
+CHAIN = """enum S a b c d e f g h end
+s = unit->HP - 2
+if s == a say(1)
+elif s == b say(2)
+elif s == c say(3)
+elif s == d or s == f say(4)
+elif s == e say(5)
+elif s == g say(7)
+%s
+end
+"""
+
+SMALL_ELSE = "else say(99)"
+
+LARGE_ELSE = ("else x = s * 3 + 1 y = x * x - s say(x, y) "
+              "if x > 10 say(x - 10) end")
+
+
+def said(code):
+    world = World([Unit(id_, HP=id_) for id_ in range(12)])
+    interpreter = Interpreter(world)
+    for unit in range(12):
+        interpreter.run(code, unit=unit)
+    return world.said, interpreter.counts["int_op"]
+
+
+def lowered(code, reports=None):
+    return compile_script("decisiontree_test", code,
+                          optimizations=["decision-trees"], reports=reports)
+
+
+def test_same_behavior():
+    for else_part in ["", SMALL_ELSE, LARGE_ELSE]:
+        yield check_same_behavior, CHAIN % else_part
+
+
+def check_same_behavior(code):
+    reports = {}
+    expected, linear = said(compile_script("decisiontree_test", code))
+    result, tree = said(lowered(code, reports))
+    eq_(reports["decision-trees"], {"chains": 1, "lowered": 1})
+    eq_(result, expected)
+    assert tree < linear
+
+
+def test_else_parts():
+    # A small else block is copied into the leaves, a large one runs once.
+    eq_(lowered(CHAIN % SMALL_ELSE).count("say 99;"), 2)
+    code = lowered(CHAIN % LARGE_ELSE)
+    eq_((code.count("__default0 = 1;"), code.count("say x, y;")), (2, 1))
+
+
+def test_subject_evaluated_once():
+    code = lowered(CHAIN.replace("s = unit->HP - 2\n", "")
+                        .replace("s ==", "unit->HP ==") % "")
+    eq_(code.count("unit->HP"), 1)
+    assert "int __case0 = (unit->HP);" in code
+
+
+def test_left_alone():
+    for code in [
+            # Too short to gain anything.
+            "s = unit->HP if s == 1 say(1) elif s == 2 say(2) end",
+            # Conditions that may hold together.
+            "s = unit->HP if s == 1 say(1) elif s == 2 say(2) "
+            "elif s == 3 say(3) elif s == 1 say(4) end",
+            "s = unit->HP if s == 1 say(1) elif s == 2 say(2) "
+            "elif s == 3 say(3) elif s > 3 say(4) end",
+            # Float subject.
+            "s = unit->HP * 1.5 if s == 1 say(1) elif s == 2 say(2) "
+            "elif s == 3 say(3) elif s == 4 say(4) end",
+            ]:
+        yield check_left_alone, code
+
+
+def check_left_alone(code):
+    eq_(lowered(code), compile_script("decisiontree_test", code))
+
+
+def test_profile_weights():
+    # Once the arm taken most often comes first, a tree would take more
+    # comparisons than the chain.
+    reports = {}
+    Compiler(counter_base=100).compile("decisiontree_test", CHAIN % "",
+                                       reports=reports)
+    profile = reports["instrument"]
+    for taken in [[10] * 6, [0, 1000, 0, 0, 0, 0]]:
+        profile["counts"] = dict((str(100 + index), count)
+                                 for index, count in enumerate(taken))
+        reports = {}
+        Compiler(optimizations=["decision-trees"],
+                 profile=Profile.from_json(profile)).compile(
+            "decisiontree_test", CHAIN % "", reports=reports)
+        yield eq_, reports["decision-trees"]["lowered"], int(taken[0] == 10)
@@ -0,0 +1,58 @@
+from nose.tools import eq_
+from redux.incremental import IncrementalParser, split_regions
+from redux.parser import parse
+from redux.test import parser_test
+
+
+SCRIPT = """
+require "examples/example0"
+enum State idle moving = 4 attacking end
+bitfield Flags a : 1 b : 3 end
+x = 1  # comment
+def g(a, b)
+    if a > b
+        while a > 0 a = a - 1 end
+    elif a < b
+        for i = 0, i < 4, i = i + 1 say(i) end
+    end
+    return a
+end
+y = g(x, 2)
+def h() `PERFORM RAND;` end
+say(y)
+"""
+
+
+def test_same_result_as_full_parse():
+    for _, code, _ in parser_test.test_valid_parses():
+        yield check_same_result, code
+    yield check_same_result, SCRIPT
+
+
+def check_same_result(code):
+    eq_(IncrementalParser().parse(code), parse(code))
+
+
+def test_regions():
+    code = 'a = 1 def f() if a end end b = 2 c = 3 require "x" enum E a end'
+    regions = [code[start:end] for start, end in split_regions(code)]
+    eq_(regions, ["a = 1 ", "def f() if a end end", " b = 2 c = 3 ",
+                  'require "x"', "enum E a end"])
+
+
+def test_only_changed_regions_reparsed():
+    parser = IncrementalParser()
+    parser.parse(SCRIPT)
+    eq_(parser.parsed_regions, 8)
+
+    edited = SCRIPT.replace("return a", "return b")
+    eq_(parser.parse(edited), parse(edited))
+    eq_(parser.parsed_regions, 9)
+    eq_(parser.reused_regions, 7)
+
+
+def test_syntax_errors_reported_as_full_parse():
+    parser = IncrementalParser()
+    for code in ["def f() x = end", "x = 1 def f() end end", "def f()",
+                 "x = \ndef f() end"]:
+        eq_(parser.parse(code), parse(code))
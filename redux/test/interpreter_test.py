@@ -0,0 +1,130 @@
+from nose.tools import eq_, raises
+from redux.codegenerator import annotate_script, compile_script
+from redux.costmodel import CostModel, estimate_cost
+from redux.interpreter import (Interpreter, InterpreterError,
+                               RescriptSyntaxError, Unit, World,
+                               parse_rescript, run_script)
+
+
+def world():
+    return World([Unit(1, HP=50, XPosition=3), Unit(2, HP=20, YPosition=4),
+                  Unit(3, HP=90)], classes={7: {"MaxHP": 100}})
+
+
+def said(code, optimizations=()):
+    world_ = world()
+    run_script(compile_script("interpreter_test", code,
+                              optimizations=optimizations), world_, unit=1)
+    return world_.said
+
+
+def test_expressions():
+    for code, expected in [
+            ("say(1 + 2 * 3, 7 / -2, -7 % 2, 2 ** 10, 1.5 * 2)",
+             (7, -3, -1, 1024, 3.0)),
+            ("say(1 << 31, 5 & 3, 5 | 3, 5 ^ 3, ~5, not 0, 1 and 0, 0 or 2)",
+             (-2147483648, 1, 7, 6, -6, 1, 0, 1)),
+            ("say(max(3, 4), min(1.5, 2), int(2.7), float(2), sqrt(4.0))",
+             (4, 1.5, 2, 2.0, 2.0)),
+            ("say(unit->HP, object(2)->HP, dist_sq(unit, object(2)), "
+             "7::MaxHP)", (50, 20, 25.0, 100)),
+            ]:
+        yield check_said, code, [expected]
+
+
+def check_said(code, expected):
+    eq_(said(code), expected)
+
+
+def test_statements():
+    eq_(said("bitfield B x : 12 y : 12 end v = B(3) v.y = 2 say(v.x, v.y) "
+             "s = 0 for i = 0, i < 4, i = i + 1 s = s + i end "
+             "while 1 if s > 20 break end s = s * 2 end "
+             "if s > 30 say(s) elif s > 20 say(-s) end"),
+        [(3, 2), (-24,)])
+
+
+def test_for_declarations_outlive_loop():
+    eq_(said("for i = 0, i < 3, i = i + 1 end say(i)"), [(3,)])
+    eq_(said("s = 0 for i = 0, i < 3, i = i + 1 s = s + i end say(s, i)",
+             ["unroll-loops"]), [(3, 3)])
+    eq_(run_script("{ for(int i = 0; i < 2; i = i + 1) {} say i; }",
+                   world()).world.said, [(2,)])
+
+
+def test_queries():
+    eq_(said("a = (QUERY UNIT MAX query->HP WHERE query->HP < 60) "
+             "say(a, a->HP, (QUERY VALUE SUM query->HP), "
+             "(QUERY VALUE AVE query->HP WHERE query->HP > 100))"),
+        [(1, 50, 160, 0)])
+
+
+def test_performs():
+    world_ = world()
+    run_script(compile_script("interpreter_test",
+                              "AF[2] = unit->HP say(AF[2] + AF[3])"), world_,
+               unit=1)
+    eq_((world_.said, world_.achronal_fields), ([(50,)], {2: 50}))
+    run_script("{ target = unit; PERFORM MOVE 5; }", world_, unit=3)
+    eq_(world_.performed, [("MOVE", 3, 5)])
+
+
+def test_counts():
+    code = compile_script("interpreter_test", "x = unit->HP * 2 "
+                          "for i = 0, i < 3, i = i + 1 x = x + sqrt(2.0) end "
+                          "say(x)")
+    interpreter = Interpreter(world())
+    interpreter.run(code, unit=1)
+    eq_(dict(interpreter.counts),
+        {"assignment": 8, "chronal_access": 1, "int_op": 8, "float_op": 3,
+         "intrinsic:sqrt": 3, "loop_iteration": 3, "statement": 1,
+         "intrinsic:say": 1})
+
+
+def test_straight_line_code_costs_its_estimate():
+    code = "x = unit->HP * 2 say(x, sqrt(x) + 1.5)"
+    interpreter = run_script(compile_script("interpreter_test", code),
+                             world(), unit=1)
+    estimate = estimate_cost("interpreter_test",
+                             annotate_script("interpreter_test", code))
+    eq_(interpreter.counts, estimate.total.counts)
+
+
+def test_optimizations_keep_behavior_and_save_operations():
+    code = ("def f(x) return x * x end "
+            "s = 0 for i = 0, i < 4, i = i + 1 s = s + f(i) end say(s)")
+    results = []
+    for optimizations in [(), ("const-prop", "unroll-loops", "copy-prop")]:
+        interpreter = Interpreter(world())
+        world_ = interpreter.world
+        interpreter.run(compile_script("interpreter_test", code,
+                                       optimizations=optimizations))
+        results.append((world_.said, interpreter.cost.total(CostModel())))
+    eq_(results[0][0], [(14,)])
+    eq_(results[1][0], [(14,)])
+    assert results[1][1] < results[0][1]
+
+
+def test_program_reused():
+    program = parse_rescript("say unit->HP;")
+    world_ = world()
+    interpreter = Interpreter(world_)
+    interpreter.run(program, unit=1)
+    interpreter.run(program, unit=2)
+    eq_(world_.said, [(50,), (20,)])
+    eq_(interpreter.counts["statement"], 2)
+
+
+@raises(InterpreterError)
+def test_operation_limit():
+    run_script("while(1){}", max_operations=1000)
+
+
+@raises(InterpreterError)
+def test_division_by_zero():
+    run_script("int a = 0; say 1 / a;")
+
+
+@raises(RescriptSyntaxError)
+def test_syntax_error():
+    parse_rescript("int a = (1 + ;")
@@ -0,0 +1,64 @@
+from nose.tools import eq_, raises, with_setup
+from redux import intrinsics
+from redux.codegenerator import compile_script
+from redux.costmodel import CostModel
+from redux.intrinsics import get_intrinsic, register_perform
+from redux.typeannotate import IncompatibleTypeError, InvalidExpressionError
+
+
+def c(code, optimizations=()):
+    return compile_script("intrinsics_test", code, optimizations=optimizations)
+
+
+def test_metadata():
+    eq_(get_intrinsic("say").pure, False)
+    eq_(get_intrinsic("sqrt").pure, True)
+    eq_(get_intrinsic("sqrt").total, False)
+    eq_(get_intrinsic("dist_sq").total, True)
+    eq_(get_intrinsic("atan2").arity, 2)
+    eq_(CostModel().intrinsic_cost("dist_sq"), get_intrinsic("dist_sq").cost)
+
+
+@raises(InvalidExpressionError)
+def test_arity_checked():
+    c("say(sqrt(1, 2))")
+
+
+@raises(InvalidExpressionError)
+def test_say_needs_arguments():
+    c("say()")
+
+
+@raises(IncompatibleTypeError)
+def test_argument_types_checked():
+    c("say(dist_sq(unit, 1))")
+
+
+def test_constant_evaluation():
+    eq_(c("a = max(3, 7) b = int(2.7) c = min(a, -4) d = max(1, 2.0) "
+          "say(a, b, c, d)", ["const-prop"]),
+        "{\nint a = 7;\nint b = 2;\nint c = (-4);\nfloat d = (1|>2.0);\n"
+        "say 7, 2, (-4), d;\n}\n")
+
+
+def unregister_performs():
+    for name in ["build", "stop", "speed"]:
+        intrinsics._registry.pop(name, None)
+
+
+@with_setup(teardown=unregister_performs)
+def test_register_perform():
+    register_perform("build", "BUILD", argument="kind", target="where",
+                     return_type=intrinsics.int_)
+    register_perform("stop", "STOP")
+    eq_(c("x = build(unit, 3) stop() say(x)"),
+        "{\nint __retval0 = 0;\n{\nobject where = unit;\nint kind = 3;\n"
+        "target = where; PERFORM BUILD kind;__retval0 = perf_ret;\n}\n"
+        "int x = __retval0;\n{\nPERFORM STOP;}\nsay x;\n}\n")
+
+
+@raises(ValueError)
+@with_setup(teardown=unregister_performs)
+def test_names_registered_once():
+    register_perform("speed", "SPEED")
+    register_perform("speed", "SPEED")
@@ -0,0 +1,66 @@
+from nose.tools import eq_
+from redux.codegenerator import compile_script
+
+
+def c(code, reports=None):
+    return compile_script("localpacking_test", code,
+                          optimizations=["pack-locals"], reports=reports)
+
+
+def test_packing():
+    code_examples = [
+        ("a = 1 b = 2 say(a + b)",
+         "int __packed0 = 0;\n__packed0[0, 1] = 1;\n__packed0[1, 2] = 2;\n"
+         "say (__packed0[0, 1]+__packed0[1, 2]);"),
+        ("enum E x y z end a = z b = 1 > 2",
+         "int __packed0 = 0;\n__packed0[0, 2] = 2;\n__packed0[2, 1] = (1>2);"),
+        ("a = 0 for i = 0, i < 8, i = i + 1 a = i & 3 end",
+         "int __packed0 = 0;\n__packed0[0, 2] = 0;\n"
+         "for(__packed0[2, 4] = 0; (__packed0[2, 4]<8); "
+         "__packed0[2, 4] = (__packed0[2, 4]+1)){\n"
+         "__packed0[0, 2] = (__packed0[2, 4]&3);\n}"),
+        # A single small variable is not worth a pack.
+        ("a = 1 b = unit->HP say(a, b)",
+         "int a = 1;\nint b = (unit->HP);\nsay a, b;"),
+        # Negative or unbounded values.
+        ("a = 1 b = 1 - 2 c = 0 while c < 3 c = c + 1 end say(a, b, c)",
+         "int a = 1;\nint b = (1-2);\nint c = 0;\n"
+         "while(1){\nif((c<3)){\nc = (c+1);\n}\nelse {\nbreak;\n}\n}\n"
+         "say a, b, c;"),
+        # Names used by code literals must stay variables.
+        ("a = 1 b = 1 `say a;` say(b)", "int a = 1;\nint b = 1;\nsay a;say b;"),
+        ("a = 1.0 b = 1 say(a, b)", "float a = 1.0;\nint b = 1;\nsay a, b;"),
+    ]
+
+    for redux_code, rescript_code in code_examples:
+        yield check_packing, redux_code, "{\n" + rescript_code + "\n}\n"
+
+
+def check_packing(redux_code, rescript_code):
+    eq_(c(redux_code), rescript_code)
+
+
+def test_shadowed_variables_packed_separately():
+    code = "def f(x) a = x return a end a = 1 say(f(2), a)"
+    reports = {}
+    c(code, reports)
+    names = [member["name"] for pack in reports["pack-locals"]["packs"]
+             for member in pack["members"]]
+    eq_(sorted(names), ["__retval0", "a", "a", "x"])
+
+
+def test_report():
+    reports = {}
+    c("a = 1 b = 3 c = unit->HP say(a, b, c)", reports)
+    eq_(reports["pack-locals"], {
+        "variables": 3, "packed": 2, "saved": 1,
+        "packs": [{"name": "__packed0", "members": [
+            {"name": "a", "offset": 0, "length": 1, "range": [1, 1]},
+            {"name": "b", "offset": 1, "length": 2, "range": [3, 3]},
+        ]}],
+    })
+
+
+def test_not_run_by_default():
+    eq_(compile_script("localpacking_test", "a = 1 b = 2"),
+        "{\nint a = 1;\nint b = 2;\n}\n")
@@ -0,0 +1,43 @@
+from nose.tools import eq_
+from os import environ
+from os.path import abspath, dirname, exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+import subprocess
+import sys
+
+
+ROOT = dirname(dirname(dirname(abspath(__file__))))
+
+
+def run_compiler(*args):
+    env = dict(environ, PYTHONPATH=ROOT)
+    process = subprocess.run([sys.executable, "-m", "redux"] + list(args),
+                             env=env, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    # Only the last line, as PLY reports on regenerating its tables.
+    return process.returncode, process.stderr.splitlines()[-1]
+
+
+def test_errors_in_required_files_reported():
+    directory = mkdtemp()
+    try:
+        for name, code in [("a", 'require "DIR/b" say(1)'),
+                           ("b", 'require "DIR/a"'),
+                           ("c", "x = 1"),
+                           ("d", 'require "DIR/c"')]:
+            with open(join(directory, name + ".redux"), "wt") as file_:
+                file_.write(code.replace("DIR", directory))
+
+        path = join(directory, "a.redux")
+        eq_(run_compiler(path, join(directory, "a.rescript")),
+            (1, "%s: require cycle: %s -> %s/b.redux -> %s" %
+             (path, path, directory, path)))
+        assert not exists(join(directory, "a.rescript"))
+
+        eq_(run_compiler(join(directory, "d.redux"),
+                         join(directory, "d.rescript")),
+            (1, "%s/d.redux: %s/c.redux: code outside of definitions in a "
+             "required file" % (directory, directory)))
+    finally:
+        rmtree(directory)
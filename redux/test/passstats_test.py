@@ -0,0 +1,56 @@
+from nose.tools import eq_
+from os import listdir
+from shutil import rmtree
+from tempfile import mkdtemp
+from redux.codegenerator import compile_script
+from redux.passstats import PassStats
+
+
+STAGES = ["parse", "RequireInliner", "BodyParser", "AssignmentScopeAnalyzer",
+          "CallGraph", "TypeAnnotator", "AttributeSynthesizer", "CallInliner",
+          "EnumInliner", "StringInliner", "CodeGenerator"]
+
+CODE = 'def f(x) return x * 2 end enum E a b end say(f(b))'
+
+
+def test_every_stage_measured():
+    stats = PassStats()
+    eq_(compile_script("passstats_test", CODE, stats=stats),
+        compile_script("passstats_test", CODE))
+    eq_([stage.name for stage in stats.stages], STAGES)
+
+    parse, require_inliner = stats.stages[:2]
+    eq_(parse.nodes_before, None)
+    eq_(parse.nodes_after, require_inliner.nodes_before)
+    eq_(stats.stages[-1].nodes_after, None)
+    assert all(stage.peak_memory is None for stage in stats.stages)
+
+
+def test_mem_stats():
+    stats = PassStats(mem_stats=True)
+    compile_script("passstats_test", CODE, stats=stats)
+    assert all(stage.peak_memory >= 0 for stage in stats.stages)
+    eq_(stats.total().peak_memory,
+        max(stage.peak_memory for stage in stats.stages))
+    assert "peak KiB" in stats.format()
+
+
+def test_json_report():
+    stats = PassStats()
+    compile_script("passstats_test", CODE, stats=stats)
+    report = stats.to_json()
+    eq_([stage["name"] for stage in report["stages"]], STAGES)
+    eq_(report["total"]["wall_time"],
+        sum(stage["wall_time"] for stage in report["stages"]))
+
+
+def test_profile_dumps():
+    directory = mkdtemp()
+    try:
+        stats = PassStats(profile_dir=directory, prefix="dir/script.redux")
+        compile_script("passstats_test", CODE, stats=stats)
+        eq_(sorted(listdir(directory)),
+            ["script.redux.%02d-%s.prof" % (index, name)
+             for index, name in enumerate(STAGES)])
+    finally:
+        rmtree(directory)
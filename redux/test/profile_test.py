@@ -0,0 +1,81 @@
+from nose.tools import eq_, raises
+from redux.codegenerator import Compiler
+from redux.interpreter import Interpreter, Unit, World
+from redux.profile import Profile, ProfileError
+
+
+CODE = """enum State idle moving attacking end
+def act(s)
+  r = 0
+  if s == idle r = 1 elif s == moving r = 2 elif s == attacking r = 3
+  else r = 4 end
+  return r
+end
+a = QUERY UNIT WHERE query->HP > 0 and query->IsAlly == 0 and
+    dist_sq(query, unit) < 100.0
+say(act(unit->Energy), a)
+"""
+
+
+def world():
+    return World([Unit(id_, HP=10 * id_, Energy=2 - (id_ % 4 == 0),
+                       XPosition=id_, IsAlly=id_ % 2)
+                  for id_ in range(1, 9)])
+
+
+def run(code, units=range(1, 9)):
+    world_ = world()
+    interpreter = Interpreter(world_)
+    for unit in units:
+        interpreter.run(code, unit=unit)
+    return world_
+
+
+def take_profile(code):
+    reports = {}
+    world_ = run(Compiler(counter_base=100).compile("profile_test", code,
+                                                     reports=reports))
+    profile = reports["instrument"]
+    profile["counts"] = dict((str(field), count) for field, count in
+                             world_.achronal_fields.items())
+    return profile
+
+
+def test_counters():
+    profile = take_profile(CODE)
+    eq_([(site["kind"], site["counters"]) for site in profile["sites"]],
+        [("branch", [100, 101, 102]), ("where", [103, 104, 105, 106])])
+    eq_(profile["fields"], 7)
+    eq_(profile["counts"], {"102": 6, "101": 2, "103": 64, "104": 64,
+                            "105": 32, "106": 64})
+
+
+def test_profile_use():
+    reports = {}
+    code = Compiler(profile=Profile.from_json(take_profile(CODE))).compile(
+        "profile_test", CODE, reports=reports)
+    eq_(reports["profile-use"],
+        {"sites": 2, "profiled": 2, "chains": 1, "reordered": 1})
+    # Most often taken first, least likely to hold first.
+    assert code.index("(s==2)") < code.index("(s==1)") < code.index("(s==0)")
+    assert "WHERE [((((query->IsAlly)==0)&&((query->HP)>0))" in code
+    eq_(run(code).said, run(Compiler().compile("profile_test", CODE)).said)
+
+
+def test_overlapping_and_changed_chains_kept():
+    code = ("x = unit->HP if x > 5 say(1) elif x == 3 say(2) end "
+            "if x == 1 say(3) elif x == 2 say(4) end")
+    profile = take_profile(code)
+    for count in profile["counts"]:
+        profile["counts"][count] = 10 * int(count)
+    reports = {}
+    changed = code.replace("x == 1", "x == 4")
+    Compiler(profile=Profile.from_json(profile)).compile(
+        "profile_test", changed, reports=reports)
+    eq_(reports["profile-use"],
+        {"sites": 2, "profiled": 1, "chains": 0, "reordered": 0})
+
+
+@raises(ProfileError)
+def test_invalid_profile():
+    Profile.from_json({"sites": []})
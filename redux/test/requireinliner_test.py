@@ -0,0 +1,113 @@
+from nose.tools import eq_, raises
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from redux.ast import LazyBlock
+from redux.codegenerator import compile_script
+from redux.parser import parse, parse_body, parse_library
+from redux.requireinliner import (BodyParser, LibraryCache, RequireCycleError,
+                                  RequireInliner, RequireSyntaxError)
+
+
+def c(code):
+    return compile_script("requireinliner_test", code)
+
+
+def setup_libraries(libraries):
+    directory = mkdtemp()
+    for name, code in libraries.items():
+        with open(join(directory, name + ".redux"), "wt") as file_:
+            file_.write(code.replace("DIR", directory))
+    return directory
+
+
+def test_repeated_require_included_once():
+    eq_(c('require "examples/example0" require "examples/example0" say(f(2))'),
+        c('require "examples/example0" say(f(2))'))
+
+
+def test_diamond_require_included_once():
+    directory = setup_libraries({
+        "base": "def f(x) return x end",
+        "left": 'require "DIR/base" def g(x) return f(x) end',
+        "right": 'require "DIR/base" def h(x) return f(x) end',
+    })
+    try:
+        code = 'require "%s/left" require "%s/right" say(g(1) + h(2))'
+        c(code % (directory, directory))
+    finally:
+        rmtree(directory)
+
+
+def test_require_cycle_reports_chain():
+    directory = setup_libraries({
+        "a": 'require "DIR/b"',
+        "b": 'require "DIR/a"',
+    })
+    try:
+        c('require "%s/a"' % directory)
+    except RequireCycleError as e:
+        eq_(str(e), "require cycle: %s/a.redux -> %s/b.redux -> %s/a.redux" %
+            (directory, directory, directory))
+    else:
+        assert False, "cycle not detected"
+    finally:
+        rmtree(directory)
+
+
+@raises(RequireCycleError)
+def test_self_require():
+    directory = setup_libraries({"a": 'require "DIR/a"'})
+    try:
+        c('require "%s/a"' % directory)
+    finally:
+        rmtree(directory)
+
+
+LIBRARY = """# helpers
+def f(x)
+  if x > 0
+    x = g(x)
+  end
+  return x
+end
+enum E a b end
+def g(x) while x > 9 x = x / 2 end return x end
+def unused() y = ( end
+"""
+
+
+def test_lazy_bodies_parse_like_eager_ones():
+    ast_, errors = parse_library(LIBRARY.replace("y = (", "y = 1"))
+    eq_(errors, [])
+    eager = parse(LIBRARY.replace("y = (", "y = 1"))[0]
+    for lazy_def, eager_def in zip(ast_.statements, eager.statements):
+        if isinstance(getattr(lazy_def, "block", None), LazyBlock):
+            lazy_def.block = parse_body(lazy_def.block)[0]
+    eq_(ast_, eager)
+
+
+def test_only_called_bodies_parsed():
+    directory = setup_libraries({"lib": LIBRARY})
+    try:
+        ast_ = parse('require "%s/lib" say(f(1))' % directory)[0]
+        library_cache = LibraryCache()
+        RequireInliner(library_cache).visit(ast_)
+        body_parser = BodyParser(library_cache)
+        body_parser.visit(ast_)
+        eq_(body_parser.parsed, 2)
+        eq_([isinstance(stmt.block, LazyBlock) for stmt in ast_.statements
+             if hasattr(stmt, "block")], [False, False, True])
+        eq_(c('require "%s/lib" say(f(b))' % directory),
+            c(LIBRARY.replace("y = (", "y = 1") + "say(f(b))"))
+    finally:
+        rmtree(directory)
+
+
+@raises(RequireSyntaxError)
+def test_errors_in_called_bodies_reported():
+    directory = setup_libraries({"lib": LIBRARY})
+    try:
+        c('require "%s/lib" unused()' % directory)
+    finally:
+        rmtree(directory)
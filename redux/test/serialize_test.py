@@ -0,0 +1,64 @@
+from nose.tools import eq_, raises
+from os import stat
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from redux.files import UMASK
+from redux.parser import parse
+from redux.serialize import (dump_library, load_library, decode,
+                             write_library, InvalidLibraryError)
+from redux.test import parser_test
+from redux.types import int_
+
+
+def round_trip(code):
+    ast_, errors = parse(code)
+    eq_(errors, [])
+    encoded, exports = load_library(dump_library(ast_, code), code)
+    return ast_, decode(encoded), exports
+
+
+def test_round_trip():
+    for _, code, _ in parser_test.test_valid_parses():
+        yield check_round_trip, code
+
+
+def check_round_trip(code):
+    ast_, loaded, _ = round_trip(code)
+    eq_(loaded, ast_)
+
+
+def test_types_keep_identity():
+    _, loaded, _ = round_trip("enum E a b end a = 1")
+    assert loaded.statements[0].members[1][1].type is int_
+    assert loaded.statements[1].expression.type is int_
+
+
+def test_exports():
+    _, _, exports = round_trip("def f() end enum E a b end bitfield B x : 1 end")
+    eq_(exports, {"functions": ["f"], "enums": {"E": ["a", "b"]},
+                  "bitfields": ["B"]})
+
+
+@raises(InvalidLibraryError)
+def test_out_of_date_library_rejected():
+    ast_, _ = parse("def f() end")
+    load_library(dump_library(ast_, "def f() end"), "def g() end")
+
+
+@raises(InvalidLibraryError)
+def test_garbage_rejected():
+    load_library(b"REDUX", "")
+
+
+def test_written_library_gets_default_mode():
+    directory = mkdtemp()
+    try:
+        path = join(directory, "lib", "a.reduxc")
+        ast_, _ = parse("def f() end")
+        write_library(path, ast_, "def f() end")
+        eq_(stat(path).st_mode & 0o777, 0o666 & ~UMASK)
+        with open(path, "rb") as file_:
+            load_library(file_.read(), "def f() end")
+    finally:
+        rmtree(directory)
@@ -0,0 +1,166 @@
+from nose.tools import eq_
+from os import makedirs, utime
+from os.path import dirname, getmtime, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from redux.server import CompileServer, Watch
+import asyncio
+import json
+
+
+FILES = {"lib/base.redux": "def f(x) return x + 1 end",
+         "src/a.redux": 'require "DIR/lib/base" say(f(1))',
+         "src/b.redux": 'require "DIR/lib/base" say(f(2))',
+         "src/c.redux": "say(3)"}
+
+
+def setup_files():
+    directory = mkdtemp()
+    for name, code in FILES.items():
+        write(join(directory, name), code.replace("DIR", directory))
+    return directory
+
+
+def write(path, code):
+    makedirs(dirname(path), exist_ok=True)
+    with open(path, "wt") as file_:
+        file_.write(code)
+
+
+def read(path):
+    with open(path, "rt") as file_:
+        return file_.read()
+
+
+def touch_later(path):
+    # Modification times can be coarser than the time between two writes.
+    mtime = getmtime(path) + 10
+    utime(path, (mtime, mtime))
+
+
+def test_compile():
+    directory = setup_files()
+    try:
+        server = CompileServer(join(directory, "sock"))
+        input_path = join(directory, "src", "c.redux")
+        result = server.handle_request({"input": input_path})
+        eq_((result["ok"], result["code"], result["dependencies"]),
+            (True, "{\nsay 3;\n}\n", []))
+
+        # Unsaved contents, written to an output file.
+        output_path = join(directory, "out", "c.rescript")
+        result = server.handle_request({"command": "compile",
+                                        "input": input_path,
+                                        "output": output_path,
+                                        "code": "say(4)"})
+        eq_((result["ok"], result["output"]), (True, output_path))
+        eq_(read(output_path), "{\nsay 4;\n}\n")
+    finally:
+        rmtree(directory)
+
+
+def test_cache_hits():
+    directory = setup_files()
+    try:
+        server = CompileServer(join(directory, "sock"))
+        for name in ["a", "b", "a"]:
+            result = server.compile(join(directory, "src", name + ".redux"))
+            eq_(result["dependencies"], [join(directory, "lib", "base")
+                                         + ".redux"])
+        stats = server.handle_request({"command": "stats"})
+        # The library is parsed once, and the unchanged script is not
+        # parsed again.
+        eq_((stats["compilations"], stats["libraries"]), (3, 1))
+        assert stats["reused_regions"] > 0
+    finally:
+        rmtree(directory)
+
+
+def test_recompiles_after_change():
+    directory = setup_files()
+    try:
+        library_path = join(directory, "lib", "base.redux")
+        server = CompileServer(join(directory, "sock"), [
+            Watch(join(directory, "src"), join(directory, "out"))])
+        stale = server.scan()
+        eq_([path[len(directory):] for _, path in stale],
+            ["/src/a.redux", "/src/b.redux", "/src/c.redux"])
+        server.rebuild(stale)
+        eq_(server.scan(), [])
+
+        write(library_path, "def f(x) return x + 2 end")
+        touch_later(library_path)
+        stale = server.scan()
+        eq_([path[len(directory):] for _, path in stale],
+            ["/src/a.redux", "/src/b.redux"])
+        server.rebuild(stale)
+        assert "(x+2)" in read(join(directory, "out", "b.rescript"))
+        eq_(server.stats()["libraries"], 1)
+
+        # Any change of modification time counts, even to an earlier one.
+        write(join(directory, "src", "c.redux"), "say(5)")
+        utime(join(directory, "src", "c.redux"), (0, 0))
+        stale = server.scan()
+        eq_([path[len(directory):] for _, path in stale], ["/src/c.redux"])
+        server.rebuild(stale)
+        eq_(read(join(directory, "out", "c.rescript")), "{\nsay 5;\n}\n")
+        eq_(server.scan(), [])
+    finally:
+        rmtree(directory)
+
+
+def test_errors():
+    directory = setup_files()
+    try:
+        server = CompileServer(join(directory, "sock"))
+        write(join(directory, "src", "bad.redux"), "say(")
+        for request in [{"input": join(directory, "src", "missing.redux")},
+                        {"input": join(directory, "src", "bad.redux")},
+                        {"input": "x.redux", "code": "say(undefined)"}]:
+            result = server.handle_request(request)
+            eq_((result["ok"], result["input"]), (False, request["input"]))
+            assert result["error"]
+        eq_(server.handle_request({"command": "compile"}),
+            {"ok": False, "error": "no input given"})
+        eq_(server.handle_request({"command": "link"}),
+            {"ok": False, "error": "unknown command 'link'"})
+        eq_(server.stats()["compilations"], 3)
+    finally:
+        rmtree(directory)
+
+
+class Writer(object):
+    def __init__(self):
+        super(Writer, self).__init__()
+        self.data = b""
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_error_replies():
+    async def converse(server, lines):
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"".join(line + b"\n" for line in lines))
+        reader.feed_eof()
+        writer = Writer()
+        await server.handle_client(reader, writer)
+        return writer
+
+    server = CompileServer()
+    writer = asyncio.run(converse(server, [
+        b"{not json", json.dumps({"input": "x.redux",
+                                  "code": "say(1)"}).encode("utf8")]))
+    replies = [json.loads(line) for line in writer.data.splitlines()]
+    eq_(len(replies), 2)
+    assert replies[0]["error"].startswith("invalid request: ")
+    eq_((replies[0]["ok"], replies[1]["ok"], replies[1]["code"]),
+        (False, True, "{\nsay 1;\n}\n"))
+    assert writer.closed
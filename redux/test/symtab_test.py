@@ -0,0 +1,47 @@
+from copy import deepcopy
+from nose.tools import eq_, raises
+from redux.symtab import Scope
+
+
+def test_inner_bindings_shadow_outer_ones():
+    outer = Scope(bindings={"a": 1, "b": 2})
+    inner = outer.child()
+    inner.define("a", 3)
+    eq_(inner.lookup("a"), 3)
+    eq_(inner.lookup("b"), 2)
+    eq_(outer.lookup("a"), 1)
+
+
+@raises(KeyError)
+def test_undefined_name():
+    Scope().child().lookup("a")
+
+
+def test_snapshot_sees_later_definitions():
+    scope = Scope()
+    snapshot = scope
+    scope.define("f", 1)
+    eq_(snapshot.child().lookup("f"), 1)
+
+
+def test_remembered_lookup_invalidated_by_shadowing():
+    outer = Scope(bindings={"a": 1})
+    middle = outer.child()
+    inner = middle.child()
+    eq_(inner.lookup("a"), 1)
+    middle.define("a", 2)
+    eq_(inner.lookup("a"), 2)
+    inner.define("a", 3)
+    eq_(inner.lookup("a"), 3)
+    eq_(middle.lookup("a"), 2)
+
+
+def test_contains():
+    scope = Scope(bindings={"a": 1}).child()
+    assert "a" in scope
+    assert "b" not in scope
+
+
+def test_deepcopy_shares_scope():
+    scope = Scope(bindings={"a": [1]})
+    eq_(deepcopy({"scope": scope})["scope"] is scope, True)
@@ -0,0 +1,58 @@
+from nose.tools import eq_
+from redux.codegenerator import annotate_script, compile_script, generate_code
+from redux.unrolling import format_report
+
+
+def c(code, reports=None):
+    return compile_script("unrolling_test", code,
+                          optimizations=["unroll-loops"], reports=reports)
+
+
+def test_unrolling():
+    code_examples = [
+        ("for i = 0, i < 3, i = i + 1 say(i * 2) end",
+         "{\nsay 0;\n}\n{\nsay 2;\n}\n{\nsay 4;\n}"),
+        ("for i = 4, i > 0, i = i - 3 say(i) end say(i)",
+         "{\nsay 4;\n}\n{\nsay 1;\n}\nint i = (-2);\nsay (-2);"),
+        ("for i = 0, i < 0, i = i + 1 say(i) end", ""),
+        # The body gets folded again once i is known.
+        ("s = 0 for i = 0, i < 3, i = i + 1 s = s + i end say(s)",
+         "int s = 0;\n{\ns = 0;\n}\n{\ns = 1;\n}\n{\ns = 3;\n}\nsay 3;"),
+        # Breaks leave the copies that remain.
+        ("for i = 0, i < 2, i = i + 1 if unit->HP > i break end say(i) end",
+         "while(1){\n{\nif(((unit->HP)>0)){\nbreak;\n}\nsay 0;\n}\n"
+         "{\nif(((unit->HP)>1)){\nbreak;\n}\nsay 1;\n}\nbreak;\n}"),
+        ("for i = 0, i < 2, i = i + 1 if unit->HP > i break end end say(i)",
+         "int i = 0;\nwhile(1){\ni = 0;\n{\nif(((unit->HP)>0)){\nbreak;\n}\n}"
+         "\ni = 1;\n{\nif(((unit->HP)>1)){\nbreak;\n}\n}\ni = 2;\nbreak;\n}\n"
+         "say i;"),
+        # Breaks of inner loops do not count.
+        ("for i = 0, i < 2, i = i + 1 while 1 break end end",
+         "{\nwhile(1){\n{\nbreak;\n}\n}\n}\n{\nwhile(1){\n{\nbreak;\n}\n}\n}"),
+        # Loops changing their induction variable are left alone.
+        ("for i = 0, i < 2, i = i + 1 i = i + 1 end",
+         "for(int i = 0; (i<2); i = (i+1)){\ni = (i+1);\n}"),
+        ("for i = 0, i < 2, i = i + 1 `say i;` end",
+         "for(int i = 0; (i<2); i = (i+1)){\nsay i;}"),
+    ]
+
+    for redux_code, rescript_code in code_examples:
+        yield check_unrolling, redux_code, "{\n%s\n}\n" % rescript_code
+
+
+def check_unrolling(redux_code, rescript_code):
+    eq_(c(redux_code), rescript_code.replace("{\n\n}", "{\n}"))
+
+
+def test_size_limit():
+    code = "for i = 0, i < 8, i = i + 1 say(i) end"
+    ast_ = annotate_script("unrolling_test", code)
+    eq_(generate_code(ast_, optimizations=["unroll-loops"], unroll_limit=10),
+        "{\nfor(int i = 0; (i<8); i = (i+1)){\nsay i;\n}\n}\n")
+    reports = {}
+    c(code, reports)
+    eq_(reports["unroll-loops"], {"unrolled": 1, "copies": 8})
+    eq_(format_report(reports["unroll-loops"]),
+        "1 loop(s) unrolled into 8 copies of their bodies\n")
+    eq_(format_report({"unrolled": 1, "copies": 1}),
+        "1 loop(s) unrolled into 1 copy of their bodies\n")
@@ -1,9 +1,11 @@
 from collections import namedtuple
 from copy import deepcopy
 from redux.ast import FunctionDefinition, BitfieldDefinition, ReturnStmt, Assignment, VarRef
-from redux.intrinsics import get_intrinsic_functions, IntrinsicFunction, GetAchronalField, SetAchronalField
+from redux.attributes import attributes
+from redux.intrinsics import get_intrinsic_functions, get_perform_intrinsics, IntrinsicFunction
+from redux.symtab import Scope
 from redux.types import is_numeric, common_arithmetic_type, check_assignable, int_, float_, str_, object_
-from redux.visitor import ASTTransformer, ASTVisitor
+from redux.visitor import ASTTransformer
 from redux.objectattributes import CHRONAL_ATTRS, ACHRONAL_ATTRS
 
 
@@ -49,36 +51,51 @@ INITIAL_SCOPE = {
 }
 
 
+def get_initial_bindings(intrinsics=None):
+    """Returns the names visible at the start of every script.
+
+    Nothing in the result is modified by type annotation, so it can be built
+    once and shared by any number of TypeAnnotators, in several threads.
+    """
+    if intrinsics is None:
+        intrinsics = dict(get_intrinsic_functions())
+
+    bindings = dict(INITIAL_SCOPE)
+    for name, intrinsic in intrinsics.items():
+        bindings[name] = ScopeEntry(IntrinsicFunction, True, intrinsic)
+    for name, perform in get_perform_intrinsics():
+        function_def = perform.definition()
+        # See the initial scope of whichever script calls them.
+        function_def.visible_scope = None
+        bindings[name] = ScopeEntry(FunctionDefinition, True, function_def)
+    return bindings
+
+
 class TypeAnnotator(ASTTransformer):
     """Annotates AST with type information."""
-    def __init__(self):
+    def __init__(self, initial_bindings=None):
         super(TypeAnnotator, self).__init__()
-        self.scopes = [INITIAL_SCOPE.copy()]
-
-        for name, intrinsic in get_intrinsic_functions():
-            self.scopes[0][name] = ScopeEntry(IntrinsicFunction, True, intrinsic)
-
-        self.visit(GetAchronalField())
-        self.visit(SetAchronalField())
+        if initial_bindings is None:
+            initial_bindings = get_initial_bindings()
+        self.scope = self.initial_scope = Scope(bindings=initial_bindings)
 
     def push_scope(self):
-        self.scopes.append({})
+        self.scope = self.scope.child()
 
     def pop_scope(self):
-        self.scopes.pop()
+        self.scope = self.scope.parent
 
     def get_scope_entry(self, name):
-        for scope in reversed(self.scopes):
-            if name in scope:
-                return scope[name]
-
-        raise UndefinedVariableError(name)
+        try:
+            return self.scope.lookup(name)
+        except KeyError:
+            raise UndefinedVariableError(name)
 
     def add_scope_entry(self, scope, var_name, expr):
         if expr.type == str_:
-            scope[var_name] = ScopeEntry(expr.type, True, expr)
+            scope.define(var_name, ScopeEntry(expr.type, True, expr))
         else:
-            scope[var_name] = ScopeEntry(expr.type, False, None)
+            scope.define(var_name, ScopeEntry(expr.type, False, None))
 
     def get_variable_type(self, name):
         return self.get_scope_entry(name).type
@@ -108,19 +125,19 @@ class TypeAnnotator(ASTTransformer):
         return bitfield_assignment
 
     def visit_FunctionDefinition(self, function_def):
-        function_def.visible_scope = self.scopes[:]
-        self.scopes[-1][function_def.name] = ScopeEntry(
-            FunctionDefinition, True, function_def)
+        function_def.visible_scope = self.scope
+        self.scope.define(function_def.name, ScopeEntry(
+            FunctionDefinition, True, function_def))
         return function_def
 
     def visit_BitfieldDefinition(self, bitfield_def):
-        self.scopes[-1][bitfield_def.name] = ScopeEntry(
-            BitfieldDefinition, True, bitfield_def)
+        self.scope.define(bitfield_def.name, ScopeEntry(
+            BitfieldDefinition, True, bitfield_def))
         return bitfield_def
 
     def visit_EnumDefinition(self, enum_def):
         for name, value in enum_def.members:
-            self.scopes[-1][name] = ScopeEntry(int_, True, value)
+            self.scope.define(name, ScopeEntry(int_, True, value))
         return enum_def
 
     def visit_FunctionCall(self, func_call):
@@ -130,6 +147,7 @@ class TypeAnnotator(ASTTransformer):
 
         if entry.type is not FunctionDefinition:
             if entry.type is IntrinsicFunction:
+                self.check_arguments(entry.value, func_call.arguments)
                 func_call.type = entry.value.type(func_call.arguments)
                 func_call.func_def = entry.value
             elif entry.type is BitfieldDefinition:
@@ -147,22 +165,41 @@ class TypeAnnotator(ASTTransformer):
                 "expected %d arguments, got %d" % (len(func_def.arguments),
                                                    len(func_call.arguments)))
 
+        visible_scope = func_def.visible_scope
+        if visible_scope is None:
+            visible_scope = self.initial_scope
+        arguments_scope = visible_scope.child()
         for name, value in zip(func_def.arguments, func_call.arguments):
-            self.add_scope_entry(func_def.visible_scope[-1], name, value)
+            self.add_scope_entry(arguments_scope, name, value)
 
         stmts = func_def.block.statements
-        real_scopes = self.scopes
-        self.scopes = func_def.visible_scope
+        real_scope = self.scope
+        self.scope = arguments_scope
         func_def.block = self.visit(func_def.block)
         if stmts and isinstance(stmts[-1], ReturnStmt):
             func_call.type = stmts[-1].expression.type
         else:
             func_call.type = None
-        self.scopes = real_scopes
+        self.scope = real_scope
 
         func_call.func_def = func_def
         return func_call
 
+    def check_arguments(self, intrinsic, arguments):
+        if intrinsic.arity is None:
+            if not arguments:
+                raise InvalidExpressionError(
+                    "expected arguments to %s" % intrinsic.name)
+        elif len(arguments) != intrinsic.arity:
+            raise InvalidExpressionError(
+                "expected %d arguments, got %d" % (intrinsic.arity,
+                                                   len(arguments)))
+
+        if intrinsic.argument_types is not None:
+            for argument, types in zip(arguments, intrinsic.argument_types):
+                if argument.type not in types:
+                    raise IncompatibleTypeError(argument.type, types)
+
     def visit_Assignment(self, assignment):
         assignment.expression = self.visit(assignment.expression)
         expr_type = assignment.expression.type
@@ -183,7 +220,7 @@ class TypeAnnotator(ASTTransformer):
             if immutable is True:
                 raise ImmutabilityViolationError(var_name)
         except KeyError:
-            self.add_scope_entry(self.scopes[-1], var_name,
+            self.add_scope_entry(self.scope, var_name,
                 assignment.expression)
 
         assignment.variable = self.visit(assignment.variable)
@@ -285,15 +322,11 @@ class TypeAnnotator(ASTTransformer):
         return class_access
 
     def visit_Query(self, query):
-        class BestMoveEliminator(ASTVisitor):
-            def visit_Query(self, node):
-                if node.type == "BESTMOVE":
-                    raise InvalidExpressionError("QUERY BESTMOVE as subquery")
+        self.generic_visit(query)
 
         for child in query.children():
-            BestMoveEliminator().visit(child)
-
-        self.generic_visit(query)
+            if attributes(child).bestmove_query:
+                raise InvalidExpressionError("QUERY BESTMOVE as subquery")
 
         if not is_numeric(query.op_expr.type):
             raise InvalidExpressionError(
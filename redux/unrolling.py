@@ -0,0 +1,160 @@
+"""Unrolling of for loops with a constant trip count.
+
+A loop `for i = C, i < C, i = i + C` whose induction variable the body does
+not assign (see loops.induction_values) is replaced by one copy of its body
+per iteration, with the induction variable replaced by its value in that
+iteration, as long as the copies stay under a size limit counted in AST
+nodes. A variable declared by the loop gets the value it has after the loop
+once the copies have run, if anything after the loop uses it.
+
+If the body breaks out of the loop, the copies are wrapped in
+`while(1) { ... break; }` so the breaks still skip the remaining copies, and
+the induction variable is assigned before every copy when it is used after
+the loop.
+"""
+from copy import deepcopy
+from redux.ast import (Assignment, Block, BreakStmt, Constant, ForStmt,
+                       IfStmt, WhileStmt)
+from redux.constprop import make_constant
+from redux.copyprop import find_name
+from redux.loops import induction_values, induction_variable
+from redux.passstats import count_nodes
+from redux.types import int_
+from redux.visitor import ASTTransformer, ASTVisitor
+
+
+# Largest number of AST nodes the copies of a loop body may add up to.
+UNROLL_LIMIT = 256
+
+
+class BreakFinder(ASTVisitor):
+    """Finds break statements leaving the statement visited."""
+    def __init__(self):
+        super(BreakFinder, self).__init__()
+        self.found = False
+
+    def visit_BreakStmt(self, break_stmt):
+        self.found = True
+
+    def visit_WhileStmt(self, while_stmt):
+        pass
+
+    def visit_ForStmt(self, for_stmt):
+        pass
+
+
+def breaks_out(block):
+    finder = BreakFinder()
+    finder.generic_visit(block)
+    return finder.found
+
+
+class InductionSubstituter(ASTTransformer):
+    def __init__(self, name, value):
+        super(InductionSubstituter, self).__init__()
+        self.name = name
+        self.value = value
+
+    def visit_Assignment(self, assignment):
+        assignment.expression = self.visit(assignment.expression)
+        return assignment
+
+    def visit_BitfieldAssignment(self, assignment):
+        return self.generic_visit(assignment)
+
+    def visit_VarRef(self, var_ref):
+        if var_ref.name == self.name:
+            return make_constant((int_, self.value))
+        return var_ref
+
+
+class LoopUnroller(ASTTransformer):
+    """Unrolls the for loops of a lowered script with constant trip counts."""
+    def __init__(self, limit=UNROLL_LIMIT):
+        super(LoopUnroller, self).__init__()
+        self.limit = limit
+        self.unrolled = 0
+        self.copies = 0
+
+    def visit_Block(self, block):
+        self.unroll(block.statements)
+        return block
+
+    def unroll(self, statements):
+        index = 0
+        while index < len(statements):
+            stmt = statements[index]
+            if type(stmt) is Block:
+                self.unroll(stmt.statements)
+            elif isinstance(stmt, IfStmt):
+                self.unroll(stmt.then_block.statements)
+                if stmt.else_part is not None:
+                    self.unroll(stmt.else_part.statements)
+            elif isinstance(stmt, (WhileStmt, ForStmt)):
+                self.unroll(stmt.block.statements)
+
+            replacement = None
+            if isinstance(stmt, ForStmt):
+                replacement = self.unroll_loop(stmt, statements[index + 1:])
+            if replacement is None:
+                index += 1
+            else:
+                statements[index:index + 1] = replacement
+                index += len(replacement)
+
+    def unroll_loop(self, for_stmt, rest):
+        """Returns the statements replacing a loop, or None to keep it."""
+        values = induction_values(for_stmt, self.limit)
+        if values is None:
+            return None
+        trips = len(values) - 1
+        if trips * count_nodes(for_stmt.block) > self.limit:
+            return None
+
+        name = induction_variable(for_stmt)
+        init = for_stmt.assignment
+        declare = init.declare is True
+        # Variables declared by the loop can only be used in the rest of the
+        # block; others may be used anywhere.
+        uses = find_name(name, rest)
+        needed = not declare or uses.read or uses.assigned
+
+        copies = []
+        for value in values[:-1]:
+            copy = deepcopy(for_stmt.block)
+            InductionSubstituter(name, value).visit(copy)
+            copies.append(copy)
+
+        def assign(value, declare=False):
+            return Assignment(init.variable, make_constant((int_, value)),
+                              declare)
+
+        self.unrolled += 1
+        self.copies += len(copies)
+        if not copies or not breaks_out(for_stmt.block):
+            statements = copies
+            if needed:
+                statements.append(assign(values[-1], declare))
+            return statements
+
+        body = []
+        for value, copy in zip(values, copies):
+            if needed:
+                body.append(assign(value))
+            body.append(copy)
+        if needed:
+            body.append(assign(values[-1]))
+        body.append(BreakStmt())
+        loop = WhileStmt(Constant(1, int_), Block(body))
+        if needed and declare:
+            return [assign(values[0], True), loop]
+        return [loop]
+
+    def report(self):
+        return {"unrolled": self.unrolled, "copies": self.copies}
+
+
+def format_report(report):
+    return "%d loop(s) unrolled into %d cop%s of their bodies\n" % (
+        report["unrolled"], report["copies"],
+        "y" if report["copies"] == 1 else "ies")